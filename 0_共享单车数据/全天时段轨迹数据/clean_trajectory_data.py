@@ -1,95 +1,135 @@
 import pandas as pd
 import numpy as np
 import os
-from datetime import datetime, timedelta
+import shutil
+import tempfile
+from datetime import timedelta
 
 # 设置文件路径
 input_file = 'D:/Desktop/项目论文/全天时段订单趋势分析/全天时段轨迹数据/西安市主城区共享单车轨迹数据（部分截取）.csv'
 output_dir = 'D:/Desktop/项目论文/全天时段订单趋势分析/全天时段轨迹数据'
 
+# 分块读取行数、外部排序分区数（单个分区需能整体读入内存）、轨迹中断阈值
+chunk_size = 2000000
+n_partitions = 32
+max_gap = timedelta(minutes=10)
+
 if not os.path.exists(output_dir):
     os.makedirs(output_dir)
 
+
+def read_chunks(usecols=None):
+    """分块读取原始数据，并修正列名错别字（维度 -> 纬度）；单车编号统一按字符串读取，避免各块推断的类型不一致"""
+    for chunk in pd.read_csv(input_file, usecols=usecols, dtype={'共享单车编号': str}, chunksize=chunk_size):
+        yield chunk.rename(columns={'维度': '纬度'})
+
+
+def flag_interruptions(bike_ids, times):
+    """
+    在已按 (单车, 时间) 排序的数组上标记轨迹中断记录
+
+    与前一条记录属于同一单车且时间差超过 max_gap 的记录视为中断，每辆单车的第一条记录总是保留
+
+    Args:
+        bike_ids (np.ndarray): 共享单车编号
+        times (np.ndarray): 获取时间（datetime64）
+
+    Returns:
+        np.ndarray: 布尔数组，True 表示需要剔除
+    """
+    interrupted = np.zeros(len(times), dtype=bool)
+    same_bike = bike_ids[1:] == bike_ids[:-1]
+    interrupted[1:] = same_bike & (np.diff(times) > np.timedelta64(max_gap))
+    return interrupted
+
+
 print("="*60)
 print("开始清洗共享单车轨迹数据")
 print("="*60)
 
-# 1. 加载数据
-print("\n[1/5] 加载原始数据...")
-df = pd.read_csv(input_file)
-print(f"原始数据行数: {len(df)}")
-print(f"原始数据列名: {list(df.columns)}")
-
-# 2. 修正列名错别字（维度 -> 纬度）
-df = df.rename(columns={'维度': '纬度'})
-print(f"\n修正后列名: {list(df.columns)}")
-
-# 3. 剔除缺失坐标的记录
-print("\n[2/5] 剔除缺失坐标的记录...")
-original_count = len(df)
-df = df.dropna(subset=['经度', '纬度'])
-missing_coords_removed = original_count - len(df)
-print(f"剔除缺失坐标记录数: {missing_coords_removed}")
-print(f"剩余数据行数: {len(df)}")
-
-# 4. 转换时间列格式
-print("\n[3/5] 转换时间格式...")
-df['获取时间'] = pd.to_datetime(df['获取时间'])
-print("时间格式转换完成")
+# 1. 扫描单车编号，按编号范围划分外部排序分区
+print("\n[1/5] 扫描数据并划分排序分区...")
+bike_chunks = [chunk['共享单车编号'].unique() for chunk in read_chunks(usecols=['共享单车编号'])]
+bike_values = np.unique(np.concatenate(bike_chunks))
+n_partitions = max(1, min(n_partitions, len(bike_values)))
+# 每个分区包含编号连续的一段单车，按分区顺序输出即为全局按单车排序
+boundaries = bike_values[np.linspace(0, len(bike_values), n_partitions + 1).astype(int)[1:-1]]
+print(f"单车数量: {len(bike_values)}，排序分区数: {n_partitions}")
+
+# 2. 分块剔除缺失坐标记录、转换时间格式，并写入分区文件
+print("\n[2/5] 剔除缺失坐标的记录并写入排序分区...")
+work_dir = tempfile.mkdtemp(dir=output_dir)
+partition_files = [[] for _ in range(n_partitions)]
+original_count = 0
+missing_coords_removed = 0
+columns = None
+
+for chunk_index, chunk in enumerate(read_chunks()):
+    if columns is None:
+        columns = list(chunk.columns)
+        print(f"原始数据列名: {columns}")
+    original_count += len(chunk)
+    valid_chunk = chunk.dropna(subset=['经度', '纬度'])
+    missing_coords_removed += len(chunk) - len(valid_chunk)
+    valid_chunk = valid_chunk.assign(获取时间=pd.to_datetime(valid_chunk['获取时间']))
+
+    part = np.searchsorted(boundaries, valid_chunk['共享单车编号'].to_numpy(), side='right')
+    for p, part_df in valid_chunk.groupby(part, sort=False):
+        path = os.path.join(work_dir, f'part_{p:03d}_{chunk_index:05d}.pkl')
+        part_df.to_pickle(path)
+        partition_files[p].append(path)
 
-# 5. 按共享单车分组并检查轨迹中断
-print("\n[4/5] 检查并剔除轨迹中断超过10分钟的记录...")
-bike_groups = df.groupby('共享单车编号')
+print(f"原始数据行数: {original_count}")
+print(f"剔除缺失坐标记录数: {missing_coords_removed}")
+print(f"剩余数据行数: {original_count - missing_coords_removed}")
 
-valid_records = []
+# 3. 逐分区按 (单车, 时间) 排序，一次差分标记轨迹中断，流式写出
+print("\n[3/5] 排序并检查轨迹中断超过10分钟的记录...")
+output_file = os.path.join(output_dir, '西安市主城区共享单车轨迹数据_清洗后.csv')
 total_interrupted_removed = 0
-
-for bike_id, group in bike_groups:
-    # 按时间排序
-    group_sorted = group.sort_values('获取时间')
-    
-    # 计算相邻记录的时间差
-    group_sorted['时间差'] = group_sorted['获取时间'].diff()
-    
-    # 标记需要保留的记录
-    # 第一条记录总是保留
-    group_sorted['保留'] = True
-    
-    # 检查后续记录，如果与前一条记录的时间差超过10分钟，则不保留
-    for i in range(1, len(group_sorted)):
-        time_diff = group_sorted.iloc[i]['时间差']
-        if pd.notna(time_diff) and time_diff > timedelta(minutes=10):
-            group_sorted.iloc[i, group_sorted.columns.get_loc('保留')] = False
-            total_interrupted_removed += 1
-    
-    # 只保留标记为True的记录
-    valid_group = group_sorted[group_sorted['保留']].copy()
-    valid_records.append(valid_group)
-
-# 合并所有有效记录
-df_cleaned = pd.concat(valid_records, ignore_index=True)
-
-# 删除辅助列
-df_cleaned = df_cleaned.drop(['时间差', '保留'], axis=1)
+cleaned_count = 0
+header_written = False
+
+try:
+    for p, paths in enumerate(partition_files):
+        if not paths:
+            continue
+        part_df = pd.concat([pd.read_pickle(path) for path in paths], ignore_index=True)
+        part_df = part_df.sort_values(['共享单车编号', '获取时间'], kind='mergesort')
+
+        interrupted = flag_interruptions(part_df['共享单车编号'].to_numpy(),
+                                         part_df['获取时间'].to_numpy())
+        total_interrupted_removed += int(interrupted.sum())
+        valid_part = part_df[~interrupted]
+        cleaned_count += len(valid_part)
+
+        valid_part.to_csv(output_file, index=False, encoding='utf-8-sig',
+                          mode='a' if header_written else 'w', header=not header_written)
+        header_written = True
+        print(f"分区 {p + 1}/{n_partitions} 完成，累计保留 {cleaned_count} 行")
+finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+if not header_written:
+    pd.DataFrame(columns=columns).to_csv(output_file, index=False, encoding='utf-8-sig')
 
 print(f"剔除轨迹中断记录数: {total_interrupted_removed}")
-print(f"清洗后数据行数: {len(df_cleaned)}")
+print(f"清洗后数据行数: {cleaned_count}")
 
-# 6. 保存清洗后的数据
-print("\n[5/5] 保存清洗后的数据...")
-output_file = os.path.join(output_dir, '西安市主城区共享单车轨迹数据_清洗后.csv')
-df_cleaned.to_csv(output_file, index=False, encoding='utf-8-sig')
+# 4. 清洗后的数据已在上一步流式保存
+print("\n[4/5] 保存清洗后的数据...")
 print(f"清洗后的数据已保存到: {output_file}")
 
-# 7. 生成清洗报告
+# 5. 生成清洗报告
+print("\n[5/5] 生成清洗报告...")
 print("\n" + "="*60)
 print("数据清洗完成报告")
 print("="*60)
 print(f"原始数据行数: {original_count}")
 print(f"剔除缺失坐标记录: {missing_coords_removed}")
 print(f"剔除轨迹中断记录: {total_interrupted_removed}")
-print(f"最终保留记录: {len(df_cleaned)}")
-print(f"数据保留率: {(len(df_cleaned)/original_count*100):.2f}%")
+print(f"最终保留记录: {cleaned_count}")
+print(f"数据保留率: {(cleaned_count/original_count*100):.2f}%")
 print("="*60)
 
 # 保存清洗报告
@@ -101,8 +141,8 @@ with open(report_file, 'w', encoding='utf-8') as f:
     f.write(f"原始数据行数: {original_count}\n")
     f.write(f"剔除缺失坐标记录: {missing_coords_removed}\n")
     f.write(f"剔除轨迹中断记录: {total_interrupted_removed}\n")
-    f.write(f"最终保留记录: {len(df_cleaned)}\n")
-    f.write(f"数据保留率: {(len(df_cleaned)/original_count*100):.2f}%\n")
+    f.write(f"最终保留记录: {cleaned_count}\n")
+    f.write(f"数据保留率: {(cleaned_count/original_count*100):.2f}%\n")
     f.write("="*60 + "\n")
 
 print(f"\n清洗报告已保存到: {report_file}")
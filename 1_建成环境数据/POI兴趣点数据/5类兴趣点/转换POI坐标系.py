@@ -1,7 +1,10 @@
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import Point
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', '2_栅格网络数据聚集', '网格内里程汇总'))
+from projection_cache import ProjectionCache
 
 # 设置文件路径（使用原始字符串避免转义问题）
 input_dir = r"D:\Desktop\项目论文\POI兴趣点数据\5类兴趣点"
@@ -12,6 +15,9 @@ print(f"输入目录: {input_dir}")
 
 all_poi_data = []
 
+# 投影结果缓存在源文件旁，重复运行时直接读取
+projection_cache = ProjectionCache()
+
 for poi_type in poi_types:
     file_name = f"{poi_type}_数据.csv"
     file_path = os.path.join(input_dir, file_name)
@@ -41,14 +47,10 @@ for poi_type in poi_types:
                         (poi_df['wgs84_lat'] > 0)]
         print(f"  过滤后有效数据: {len(poi_df)}条")
         
-        # 创建点几何对象
-        geometry = [Point(xy) for xy in zip(poi_df['wgs84_lng'], poi_df['wgs84_lat'])]
-        
-        # 创建GeoDataFrame，设置坐标系为EPSG:4326 (WGS84)
-        gdf = gpd.GeoDataFrame(poi_df, geometry=geometry, crs="EPSG:4326")
-        
-        # 转换坐标系到EPSG:4547
-        gdf = gdf.to_crs("EPSG:4547")
+        # 转换坐标系到EPSG:4547，并创建投影后的点几何
+        x, y = projection_cache.transform(poi_df['wgs84_lng'], poi_df['wgs84_lat'],
+                                          file_path, "EPSG:4326", "EPSG:4547")
+        gdf = gpd.GeoDataFrame(poi_df, geometry=gpd.points_from_xy(x, y), crs="EPSG:4547")
         print(f"  坐标系转换完成，目标坐标系: EPSG:4547")
         
         # 添加POI类型字段
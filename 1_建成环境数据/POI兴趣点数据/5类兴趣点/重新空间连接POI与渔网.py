@@ -1,9 +1,17 @@
 import geopandas as gpd
 import pandas as pd
-from shapely.geometry import Point
+import numpy as np
 import os
+import sys
 import time
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..',
+                             '2_栅格网络数据聚集', '西安市500米渔网'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..',
+                             '2_栅格网络数据聚集', '网格内里程汇总'))
+from hex_grid import grid_index_from_gdf
+from columnar_dataset import POI_SCHEMA, load_table
+
 # 设置文件路径
 fishnet_path = r"D:\Desktop\项目论文\西安市渔网\西安市500米渔网\带编号完整渔网网格.shp"
 
@@ -43,6 +51,11 @@ try:
     if 'grid_id' not in fishnet.columns:
         raise ValueError("渔网数据中缺少grid_id列")
     
+    # 渔网为规则网格（方形或六边形），建立格点索引后POI可直接由坐标换算定位到网格
+    fishnet_index = grid_index_from_gdf(fishnet, id_col='grid_id')
+    print(f"渔网格点索引: {type(fishnet_index).__name__}, 原点({fishnet_index.origin_x:.3f}, "
+          f"{fishnet_index.origin_y:.3f}), {len(fishnet_index.grid_ids)}个网格")
+    
     # 创建结果数据框，包含所有网格的ID
     grid_ids = fishnet['grid_id'].sort_values()
     result_df = pd.DataFrame({'grid_id': grid_ids})
@@ -63,8 +76,8 @@ try:
         print(f"文件路径: {file_path}")
         
         try:
-            # 读取转换后的POI数据
-            poi_data = pd.read_csv(file_path)
+            # 读取转换后的POI数据（存在同名Parquet时直接读取）
+            poi_data = load_table(file_path, POI_SCHEMA)
             print(f"  读取到 {len(poi_data)} 条{poi_type}POI记录")
             
             # 过滤无效坐标
@@ -72,14 +85,11 @@ try:
             valid_count = len(poi_data)
             print(f"  有效记录: {valid_count}")
             
-            # 创建GeoDataFrame
-            geometry = [Point(xy) for xy in zip(poi_data['X_CGC2000'], poi_data['Y_CGC2000'])]
-            poi_gdf = gpd.GeoDataFrame(poi_data, geometry=geometry, crs="EPSG:4547")
-            
-            # 执行空间连接
+            # 按格点索引定位所在网格，不在任何网格内的POI记为空值
             print(f"  执行空间连接...")
             join_start = time.time()
-            joined = gpd.sjoin(poi_gdf, fishnet, how="left", predicate="within")
+            grid_id = fishnet_index.grid_id(poi_data['X_CGC2000'].to_numpy(), poi_data['Y_CGC2000'].to_numpy())
+            joined = poi_data.assign(grid_id=np.where(grid_id >= 0, grid_id, np.nan))
             join_time = time.time() - join_start
             print(f"  空间连接完成，耗时: {join_time:.2f}秒")
             
@@ -88,8 +98,7 @@ try:
             print(f"  匹配到网格的{poi_type}POI数量: {len(poi_counts)}")
             
             # 更新结果数据框
-            for grid_id, count in poi_counts.items():
-                result_df.loc[result_df['grid_id'] == grid_id, f'{poi_type}_count'] = count
+            result_df[f'{poi_type}_count'] = result_df['grid_id'].map(poi_counts).fillna(0).astype(int)
             
             # 统计未匹配到网格的POI数量
             unmatched_count = valid_count - poi_counts.sum()
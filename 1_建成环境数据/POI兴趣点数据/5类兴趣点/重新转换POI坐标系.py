@@ -1,7 +1,10 @@
 import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', '2_栅格网络数据聚集', '网格内里程汇总'))
+from projection_cache import ProjectionCache
+from columnar_dataset import POI_SCHEMA, save_table
 
 # 定义POI类型和文件路径
 poi_types = {
@@ -24,6 +27,9 @@ print("=" * 60)
 total_poi_count = 0
 successfully_converted = 0
 
+# 投影结果缓存在源文件旁，重复运行时直接读取
+projection_cache = ProjectionCache()
+
 # 遍历所有POI类型
 for poi_type, file_path in poi_types.items():
     print(f"\n正在处理: {poi_type}")
@@ -52,23 +58,21 @@ for poi_type, file_path in poi_types.items():
             print(f"  警告: 没有有效的坐标记录")
             continue
         
-        # 创建GeoDataFrame并设置坐标系为WGS84
-        geometry = [Point(xy) for xy in zip(poi_data['wgs84_lng'], poi_data['wgs84_lat'])]
-        gdf = gpd.GeoDataFrame(poi_data, geometry=geometry, crs=input_crs)
-        
         # 转换坐标系到CGC2000 (EPSG:4547)
-        gdf_converted = gdf.to_crs(output_crs)
+        x, y = projection_cache.transform(poi_data['wgs84_lng'], poi_data['wgs84_lat'],
+                                          file_path, input_crs, output_crs)
         
-        # 提取转换后的坐标
-        gdf_converted['X_CGC2000'] = gdf_converted.geometry.x
-        gdf_converted['Y_CGC2000'] = gdf_converted.geometry.y
+        # 添加转换后的坐标
+        gdf_converted = poi_data.copy()
+        gdf_converted['X_CGC2000'] = x
+        gdf_converted['Y_CGC2000'] = y
         
         # 创建输出文件路径
         output_file = file_path.replace('.csv', '_CGC2000.csv')
         
-        # 保存转换后的数据，包含原始坐标和转换后的坐标
+        # 保存转换后的数据，包含原始坐标和转换后的坐标（同名Parquet供空间连接读取，同时导出CSV）
         columns_to_save = poi_data.columns.tolist() + ['X_CGC2000', 'Y_CGC2000']
-        gdf_converted[columns_to_save].to_csv(output_file, index=False, encoding='utf-8-sig')
+        save_table(gdf_converted[columns_to_save], output_file, POI_SCHEMA, export_csv=True)
         
         print(f"  转换完成，保存到: {output_file}")
         successfully_converted += valid_count
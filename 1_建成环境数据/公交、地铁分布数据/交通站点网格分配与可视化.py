@@ -6,6 +6,10 @@ import numpy as np
 import os
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                             '2_栅格网络数据聚集', '西安市500米渔网'))
+from hex_grid import grid_index_from_gdf
+
 # 设置文件路径
 metro_path = "D:\\Desktop\\项目论文\\路网交通设施数据\\西安市主城区交通站点总\\地铁站\\11111.shp"
 bus_path = "D:\\Desktop\\项目论文\\路网交通设施数据\\西安市主城区交通站点总\\公交\\公交站点.shp"
@@ -58,42 +62,30 @@ try:
         grid_metro_stations[grid_id] = []
         grid_bus_stations[grid_id] = []
     
+    # 渔网为规则网格（方形或六边形），建立格点索引后站点可直接由坐标换算定位到网格
+    fishnet_index = grid_index_from_gdf(fishnet_gdf, id_col='grid_id')
+    
+    def assign_stations(stations_gdf, grid_count, grid_stations, default_prefix):
+        """将站点按格点索引分配到网格，累加计数并记录站点名称，返回成功分配的站点数"""
+        grid_ids = fishnet_index.grid_id(stations_gdf.geometry.x.to_numpy(), stations_gdf.geometry.y.to_numpy())
+        if 'name' in stations_gdf.columns:
+            names = stations_gdf['name'].to_numpy()
+        else:
+            names = np.array([f"{default_prefix}_{idx}" for idx in stations_gdf.index], dtype=object)
+        assigned = grid_ids >= 0
+        for grid_id, group in pd.Series(names[assigned]).groupby(grid_ids[assigned], sort=False):
+            grid_count[grid_id] += len(group)
+            grid_stations[grid_id].extend(group.tolist())
+        return int(assigned.sum())
+    
     # 分配地铁站点到网格
     print("分配地铁站点...")
-    assigned_count = 0
-    for idx, station in metro_gdf_transformed.iterrows():
-        if idx % 50 == 0:
-            print(f"处理地铁站点 {idx+1}/{len(metro_gdf_transformed)}")
-        try:
-            # 找到包含当前站点的网格
-            containing_grids = fishnet_gdf[fishnet_gdf.contains(station.geometry)]
-            if not containing_grids.empty:
-                grid_id = containing_grids.iloc[0]['grid_id']
-                grid_metro_count[grid_id] += 1
-                station_name = station.get('name', f"地铁站_{idx}")
-                grid_metro_stations[grid_id].append(station_name)
-                assigned_count += 1
-        except Exception as e:
-            print(f"处理地铁站点 {idx} 时出错: {e}")
+    assigned_count = assign_stations(metro_gdf_transformed, grid_metro_count, grid_metro_stations, "地铁站")
     print(f"地铁站点分配完成，成功分配 {assigned_count} 个站点")
     
     # 分配公交站点到网格
     print("分配公交站点...")
-    assigned_count = 0
-    for idx, station in bus_gdf_transformed.iterrows():
-        if idx % 200 == 0:
-            print(f"处理公交站点 {idx+1}/{len(bus_gdf_transformed)}")
-        try:
-            # 找到包含当前站点的网格
-            containing_grids = fishnet_gdf[fishnet_gdf.contains(station.geometry)]
-            if not containing_grids.empty:
-                grid_id = containing_grids.iloc[0]['grid_id']
-                grid_bus_count[grid_id] += 1
-                station_name = station.get('name', f"公交站_{idx}")
-                grid_bus_stations[grid_id].append(station_name)
-                assigned_count += 1
-        except Exception as e:
-            print(f"处理公交站点 {idx} 时出错: {e}")
+    assigned_count = assign_stations(bus_gdf_transformed, grid_bus_count, grid_bus_stations, "公交站")
     print(f"公交站点分配完成，成功分配 {assigned_count} 个站点")
     
     # 统计分配结果
@@ -1,10 +1,13 @@
 import os
+import sys
+import time
 import geopandas as gpd
-import pandas as pd
 import matplotlib.pyplot as plt
-from shapely.geometry import Point, LineString, MultiLineString
-from shapely.ops import unary_union, linemerge
-import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                             '2_栅格网络数据聚集', '网格内里程汇总'))
+from road_graph import RoadGraph
+from road_intersections import count_by_grid, find_intersections
 
 # 设置中文显示
 plt.rcParams['font.sans-serif'] = ['SimHei']  # 用来正常显示中文标签
@@ -22,24 +25,13 @@ if not os.path.exists(output_dir):
     os.makedirs(output_dir)
     print(f"创建输出目录: {output_dir}")
 
-# 步骤1: 读取路网数据和渔网数据
-print("\n步骤1: 读取路网数据和渔网数据...")
+# 步骤1: 读取渔网数据和路网图
+print("\n步骤1: 读取渔网数据和路网图...")
 
-# 读取路网数据
 if not os.path.exists(road_network_path):
     print(f"错误: 路网文件不存在: {road_network_path}")
     exit(1)
 
-try:
-    roads = gpd.read_file(road_network_path)
-    print(f"路网数据读取成功，共 {len(roads)} 条道路")
-    print(f"路网数据坐标系: {roads.crs}")
-    print(f"路网数据属性字段: {roads.columns.tolist()}")
-    
-except Exception as e:
-    print(f"读取路网数据时出错: {e}")
-    exit(1)
-
 # 读取渔网数据（先查找合适的渔网文件）
 fishnet_files = [f for f in os.listdir(fishnet_dir) if f.endswith('.shp') and ('渔网' in f or '网格' in f)]
 
@@ -70,147 +62,38 @@ except Exception as e:
     print(f"读取渔网数据时出错: {e}")
     exit(1)
 
-# 检查坐标系是否一致
-if roads.crs != fishnet.crs:
-    print("警告: 路网数据和渔网数据坐标系不一致")
-    print(f"路网坐标系: {roads.crs}")
-    print(f"渔网坐标系: {fishnet.crs}")
+# 路网图按渔网坐标系构建并缓存在路网文件旁，路网未修改时直接内存映射加载；
+# 交叉口统计包含全部道路等级（不排除高速公路）
+try:
+    start_time = time.time()
+    road_graph = RoadGraph.load_or_build(road_network_path, target_crs=fishnet.crs, snap_tolerance=0.5,
+                                         excluded_fclasses=())
+    print(f"路网图加载完成: {road_graph.n_nodes} 个节点，{road_graph.adjacency.nnz // 2} 条边，"
+          f"耗时 {time.time() - start_time:.2f} 秒")
     
-    # 转换坐标系（将渔网转换为路网的坐标系）
-    print("正在转换坐标系...")
-    try:
-        fishnet = fishnet.to_crs(roads.crs)
-        print(f"坐标系转换成功，当前渔网坐标系: {fishnet.crs}")
-    except Exception as e:
-        print(f"坐标系转换失败: {e}")
-        exit(1)
-else:
-    print("坐标系一致，无需转换")
+except Exception as e:
+    print(f"读取路网数据时出错: {e}")
+    exit(1)
 
 # 步骤2: 计算道路交叉口
 print("\n步骤2: 计算道路交叉口...")
 
-# 为了提高计算效率，我们分批次处理道路
-# 首先过滤出有效的LineString几何对象
-valid_roads = roads[roads.geometry.geom_type == 'LineString'].copy()
-print(f"有效道路线段数量: {len(valid_roads)}")
-
-# 如果道路数量太多，采用分批次处理策略
-batch_size = 1000
-num_roads = len(valid_roads)
-num_batches = (num_roads + batch_size - 1) // batch_size
-
-intersections = []
-processed_pairs = 0
+# 基于路网图拓扑识别交叉口：度≥3的节点为交叉口；
+# 不共享节点的几何相交只在空间索引候选边对中求交点
+start_time = time.time()
+intersection_gdf = find_intersections(road_graph, crs=fishnet.crs)
+print(f"交叉口计算完成，耗时 {time.time() - start_time:.2f} 秒")
 
-print(f"开始计算道路交叉口，共分 {num_batches} 批次处理")
-
-# 分批次计算交叉口
-for i in range(num_batches):
-    start_idx = i * batch_size
-    end_idx = min((i + 1) * batch_size, num_roads)
-    current_batch = valid_roads.iloc[start_idx:end_idx]
-    
-    print(f"处理批次 {i+1}/{num_batches}: 处理 {len(current_batch)} 条道路")
-    
-    # 计算当前批次与所有道路的交点
-    for idx1, road1 in current_batch.iterrows():
-        for idx2, road2 in valid_roads.iterrows():
-            # 避免重复计算和自相交计算
-            if idx1 >= idx2:
-                continue
-            
-            # 计算两条道路的交点
-                try:
-                    if road1.geometry.intersects(road2.geometry):
-                        intersection = road1.geometry.intersection(road2.geometry)
-                        
-                        # 跳过空几何
-                        if intersection.is_empty:
-                            continue
-                        
-                        # 处理点类型交点
-                        if intersection.geom_type == 'Point':
-                            intersections.append({
-                                'geometry': intersection,
-                                'road1_idx': idx1,
-                                'road2_idx': idx2
-                            })
-                        # 处理多点类型交点
-                        elif intersection.geom_type == 'MultiPoint':
-                            try:
-                                # 对于shapely 1.x，使用geoms属性
-                                for p in intersection.geoms:
-                                    intersections.append({
-                                        'geometry': p,
-                                        'road1_idx': idx1,
-                                        'road2_idx': idx2
-                                    })
-                            except AttributeError:
-                                # 备选方法，处理不同的shapely版本
-                                coords = list(intersection.coords)
-                                for coord in coords:
-                                    intersections.append({
-                                        'geometry': Point(coord),
-                                        'road1_idx': idx1,
-                                        'road2_idx': idx2
-                                    })
-                        # 处理线类型交点（只取端点）
-                        elif intersection.geom_type == 'LineString':
-                            coords = list(intersection.coords)
-                            if len(coords) > 0:
-                                intersections.append({
-                                    'geometry': Point(coords[0]),
-                                    'road1_idx': idx1,
-                                    'road2_idx': idx2
-                                })
-                                intersections.append({
-                                    'geometry': Point(coords[-1]),
-                                    'road1_idx': idx1,
-                                    'road2_idx': idx2
-                                })
-                        # 处理复杂几何类型（如MultiLineString）
-                        elif intersection.geom_type in ['MultiLineString', 'GeometryCollection']:
-                            # 对于复杂类型，跳过以提高效率
-                            pass
-                except Exception as e:
-                    # 捕获并忽略处理单个交点时的错误
-                    if processed_pairs % 100000 == 0:
-                        print(f"处理某些交点时出错: {e}")
-
-                processed_pairs += 1
-            
-            # 进度显示
-            if processed_pairs % 100000 == 0:
-                print(f"已处理 {processed_pairs} 对道路，发现 {len(intersections)} 个交叉口")
-
-# 创建交叉口GeoDataFrame
-intersection_gdf = gpd.GeoDataFrame(intersections, crs=roads.crs)
-print(f"\n交叉口计算完成！")
-print(f"总共处理了 {processed_pairs} 对道路")
-print(f"发现了 {len(intersection_gdf)} 个交叉口点")
-
-# 去重（有些交叉口可能被多次检测到）
 if len(intersection_gdf) > 0:
-    # 添加坐标列用于去重
-    intersection_gdf['x'] = intersection_gdf.geometry.x
-    intersection_gdf['y'] = intersection_gdf.geometry.y
-    
-    # 坐标精度保留到小数点后3位（约1米精度）进行去重
-    intersection_gdf['x_rounded'] = intersection_gdf['x'].round(3)
-    intersection_gdf['y_rounded'] = intersection_gdf['y'].round(3)
-    
-    # 去重
-    intersection_gdf_unique = intersection_gdf.drop_duplicates(subset=['x_rounded', 'y_rounded']).copy()
-    
-    # 删除临时列
-    intersection_gdf_unique.drop(['x_rounded', 'y_rounded'], axis=1, inplace=True)
-    
-    print(f"去重后交叉口数量: {len(intersection_gdf_unique)}")
-    
+    source_counts = intersection_gdf['source'].value_counts()
+    print(f"发现 {len(intersection_gdf)} 个交叉口（拓扑节点 {source_counts.get('node', 0)} 个，"
+          f"几何相交 {source_counts.get('crossing', 0)} 个）")
+    print("交叉口分支数分布:")
+    print(intersection_gdf['degree'].value_counts().sort_index())
+
     # 保存交叉口数据
     intersection_shapefile = os.path.join(output_dir, 'road_intersections.shp')
-    intersection_gdf_unique.to_file(intersection_shapefile)
+    intersection_gdf.to_file(intersection_shapefile)
     print(f"交叉口点数据已保存: {intersection_shapefile}")
 
 else:
@@ -219,3 +102,18 @@ else:
 
 # 步骤2完成
 print("\n步骤2完成: 道路交叉口提取完成")
+
+# 步骤3: 统计网格交叉口数量和密度
+print("\n步骤3: 统计网格交叉口数量和密度...")
+
+grid_intersections = count_by_grid(intersection_gdf['x'].to_numpy(), intersection_gdf['y'].to_numpy(),
+                                   fishnet, id_col='grid_id')
+print(f"有交叉口的网格数: {(grid_intersections['intersection_count'] > 0).sum()} / {len(grid_intersections)}")
+print(f"平均交叉口密度: {grid_intersections['intersection_density'].mean():.2f} 个/km²")
+print(f"最大交叉口密度: {grid_intersections['intersection_density'].max():.2f} 个/km²")
+
+grid_output_path = os.path.join(output_dir, '网格交叉口统计.csv')
+grid_intersections.to_csv(grid_output_path, index=False, encoding='utf-8-sig')
+print(f"网格交叉口统计已保存: {grid_output_path}")
+
+print("\n===== 道路交叉口提取和网格统计完成 =====")
@@ -1,6 +1,10 @@
 import geopandas as gpd
 import pandas as pd
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '2_栅格网络数据聚集', '网格内里程汇总'))
+from projection_cache import ProjectionCache
 
 # 路网数据路径
 road_path = "西安市路网.shp"
@@ -26,8 +30,10 @@ def convert_coordinate_system():
         print(f"\n开始坐标转换...")
         print(f"目标坐标系: EPSG:4547")
         
-        # 转换坐标系统
-        roads_converted = roads.to_crs(epsg=4547)
+        # 转换坐标系统，投影后的顶点缓存在路网文件旁，重复运行时直接读取
+        projected = ProjectionCache().transform_geometries(roads.geometry.values, road_path,
+                                                          roads.crs, "EPSG:4547")
+        roads_converted = roads.set_geometry(projected, crs="EPSG:4547")
         
         print(f"转换后坐标系: {roads_converted.crs}")
         
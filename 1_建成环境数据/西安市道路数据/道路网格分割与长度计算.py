@@ -1,11 +1,15 @@
 import geopandas as gpd
 import pandas as pd
-from shapely.geometry import Polygon
 import numpy as np
 import os
+import sys
 import time
 
-def split_roads_by_grid():
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                             '2_栅格网络数据聚集', '网格内里程汇总'))
+from line_grid_overlay import clip_lines_to_grid
+
+def split_roads_by_grid(num_workers=None):
     # 文件路径
     roads_path = "西安市路网_转换后.shp"
     fishnet_path = "D:\Desktop\项目论文\西安市渔网\西安市500米渔网\带编号完整渔网网格.shp"
@@ -36,17 +40,16 @@ def split_roads_by_grid():
             print("警告: 坐标系不一致，进行转换...")
             roads = roads.to_crs(fishnet.crs)
         
-        # 创建网格ID映射字典
-        grid_id_map = {}
-        for idx, row in fishnet.iterrows():
-            grid_id_map[idx] = row['grid_id']
-        
-        # 使用空间连接将道路分配到网格
-        print("\n进行空间连接，将道路分配到网格...")
-        # 使用intersects进行空间连接
-        roads_with_grid = gpd.sjoin(roads, fishnet, how="inner", predicate="intersects")
-        
-        print(f"空间连接完成: {len(roads_with_grid)} 条道路分配到网格")
+        # 在网格边界处切分道路，统计每条道路在每个网格内的实际长度
+        print("\n在网格边界处切分道路并计算各网格内的道路长度...")
+        clipped = clip_lines_to_grid(roads.geometry.values, fishnet, id_col='grid_id', num_workers=num_workers)
+        roads_with_grid = roads.iloc[clipped['line_index'].to_numpy()].reset_index(drop=True)
+        roads_with_grid['road_length_m'] = roads_with_grid['length_m']
+        roads_with_grid['grid_id'] = clipped['grid_id'].to_numpy()
+        roads_with_grid['length_m'] = clipped['length_m'].to_numpy()
+        roads_with_grid['length_km'] = roads_with_grid['length_m'] / 1000
+
+        print(f"切分完成: {clipped['line_index'].nunique()} 条道路落入网格，共 {len(roads_with_grid)} 个道路-网格片段")
         
         # 计算每个网格内的道路总长度
         print("\n计算每个网格内的道路总长度...")
@@ -55,9 +58,9 @@ def split_roads_by_grid():
         grid_road_length.columns = ['grid_id', 'total_length_m']
         grid_road_length['total_length_km'] = grid_road_length['total_length_m'] / 1000
         
-        # 计算道路密度（km/km²）
-        # 网格面积 = 500m × 500m = 0.25 km²
-        grid_area_km2 = 0.25
+        # 计算道路密度（km/km²），网格面积取自网格几何（500米网格为0.25 km²）
+        grid_area_km2 = grid_road_length['grid_id'].map(
+            pd.Series(fishnet.geometry.area.to_numpy() / 1e6, index=fishnet['grid_id'].to_numpy()))
         grid_road_length['density_km_per_km2'] = grid_road_length['total_length_km'] / grid_area_km2
         
         print(f"计算完成: {len(grid_road_length)} 个网格包含道路")
@@ -65,7 +68,8 @@ def split_roads_by_grid():
         # 统计信息
         print("\n统计信息:")
         print(f"- 总道路数: {len(roads)}")
-        print(f"- 分配到网格的道路数: {len(roads_with_grid)}")
+        print(f"- 分配到网格的道路数: {clipped['line_index'].nunique()}")
+        print(f"- 道路-网格片段数: {len(roads_with_grid)}")
         print(f"- 有道路的网格数: {len(grid_road_length)}")
         print(f"- 道路总长度: {grid_road_length['total_length_km'].sum():.2f} km")
         print(f"- 平均道路密度: {grid_road_length['density_km_per_km2'].mean():.2f} km/km²")
@@ -80,7 +84,9 @@ def split_roads_by_grid():
         # 保存详细的道路-网格分配关系
         detailed_output_path = "道路网格分配详细信息.csv"
         # 只保存需要的字段
-        roads_with_grid_subset = roads_with_grid[['osm_id', 'name', 'fclass', 'grid_id', 'length_m', 'length_km']]
+        # length_m/length_km 为道路在该网格内的长度，road_length_m 为整条道路的长度
+        roads_with_grid_subset = roads_with_grid[['osm_id', 'name', 'fclass', 'grid_id', 'length_m', 'length_km',
+                                                  'road_length_m']]
         roads_with_grid_subset.to_csv(detailed_output_path, index=False, encoding='utf-8-sig')
         print(f"道路网格分配详细信息已保存到: {detailed_output_path}")
         
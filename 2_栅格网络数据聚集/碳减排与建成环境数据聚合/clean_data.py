@@ -1,5 +1,8 @@
-import pandas as pd
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '网格内里程汇总'))
+from grid_feature_store import GridFeatureStore
 
 # 定义输入文件路径
 morning_file = "早高峰_cleaned.csv"
@@ -15,11 +18,13 @@ evening_path = os.path.join(current_dir, evening_file)
 print(f"开始处理数据文件...")
 print(f"工作目录: {current_dir}")
 
-# 读取CSV文件
+# 打开清洗后数据对应的特征库（首次运行时由CSV初始化）
 print(f"正在读取早高峰数据: {morning_file}")
-morning_df = pd.read_csv(morning_path)
+morning_store = GridFeatureStore.from_table(morning_path)
+morning_df = morning_store.read()
 print(f"正在读取晚高峰数据: {evening_file}")
-evening_df = pd.read_csv(evening_path)
+evening_store = GridFeatureStore.from_table(evening_path)
+evening_df = evening_store.read()
 
 # 打印原始数据形状
 print(f"早高峰原始数据形状: {morning_df.shape}")
@@ -42,10 +47,12 @@ if not keep_grid_id:
 else:
     print("将保留grid_id列用于后续分析")
 
-# 删除指定列
+# 删除指定列（只删除特征库中对应列的文件，其余列不变）
 print("\n正在处理数据...")
-morning_cleaned = morning_df.drop(columns=columns_to_drop)
-evening_cleaned = evening_df.drop(columns=columns_to_drop)
+morning_store.drop(columns_to_drop)
+evening_store.drop(columns_to_drop)
+morning_cleaned = morning_store.read().drop(columns=columns_to_drop, errors='ignore')
+evening_cleaned = evening_store.read().drop(columns=columns_to_drop, errors='ignore')
 
 # 打印处理后的数据形状
 print(f"早高峰处理后数据形状: {morning_cleaned.shape}")
@@ -56,10 +63,14 @@ print("\n处理后的早高峰数据列:")
 for i, col in enumerate(morning_cleaned.columns, 1):
     print(f"{i}. {col}")
 
-# 保存处理后的数据（覆盖原文件）
+# 由特征库导出处理后的数据（覆盖原文件）
 print("\n正在保存处理后的数据...")
-morning_cleaned.to_csv(morning_path, index=False, encoding='utf-8-sig')
-evening_cleaned.to_csv(evening_path, index=False, encoding='utf-8-sig')
+if keep_grid_id:
+    morning_store.export(morning_path)
+    evening_store.export(evening_path)
+else:
+    morning_cleaned.to_csv(morning_path, index=False, encoding='utf-8-sig')
+    evening_cleaned.to_csv(evening_path, index=False, encoding='utf-8-sig')
 
 print(f"早高峰数据已保存到: {morning_file}")
 print(f"晚高峰数据已保存到: {evening_file}")
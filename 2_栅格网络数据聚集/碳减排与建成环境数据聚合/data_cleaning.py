@@ -1,5 +1,9 @@
-import pandas as pd
 import numpy as np
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '网格内里程汇总'))
+from grid_feature_store import GridFeatureStore, feature_store_dir
 
 print("="*60)
 print("数据清洗脚本 (修复版本)")
@@ -107,8 +111,9 @@ def clean_data(df, prefix):
 try:
     # 读取数据
     print("正在读取数据...")
-    df_morning = pd.read_csv('早高峰_统一单位.csv')
-    df_evening = pd.read_csv('晚高峰1_统一单位.csv')
+    # 从网格特征库读取原始特征（首次运行时由统一单位表初始化）
+    df_morning = GridFeatureStore.from_table('早高峰_统一单位.csv').read()
+    df_evening = GridFeatureStore.from_table('晚高峰1_统一单位.csv').read()
     
     print(f"原始数据形状 - 早高峰: {df_morning.shape}, 晚高峰: {df_evening.shape}")
     print(f"早高峰字段数量: {len(df_morning.columns)}")
@@ -120,8 +125,10 @@ try:
     
     # 保存清洗后的数据
     print("\n正在保存清洗后的数据...")
-    morning_clean.to_csv('早高峰_cleaned.csv', index=False, encoding='utf-8-sig')
-    evening_clean.to_csv('晚高峰_cleaned.csv', index=False, encoding='utf-8-sig')
+    for clean_df, output_file in [(morning_clean, '早高峰_cleaned.csv'), (evening_clean, '晚高峰_cleaned.csv')]:
+        cleaned_store = GridFeatureStore(feature_store_dir(output_file))
+        cleaned_store.upsert(clean_df, source='data_cleaning.py: 缺失值填充、1%-99%分位截断、z-score标准化', replace=True)
+        cleaned_store.export(output_file)
     
     print("\n" + "="*60)
     print("数据清洗完成并保存！")
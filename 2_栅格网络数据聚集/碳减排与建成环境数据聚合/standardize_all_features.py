@@ -1,5 +1,11 @@
 import pandas as pd
 import numpy as np
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '网格内里程汇总'))
+from columnar_dataset import GRID_FEATURE_SCHEMA, MODEL_INPUT_SCHEMA
+from grid_feature_store import GridFeatureStore, feature_store_dir
 
 # 定义要标准化的文件路径
 morning_file = 'd:/Desktop/项目论文/建模/早高峰_统一单位.csv'
@@ -8,9 +14,9 @@ morning_output = 'd:/Desktop/项目论文/建模/早高峰_标准化.csv'
 evening_output = 'd:/Desktop/项目论文/建模/晚高峰_标准化.csv'
 
 print("开始读取数据文件...")
-# 读取CSV文件
-morning_df = pd.read_csv(morning_file)
-evening_df = pd.read_csv(evening_file)
+# 从网格特征库读取原始特征（首次运行时由统一单位表初始化，各特征生成步骤此后只更新自己的列）
+morning_df = GridFeatureStore.from_table(morning_file, GRID_FEATURE_SCHEMA).read()
+evening_df = GridFeatureStore.from_table(evening_file, GRID_FEATURE_SCHEMA).read()
 
 print(f"早高峰数据形状: {morning_df.shape}")
 print(f"晚高峰数据形状: {evening_df.shape}")
@@ -75,9 +81,13 @@ print("开始对晚高峰数据进行标准化处理...")
 # 对晚高峰数据进行标准化
 evening_standardized, evening_stats_before, evening_stats_after = z_score_standardize(evening_df, feature_columns)
 
-# 保存标准化后的数据
-morning_standardized.to_csv(morning_output, index=False)
-evening_standardized.to_csv(evening_output, index=False)
+# 标准化后的特征写入模型输入特征库，再导出完整表格（同名Parquet供建模读取，同时导出CSV）
+morning_store = GridFeatureStore(feature_store_dir(morning_output), MODEL_INPUT_SCHEMA)
+morning_store.upsert(morning_standardized, source=f'standardize_all_features.py: z-score标准化 {os.path.basename(morning_file)}', replace=True)
+morning_standardized = morning_store.export(morning_output, csv_encoding='utf-8')
+evening_store = GridFeatureStore(feature_store_dir(evening_output), MODEL_INPUT_SCHEMA)
+evening_store.upsert(evening_standardized, source=f'standardize_all_features.py: z-score标准化 {os.path.basename(evening_file)}', replace=True)
+evening_standardized = evening_store.export(evening_output, csv_encoding='utf-8')
 
 print(f"早高峰标准化数据已保存至: {morning_output}")
 print(f"晚高峰标准化数据已保存至: {evening_output}")
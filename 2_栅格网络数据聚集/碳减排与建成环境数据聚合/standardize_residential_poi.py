@@ -1,6 +1,9 @@
-import pandas as pd
 import numpy as np
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '网格内里程汇总'))
+from grid_feature_store import GridFeatureStore
 
 # 定义文件路径
 morning_file = 'd:/Desktop/项目论文/建模/早高峰_cleaned.csv'
@@ -10,7 +13,8 @@ print("开始标准化居住POI数据...")
 
 # 处理早高峰数据
 print(f"读取早高峰数据: {morning_file}")
-morning_df = pd.read_csv(morning_file)
+morning_store = GridFeatureStore.from_table(morning_file)
+morning_df = morning_store.read()
 
 # 检查列是否存在
 if '居住POI数量' not in morning_df.columns:
@@ -27,13 +31,15 @@ morning_df['居住POI数量'] = (residential_poi_morning - mean_poi) / std_poi
 
 print(f"早高峰居住POI数量标准化后 - 最小值: {morning_df['居住POI数量'].min():.4f}, 最大值: {morning_df['居住POI数量'].max():.4f}, 均值: {morning_df['居住POI数量'].mean():.4f}, 标准差: {morning_df['居住POI数量'].std():.4f}")
 
-# 保存标准化后的数据到原文件
-morning_df.to_csv(morning_file, index=False, encoding='utf-8')
+# 只更新特征库中的居住POI数量列，并重新导出原文件
+morning_store.upsert(morning_df, columns=['居住POI数量'], source='standardize_residential_poi.py: z-score标准化')
+morning_store.export(morning_file, csv_encoding='utf-8')
 print(f"早高峰数据已保存到原文件")
 
 # 处理晚高峰数据
 print(f"\n读取晚高峰数据: {evening_file}")
-evening_df = pd.read_csv(evening_file)
+evening_store = GridFeatureStore.from_table(evening_file)
+evening_df = evening_store.read()
 
 # 检查列是否存在
 if '居住POI数量' not in evening_df.columns:
@@ -50,8 +56,9 @@ evening_df['居住POI数量'] = (residential_poi_evening - mean_poi_evening) / s
 
 print(f"晚高峰居住POI数量标准化后 - 最小值: {evening_df['居住POI数量'].min():.4f}, 最大值: {evening_df['居住POI数量'].max():.4f}, 均值: {evening_df['居住POI数量'].mean():.4f}, 标准差: {evening_df['居住POI数量'].std():.4f}")
 
-# 保存标准化后的数据到原文件
-evening_df.to_csv(evening_file, index=False, encoding='utf-8')
+# 只更新特征库中的居住POI数量列，并重新导出原文件
+evening_store.upsert(evening_df, columns=['居住POI数量'], source='standardize_residential_poi.py: z-score标准化')
+evening_store.export(evening_file, csv_encoding='utf-8')
 print(f"晚高峰数据已保存到原文件")
 
 print("\n居住POI数据标准化处理完成！")
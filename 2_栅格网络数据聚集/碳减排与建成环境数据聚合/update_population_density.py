@@ -1,5 +1,10 @@
 import pandas as pd
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '网格内里程汇总'))
+from columnar_dataset import MODEL_INPUT_SCHEMA
+from grid_feature_store import GridFeatureStore
 
 # 设置文件路径
 morning_cleaned_path = 'd:/Desktop/项目论文/建模/早高峰_cleaned.csv'
@@ -15,16 +20,13 @@ def update_population_density(cleaned_path, normalized_path):
     cleaned_df = pd.read_csv(cleaned_path)[['grid_id', '人口密度']]
     print(f"读取了 {len(cleaned_df)} 行cleaned数据")
     
-    # 读取标准化文件
-    normalized_df = pd.read_csv(normalized_path)
-    print(f"读取了 {len(normalized_df)} 行标准化数据")
-    
-    # 创建grid_id到人口密度的映射字典
-    pop_density_map = dict(zip(cleaned_df['grid_id'], cleaned_df['人口密度']))
+    # 打开标准化文件对应的特征库（首次运行时由标准化文件初始化）
+    store = GridFeatureStore.from_table(normalized_path, MODEL_INPUT_SCHEMA)
+    normalized_grid_ids = set(store.read_column(store.columns[0]).index)
+    print(f"特征库中共 {len(normalized_grid_ids)} 个网格")
     
     # 检查grid_id是否匹配
     cleaned_grid_ids = set(cleaned_df['grid_id'])
-    normalized_grid_ids = set(normalized_df['grid_id'])
     
     if cleaned_grid_ids != normalized_grid_ids:
         print("警告: grid_id集合不匹配!")
@@ -37,18 +39,21 @@ def update_population_density(cleaned_path, normalized_path):
     else:
         print("grid_id集合完全匹配")
     
-    # 更新人口密度列
-    normalized_df['人口密度 (千人/km²)'] = normalized_df['grid_id'].map(pop_density_map)
+    # 只更新人口密度列，其余特征列的文件不变；cleaned文件中没有的网格写入NaN
+    density = cleaned_df.set_index('grid_id')['人口密度'].reindex(sorted(normalized_grid_ids))
+    updated = pd.DataFrame({'grid_id': density.index, '人口密度 (千人/km²)': density.to_numpy()})
+    store.upsert(updated, source=f'update_population_density.py: {os.path.basename(cleaned_path)}')
     
     # 检查是否有任何NaN值（表示映射失败）
-    na_count = normalized_df['人口密度 (千人/km²)'].isna().sum()
+    density = store.read_column('人口密度 (千人/km²)').reindex(sorted(normalized_grid_ids))
+    na_count = density.isna().sum()
     if na_count > 0:
         print(f"警告: 有 {na_count} 行人口密度更新失败")
     else:
         print("所有人口密度数据更新成功")
     
-    # 保存更新后的标准化文件
-    normalized_df.to_csv(normalized_path, index=False)
+    # 由特征库导出更新后的标准化文件
+    normalized_df = store.export(normalized_path, csv_encoding='utf-8')
     print(f"已保存更新后的文件: {os.path.basename(normalized_path)}")
     
     # 验证前几行数据
@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+列式数据集工具
+功能：为订单、POI、网格特征和模型输入数据声明列类型（行政区/类别等字符串列使用分类类型，
+精度允许的数值列使用float32，时间列直接保存为时间戳），以Parquet格式保存。读取时只解析需要的列，
+无需像CSV一样每次重新推断类型、解析时间和浮点数；论文表格仍可随时导出为CSV。
+订单数据还可按 (日期, 小时) 分区保存，任意 [开始, 结束) 时间窗口只读取涉及的分区
+"""
+
+import glob
+import os
+import shutil
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+    print("警告: 未安装pyarrow，数据集将以CSV格式保存")
+
+
+class DatasetSchema:
+    """数据集列类型声明"""
+
+    # 声明类型到pandas类型的映射，'datetime' 单独解析
+    PANDAS_DTYPES = {
+        'category': 'category',
+        'string': 'string',
+        'int64': 'int64',
+        'Int32': 'Int32',
+        'float32': 'float32',
+        'float64': 'float64',
+    }
+
+    def __init__(self, name, columns, default_float=None):
+        """
+        初始化数据集模式
+
+        Args:
+            name (str): 数据集名称
+            columns (dict): 列名 -> 类型（'category'、'string'、'int64'、'Int32'、'float32'、
+                'float64'、'datetime'）
+            default_float (str, optional): 未声明的浮点列统一转换的类型，如 'float32'
+        """
+        self.name = name
+        self.columns = dict(columns)
+        self.default_float = default_float
+
+    def csv_dtypes(self, names):
+        """返回读取CSV时可直接指定的类型（时间列除外）"""
+        return {col: self.PANDAS_DTYPES[kind] for col, kind in self.columns.items()
+                if col in names and kind != 'datetime'}
+
+    def apply(self, df):
+        """
+        按声明转换数据类型，数据中不存在的声明列忽略
+
+        Args:
+            df (pd.DataFrame): 数据
+
+        Returns:
+            pd.DataFrame: 转换后的数据
+        """
+        converted = {}
+        for col in df.columns:
+            kind = self.columns.get(col)
+            if kind == 'datetime':
+                if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                    converted[col] = pd.to_datetime(df[col], errors='coerce', format='ISO8601')
+            elif kind in ('Int32', 'int64', 'float32', 'float64') and not pd.api.types.is_numeric_dtype(df[col]):
+                converted[col] = pd.to_numeric(df[col], errors='coerce').astype(self.PANDAS_DTYPES[kind])
+            elif kind is not None:
+                if df[col].dtype != self.PANDAS_DTYPES[kind]:
+                    converted[col] = df[col].astype(self.PANDAS_DTYPES[kind])
+            elif self.default_float and pd.api.types.is_float_dtype(df[col]):
+                if df[col].dtype != self.default_float:
+                    converted[col] = df[col].astype(self.default_float)
+        return df.assign(**converted) if converted else df
+
+
+# 共享单车订单（早晚高峰、全天）
+ORDER_SCHEMA = DatasetSchema('orders', {
+    '序号': 'int64',
+    '共享单车编号': 'category',
+    '订单开始时间': 'datetime',
+    '订单结束时间': 'datetime',
+    '起点经度': 'float64',
+    '起点纬度': 'float64',
+    '终点经度': 'float64',
+    '终点纬度': 'float64',
+    '起点X': 'float64',
+    '起点Y': 'float64',
+    '终点X': 'float64',
+    '终点Y': 'float64',
+    '起点网格ID': 'Int32',
+    '终点网格ID': 'Int32',
+    '行驶里程': 'float32',
+    '订单时长(分钟)': 'float32',
+})
+
+# 五类POI
+POI_SCHEMA = DatasetSchema('poi', {
+    'adName': 'category',
+    '大类': 'category',
+    'poi_type': 'category',
+    'wgs84_lng': 'float64',
+    'wgs84_lat': 'float64',
+    'X_CGC2000': 'float64',
+    'Y_CGC2000': 'float64',
+    'x_4547': 'float64',
+    'y_4547': 'float64',
+    'grid_id': 'Int32',
+})
+
+# 网格特征（碳排放与建成环境），特征列统一为float32
+GRID_FEATURE_SCHEMA = DatasetSchema('grid_features', {
+    'grid_id': 'int64',
+}, default_float='float32')
+
+# 模型输入（标准化后的特征），目标变量保持float64，特征列为float32
+MODEL_INPUT_SCHEMA = DatasetSchema('model_inputs', {
+    'grid_id': 'int64',
+    '碳排放_carbon_emission_kg (kgCO2/KM/d)': 'float64',
+}, default_float='float32')
+
+SCHEMAS = {schema.name: schema for schema in
+           (ORDER_SCHEMA, POI_SCHEMA, GRID_FEATURE_SCHEMA, MODEL_INPUT_SCHEMA)}
+
+
+def get_schema(schema):
+    """
+    按名称或对象获取数据集模式
+
+    Args:
+        schema (str or DatasetSchema): 模式名称（'orders'、'poi'、'grid_features'、'model_inputs'）或模式对象
+
+    Returns:
+        DatasetSchema: 数据集模式
+    """
+    if isinstance(schema, DatasetSchema):
+        return schema
+    if schema not in SCHEMAS:
+        raise ValueError(f"未知的数据集模式: {schema}")
+    return SCHEMAS[schema]
+
+
+def _arrow_table(df):
+    """转换为Arrow表，分类列统一为 int32 索引的字典类型，便于多个文件或行组拼接"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    fields = [pa.field(f.name, pa.dictionary(pa.int32(), f.type.value_type))
+              if pa.types.is_dictionary(f.type) else f for f in table.schema]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+def parquet_path(path):
+    """返回与CSV同名的Parquet文件路径"""
+    return os.path.splitext(path)[0] + '.parquet'
+
+
+def read_csv_typed(path, schema, columns=None, encoding='utf-8-sig', **kwargs):
+    """
+    按模式读取CSV，读取时直接指定列类型
+
+    Args:
+        path (str): CSV文件路径
+        schema (str or DatasetSchema): 数据集模式
+        columns (list, optional): 只读取的列
+        encoding (str): 文件编码，utf-8-sig 同时兼容带BOM和不带BOM的UTF-8文件
+
+    Returns:
+        pd.DataFrame: 数据
+    """
+    schema = get_schema(schema)
+    names = pd.read_csv(path, nrows=0, encoding=encoding).columns
+    if columns is not None:
+        names = [col for col in names if col in columns]
+    df = pd.read_csv(path, usecols=columns, dtype=schema.csv_dtypes(names), encoding=encoding, **kwargs)
+    return schema.apply(df)
+
+
+def load_table(path, schema, columns=None, filters=None):
+    """
+    读取数据表：同名Parquet存在且不早于CSV时读取Parquet，否则按模式读取CSV
+
+    Args:
+        path (str): 数据文件路径（.csv 或 .parquet）
+        schema (str or DatasetSchema): 数据集模式
+        columns (list, optional): 只读取的列
+        filters (list, optional): Parquet行过滤条件，如 [('起点网格ID', '==', 1)]
+
+    Returns:
+        pd.DataFrame: 数据
+    """
+    schema = get_schema(schema)
+    pq_path = path if path.endswith('.parquet') else parquet_path(path)
+    use_parquet = pq is not None and os.path.exists(pq_path) and (
+        pq_path == path or not os.path.exists(path)
+        or os.path.getmtime(pq_path) >= os.path.getmtime(path))
+
+    if use_parquet:
+        df = pq.read_table(pq_path, columns=columns, filters=filters).to_pandas()
+        return schema.apply(df)
+    if filters is not None:
+        raise ValueError("CSV数据不支持行过滤条件，请先转换为Parquet")
+    return read_csv_typed(path, schema, columns)
+
+
+def save_table(df, path, schema, export_csv=False, csv_encoding='utf-8-sig'):
+    """
+    按模式转换类型后保存为Parquet，可同时导出CSV（论文表格使用）
+
+    Args:
+        df (pd.DataFrame): 数据
+        path (str): 输出路径（.csv 或 .parquet），Parquet保存为同名 .parquet 文件
+        schema (str or DatasetSchema): 数据集模式
+        export_csv (bool): 是否同时导出CSV
+        csv_encoding (str): CSV编码
+
+    Returns:
+        pd.DataFrame: 转换类型后的数据
+    """
+    schema = get_schema(schema)
+    df = schema.apply(df)
+    csv_path = os.path.splitext(path)[0] + '.csv'
+    if export_csv or pq is None:
+        df.to_csv(csv_path, index=False, encoding=csv_encoding)
+    if pq is not None:
+        pq.write_table(_arrow_table(df), parquet_path(path))
+    return df
+
+
+def csv_to_parquet(csv_path, schema, chunk_size=1000000, encoding='utf-8-sig'):
+    """
+    分块将大CSV转换为同名Parquet，每块一个行组，内存占用与块大小相关
+
+    Args:
+        csv_path (str): CSV文件路径
+        schema (str or DatasetSchema): 数据集模式
+        chunk_size (int): 每块行数
+        encoding (str): CSV编码
+
+    Returns:
+        str: Parquet文件路径
+    """
+    if pq is None:
+        raise ImportError("CSV转换为Parquet需要安装pyarrow")
+    schema = get_schema(schema)
+    names = pd.read_csv(csv_path, nrows=0, encoding=encoding).columns
+    out_path = parquet_path(csv_path)
+
+    writer = None
+    arrow_schema = None
+    try:
+        reader = pd.read_csv(csv_path, dtype=schema.csv_dtypes(names), encoding=encoding,
+                             chunksize=chunk_size)
+        for chunk in reader:
+            table = _arrow_table(schema.apply(chunk))
+            if arrow_schema is None:
+                arrow_schema = table.schema
+                writer = pq.ParquetWriter(out_path, arrow_schema)
+            writer.write_table(table.cast(arrow_schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    return out_path
+
+
+def _hour_partition(hour):
+    """返回某一小时的分区子目录：date=YYYY-MM-DD/hour=HH"""
+    return os.path.join(f'date={hour:%Y-%m-%d}', f'hour={hour:%H}')
+
+
+def write_hour_partitions(chunks, dataset_dir, time_col='订单开始时间', schema=ORDER_SCHEMA):
+    """
+    将订单数据按 (日期, 小时) 分区保存为Parquet目录，已存在的同名目录整体替换
+
+    目录结构为 <dataset_dir>/date=YYYY-MM-DD/hour=HH/part-NNNNN.parquet，每个数据块在其涉及的
+    每个小时分区中写出一个文件；时间为空的记录无法分区，不写入
+
+    Args:
+        chunks (pd.DataFrame or iterable): 订单数据或数据块迭代器（如 pd.read_csv(..., chunksize=...)）
+        dataset_dir (str): 分区目录
+        time_col (str): 分区依据的时间列
+        schema (str or DatasetSchema): 数据集模式
+
+    Returns:
+        int: 写入的记录数
+    """
+    if pq is None:
+        raise ImportError("按小时分区保存需要安装pyarrow")
+    schema = get_schema(schema)
+    if isinstance(chunks, pd.DataFrame):
+        chunks = [chunks]
+
+    # 先写入临时目录，全部完成后替换，避免中断时留下不完整的分区
+    tmp_dir = dataset_dir.rstrip('/\\') + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    num_written = 0
+    for chunk_index, chunk in enumerate(chunks):
+        chunk = schema.apply(chunk)
+        chunk = chunk[chunk[time_col].notna()]
+        hours = chunk[time_col].dt.floor('h')
+        for hour, part in chunk.groupby(hours.to_numpy(), sort=False):
+            part_dir = os.path.join(tmp_dir, _hour_partition(pd.Timestamp(hour)))
+            os.makedirs(part_dir, exist_ok=True)
+            pq.write_table(_arrow_table(part), os.path.join(part_dir, f'part-{chunk_index:05d}.parquet'))
+        num_written += len(chunk)
+
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+    os.replace(tmp_dir, dataset_dir)
+    return num_written
+
+
+def window_partitions(dataset_dir, start, end):
+    """
+    返回 [start, end) 时间窗口涉及的分区文件
+
+    Args:
+        dataset_dir (str): 分区目录
+        start, end (str or pd.Timestamp): 窗口开始、结束时间
+
+    Returns:
+        list: Parquet文件路径列表
+    """
+    start = pd.Timestamp(start)
+    end = pd.Timestamp(end)
+    files = []
+    for hour in pd.date_range(start.floor('h'), end, freq='h', inclusive='left'):
+        files.extend(sorted(glob.glob(os.path.join(dataset_dir, _hour_partition(hour), '*.parquet'))))
+    return files
+
+
+def load_order_window(dataset_dir, start, end, columns=None, time_col='订单开始时间', schema=ORDER_SCHEMA):
+    """
+    读取 [start, end) 时间窗口内的订单，只打开窗口涉及的小时分区，窗口边界所在分区按时间过滤
+
+    Args:
+        dataset_dir (str): 分区目录
+        start, end (str or pd.Timestamp): 窗口开始、结束时间，如 '2025-08-08 06:30'、'2025-08-08 09:30'
+        columns (list, optional): 只读取的列
+        time_col (str): 窗口过滤依据的时间列（与分区时间列一致）
+        schema (str or DatasetSchema): 数据集模式
+
+    Returns:
+        pd.DataFrame: 窗口内的订单
+    """
+    schema = get_schema(schema)
+    start = pd.Timestamp(start)
+    end = pd.Timestamp(end)
+    files = window_partitions(dataset_dir, start, end)
+    if files:
+        table = pq.read_table(files, columns=columns, partitioning=None,
+                              filters=[(time_col, '>=', start), (time_col, '<', end)])
+    else:
+        # 窗口内没有分区时，按任一分区的列结构返回空表
+        any_files = glob.glob(os.path.join(dataset_dir, 'date=*', 'hour=*', '*.parquet'))
+        if not any_files:
+            return pd.DataFrame(columns=columns)
+        table = pq.read_schema(any_files[0]).empty_table()
+        if columns is not None:
+            table = table.select(columns)
+    return schema.apply(table.to_pandas())
+
+
+def hourly_counts(dataset_dir):
+    """
+    由分区文件元数据统计每小时订单数，不读取任何数据页
+
+    Args:
+        dataset_dir (str): 分区目录
+
+    Returns:
+        pd.Series: 以小时开始时间为索引的订单数
+    """
+    counts = {}
+    for part_dir in sorted(glob.glob(os.path.join(dataset_dir, 'date=*', 'hour=*'))):
+        date = os.path.basename(os.path.dirname(part_dir))[len('date='):]
+        hour = pd.Timestamp(date) + pd.Timedelta(hours=int(os.path.basename(part_dir)[len('hour='):]))
+        counts[hour] = sum(pq.ParquetFile(path).metadata.num_rows
+                           for path in glob.glob(os.path.join(part_dir, '*.parquet')))
+    return pd.Series(counts, dtype='int64', name='订单数量')
@@ -5,6 +5,10 @@
 用于处理不同坐标系之间的转换
 """
 
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import pyproj
 import numpy as np
 from shapely.ops import transform
@@ -13,14 +17,37 @@ from shapely.geometry import Point, LineString
 class CoordinateTransformer:
     """坐标系转换器"""
     
-    def __init__(self):
-        """初始化转换器"""
+    def __init__(self, chunk_size=1000000, max_workers=None):
+        """
+        初始化转换器
+        
+        Args:
+            chunk_size (int): 超过该点数的数组按块拆分，由多个线程并行转换
+            max_workers (int, optional): 并行转换的线程数，默认为CPU核心数
+        """
         # 定义常用坐标系
         self.wgs84 = pyproj.CRS("EPSG:4326")  # WGS84经纬度坐标系
-        
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        # 按 (源坐标系, 目标坐标系) 缓存的转换器
+        self._transformers = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        """序列化时去掉线程锁和转换器缓存（分析器会被传给工作进程），反序列化后重建"""
+        state = self.__dict__.copy()
+        del state['_lock']
+        del state['_transformers']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._transformers = {}
+        self._lock = threading.Lock()
+
     def get_transformer(self, source_crs, target_crs):
         """
-        获取坐标转换器
+        获取坐标转换器，同一坐标系对只创建一次
         
         Args:
             source_crs: 源坐标系
@@ -29,7 +56,13 @@ class CoordinateTransformer:
         Returns:
             pyproj.Transformer: 坐标转换器
         """
-        return pyproj.Transformer.from_crs(source_crs, target_crs, always_xy=True)
+        key = (pyproj.CRS.from_user_input(source_crs), pyproj.CRS.from_user_input(target_crs))
+        with self._lock:
+            transformer = self._transformers.get(key)
+            if transformer is None:
+                transformer = pyproj.Transformer.from_crs(key[0], key[1], always_xy=True)
+                self._transformers[key] = transformer
+        return transformer
     
     def transform_point(self, transformer, point):
         """
@@ -60,23 +93,78 @@ class CoordinateTransformer:
     
     def batch_transform_coordinates(self, transformer, lons, lats):
         """
-        批量转换坐标对
+        批量转换坐标对，整个数组一次转换；数组很大时按块拆分到多个线程
         
         Args:
             transformer: 坐标转换器
-            lons: 经度列表
-            lats: 纬度列表
+            lons: 经度数组
+            lats: 纬度数组
             
         Returns:
-            tuple: (转换后的x列表, 转换后的y列表)
+            tuple: (转换后的x数组, 转换后的y数组)
         """
-        xs, ys = [], []
-        for lon, lat in zip(lons, lats):
-            x, y = self.transform_coordinates(transformer, lon, lat)
-            xs.append(x)
-            ys.append(y)
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        xs = np.empty_like(lons)
+        ys = np.empty_like(lats)
+        
+        def transform_chunk(chunk):
+            xs[chunk], ys[chunk] = transformer.transform(lons[chunk], lats[chunk])
+        
+        self._run_chunks(len(lons), transform_chunk)
         return xs, ys
     
+    def lonlat_to_grid_ids(self, lons, lats, fishnet_index, target_crs="EPSG:4547", return_xy=False):
+        """
+        将WGS84经纬度投影到渔网坐标系并直接定位所在网格
+        
+        投影与格点整除在同一块数据上连续完成，数组很大时按块拆分到多个线程
+        
+        Args:
+            lons: 经度数组
+            lats: 纬度数组
+            fishnet_index (FishnetIndex or HexGridIndex): 网格索引（西安市500米渔网/fishnet_index.py、hex_grid.py）
+            target_crs: 渔网坐标系，默认EPSG:4547
+            return_xy (bool): 是否同时返回投影坐标
+            
+        Returns:
+            np.ndarray: 网格ID数组，不在任何网格内时为 -1；
+                return_xy为True时返回 (x数组, y数组, 网格ID数组)
+        """
+        transformer = self.get_transformer(self.wgs84, target_crs)
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        xs = np.empty_like(lons)
+        ys = np.empty_like(lats)
+        grid_ids = np.empty(len(lons), dtype=fishnet_index.grid_ids.dtype)
+        
+        def locate_chunk(chunk):
+            xs[chunk], ys[chunk] = transformer.transform(lons[chunk], lats[chunk])
+            grid_ids[chunk] = fishnet_index.grid_id(xs[chunk], ys[chunk])
+        
+        self._run_chunks(len(lons), locate_chunk)
+        if return_xy:
+            return xs, ys, grid_ids
+        return grid_ids
+    
+    def _run_chunks(self, n, func):
+        """
+        按chunk_size将 [0, n) 拆分为切片执行func，多于一块且有多个线程时使用线程池并行
+        
+        Args:
+            n (int): 数组长度
+            func (callable): 接受一个切片的处理函数
+        """
+        chunks = [slice(start, min(start + self.chunk_size, n)) for start in range(0, n, self.chunk_size)]
+        workers = self.max_workers or os.cpu_count() or 1
+        if len(chunks) <= 1 or workers == 1:
+            for chunk in chunks:
+                func(chunk)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # list() 触发结果收集，使线程中的异常在此抛出
+            list(executor.map(func, chunks))
+    
     def create_transformed_points_gdf(self, df, lon_col, lat_col, crs):
         """
         从DataFrame创建转换后的点GeoDataFrame
@@ -93,7 +181,7 @@ class CoordinateTransformer:
         import geopandas as gpd
         
         # 创建点几何
-        points = [Point(lon, lat) for lon, lat in zip(df[lon_col], df[lat_col])]
+        points = gpd.points_from_xy(df[lon_col], df[lat_col])
         
         # 创建GeoDataFrame
         gdf = gpd.GeoDataFrame(df, geometry=points, crs=self.wgs84)
@@ -114,12 +202,10 @@ class CoordinateTransformer:
         Returns:
             shapely.LineString: 转换后的线段
         """
-        # 转换线段的每个端点
-        transformed_coords = [
-            (transformer.transform(x, y)) 
-            for x, y in line.coords
-        ]
-        return LineString(transformed_coords)
+        # 一次转换线段的所有顶点
+        coords = np.asarray(line.coords)
+        x, y = transformer.transform(coords[:, 0], coords[:, 1])
+        return LineString(np.column_stack([x, y]))
     
     def check_coordinate_range_match(self, coords1, coords2, tolerance=1000):
         """
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+网格特征库
+功能：以 grid_id 为键的列式特征表，每个特征列单独保存为一个小Parquet文件，清单文件（manifest.json）
+记录每列的来源脚本和更新时间，以及导入/导出数据表的文件签名（大小、修改时间）。各特征生成步骤（POI数量、道路密度、人口密度、公交距离、碳排放等）
+只更新（upsert）自己负责的列；重新计算某一个特征时只改写这一列的文件，无需重新合并全部特征文件。
+建模脚本需要的完整表格由 export 按需导出为CSV/Parquet
+"""
+
+import json
+import os
+import uuid
+from datetime import datetime
+
+import pandas as pd
+
+from columnar_dataset import GRID_FEATURE_SCHEMA, get_schema, load_table, parquet_path, save_table
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def feature_store_dir(path):
+    """返回与数据表同名的特征库目录路径"""
+    return os.path.splitext(path)[0] + '.features'
+
+
+def table_signature(path):
+    """
+    返回数据表文件（CSV及同名Parquet）的签名，文件被重新生成或修改后签名随之变化
+
+    Args:
+        path (str): 数据表路径
+
+    Returns:
+        dict: 文件名 -> [大小, 修改时间(ns)]，不存在的文件不记录
+    """
+    signature = {}
+    for file_path in (path, parquet_path(path)):
+        if os.path.exists(file_path):
+            stat = os.stat(file_path)
+            signature[os.path.basename(file_path)] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+class GridFeatureStore:
+    """以 grid_id 为键、按列存储并记录来源的网格特征库"""
+
+    def __init__(self, store_dir, schema=GRID_FEATURE_SCHEMA, id_col='grid_id'):
+        """
+        打开特征库，目录不存在时创建
+
+        Args:
+            store_dir (str): 特征库目录
+            schema (str or DatasetSchema): 特征列的数据集模式
+            id_col (str): 网格ID列名
+        """
+        self.store_dir = store_dir
+        self.schema = get_schema(schema)
+        self.id_col = id_col
+        os.makedirs(store_dir, exist_ok=True)
+        self.manifest_path = os.path.join(store_dir, MANIFEST_NAME)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'columns': {}}
+        self.manifest.setdefault('tables', {})
+
+    @property
+    def columns(self):
+        """特征列名（按首次写入的顺序）"""
+        return list(self.manifest['columns'])
+
+    def __contains__(self, column):
+        return column in self.manifest['columns']
+
+    def _column_path(self, column):
+        """特征列文件路径（以 .csv 结尾，实际读写时优先使用同名Parquet）"""
+        return os.path.join(self.store_dir, self.manifest['columns'][column]['file'] + '.csv')
+
+    def _save_manifest(self):
+        """原子写入清单文件"""
+        tmp_path = f'{self.manifest_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _remove_file(self, stem):
+        """删除特征列文件（Parquet及无pyarrow时保存的CSV）"""
+        for path in (os.path.join(self.store_dir, stem + '.csv'),
+                     parquet_path(os.path.join(self.store_dir, stem + '.csv'))):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def read_column(self, column):
+        """
+        读取单个特征列
+
+        Args:
+            column (str): 特征列名
+
+        Returns:
+            pd.Series: 以 grid_id 为索引的特征值
+        """
+        if column not in self:
+            raise ValueError(f"特征库中没有列: {column}")
+        df = load_table(self._column_path(column), self.schema)
+        return df.set_index(self.id_col)[column]
+
+    def upsert(self, df, columns=None, source='', replace=False):
+        """
+        按 grid_id 更新或插入特征列：df 中出现的网格取新值，其余网格保留原值
+
+        Args:
+            df (pd.DataFrame): 含 grid_id 列的特征数据
+            columns (list, optional): 要写入的列，默认 df 中除 grid_id 外的全部列
+            source (str): 数据来源说明（生成脚本、输入文件等），写入清单
+            replace (bool): 整表替换：写入的列只保留 df 中的网格，并删除特征库中不在写入列之内的列，
+                供一次生成整张表的步骤使用
+
+        Returns:
+            list: 写入的列名
+        """
+        if self.id_col not in df.columns:
+            raise ValueError(f"数据中缺少网格ID列: {self.id_col}")
+        if df[self.id_col].duplicated().any():
+            raise ValueError(f"数据中存在重复的{self.id_col}")
+        if columns is None:
+            columns = [col for col in df.columns if col != self.id_col]
+        indexed = df.set_index(self.id_col)
+        if replace:
+            self.drop([col for col in self.columns if col not in columns])
+
+        for column in columns:
+            values = indexed[column]
+            if column in self:
+                old_stem = self.manifest['columns'][column]['file']
+                if not replace:
+                    existing = self.read_column(column)
+                    kept = existing[~existing.index.isin(values.index)]
+                    values = pd.concat([kept, values]) if len(kept) else values
+            else:
+                old_stem = None
+
+            stem = f'col_{uuid.uuid4().hex[:12]}'
+            table = pd.DataFrame({self.id_col: values.index.to_numpy(), column: values.to_numpy()})
+            save_table(table.sort_values(self.id_col), os.path.join(self.store_dir, stem + '.csv'), self.schema)
+            self.manifest['columns'][column] = {
+                'file': stem,
+                'source': source,
+                'updated_at': datetime.now().isoformat(timespec='seconds'),
+                'rows': int(len(table)),
+            }
+            # 先更新清单再删除旧文件，中途失败时清单仍指向完整的文件
+            self._save_manifest()
+            if old_stem is not None:
+                self._remove_file(old_stem)
+        if replace:
+            # 整表替换后列顺序与写入的数据表一致
+            self.manifest['columns'] = {col: self.manifest['columns'][col] for col in columns}
+            self._save_manifest()
+        return list(columns)
+
+    def drop(self, columns):
+        """
+        删除特征列
+
+        Args:
+            columns (list): 要删除的列名，不存在的列忽略
+        """
+        stems = [self.manifest['columns'].pop(col)['file'] for col in columns if col in self]
+        self._save_manifest()
+        for stem in stems:
+            self._remove_file(stem)
+
+    def read(self, columns=None):
+        """
+        按 grid_id 连接读取特征表
+
+        Args:
+            columns (list, optional): 要读取的列，默认全部列（按清单顺序）
+
+        Returns:
+            pd.DataFrame: grid_id 列加特征列，按 grid_id 升序排列，某列缺少的网格为NaN
+        """
+        columns = self.columns if columns is None else list(columns)
+        if not columns:
+            return pd.DataFrame(columns=[self.id_col])
+        table = pd.concat([self.read_column(col) for col in columns], axis=1, join='outer')
+        table = table.sort_index()
+        table.index.name = self.id_col
+        return table.reset_index()
+
+    def provenance(self):
+        """
+        返回各特征列的来源和更新时间
+
+        Returns:
+            pd.DataFrame: 列名、来源、更新时间、行数
+        """
+        return pd.DataFrame([
+            {'column': col, 'source': meta['source'], 'updated_at': meta['updated_at'], 'rows': meta['rows']}
+            for col, meta in self.manifest['columns'].items()
+        ], columns=['column', 'source', 'updated_at', 'rows'])
+
+    def _table_key(self, path):
+        """清单中记录数据表签名所用的键（绝对路径）"""
+        return os.path.abspath(path)
+
+    def table_changed(self, path):
+        """
+        数据表自上次导入或导出后是否被修改（从未记录过时视为已修改）
+
+        Args:
+            path (str): 数据表路径
+
+        Returns:
+            bool: 是否已修改
+        """
+        return self.manifest['tables'].get(self._table_key(path)) != table_signature(path)
+
+    def _record_table(self, path):
+        """记录数据表当前的文件签名"""
+        self.manifest['tables'][self._table_key(path)] = table_signature(path)
+        self._save_manifest()
+
+    def export(self, path, schema=None, columns=None, export_csv=True, csv_encoding='utf-8-sig'):
+        """
+        导出完整特征表（同名Parquet及CSV），供建模等读取整表的脚本使用，并记录导出文件的签名
+
+        Args:
+            path (str): 输出路径
+            schema (str or DatasetSchema, optional): 导出使用的数据集模式，默认特征库的模式
+            columns (list, optional): 导出的列，默认全部列
+            export_csv (bool): 是否同时导出CSV
+            csv_encoding (str): CSV编码
+
+        Returns:
+            pd.DataFrame: 导出的数据
+        """
+        df = save_table(self.read(columns), path, schema or self.schema,
+                        export_csv=export_csv, csv_encoding=csv_encoding)
+        self._record_table(path)
+        return df
+
+    @classmethod
+    def from_table(cls, path, schema=GRID_FEATURE_SCHEMA, source=None, store_dir=None):
+        """
+        打开数据表对应的特征库；特征库为空，或数据表自上次导入/导出后被重新生成或修改时，
+        用数据表整表替换特征库内容（数据表中已没有的列和网格一并删除）
+
+        Args:
+            path (str): 数据表路径（CSV或Parquet）
+            schema (str or DatasetSchema): 数据集模式
+            source (str, optional): 导入时记录的来源，默认为数据表文件名
+            store_dir (str, optional): 特征库目录，默认为数据表同名的 .features 目录
+
+        Returns:
+            GridFeatureStore: 特征库
+        """
+        store = cls(store_dir or feature_store_dir(path), schema)
+        if not store.columns or store.table_changed(path):
+            if store.columns:
+                print(f"数据表已更新，重新导入特征库: {path}")
+            else:
+                print(f"初始化特征库: {store.store_dir}")
+            store.upsert(load_table(path, schema), source=source or f'导入 {os.path.basename(path)}', replace=True)
+            store._record_table(path)
+        return store
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+网格结果导出
+功能：渔网几何只写入一次（GeoPackage中的 grid 图层），各时段、各指标的结果以仅含属性的表
+写入同一个GeoPackage并另存CSV，通过 grid_id 与几何图层连接。导出任务在后台线程中依次执行，
+分析可以继续进行；导出耗时和磁盘占用不再随 指标数 × 时段数 成倍增长
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import geopandas as gpd
+import pandas as pd
+import pyogrio
+
+BASE_LAYER = 'grid'
+
+
+class GridResultExporter:
+    """渔网几何只写一次、属性表按时段追加的后台导出器"""
+
+    def __init__(self, grid_gdf, output_dir, id_col='id', gpkg_name='grid_trajectory_stats.gpkg'):
+        """
+        初始化导出器
+
+        Args:
+            grid_gdf (gpd.GeoDataFrame): 渔网数据
+            output_dir (str): 输出目录
+            id_col (str): 渔网中的网格ID列名，几何图层中统一命名为 grid_id
+            gpkg_name (str): GeoPackage文件名
+        """
+        self.base = gpd.GeoDataFrame({'grid_id': grid_gdf[id_col].to_numpy()},
+                                     geometry=grid_gdf.geometry.values, crs=grid_gdf.crs)
+        self.output_dir = output_dir
+        self.gpkg_path = os.path.join(output_dir, gpkg_name)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._futures = []
+        self._base_written = False
+
+    def _base_matches(self):
+        """已有GeoPackage的几何图层是否与当前渔网一致（一致时保留文件及其中其他时段的属性表）"""
+        if not os.path.exists(self.gpkg_path):
+            return False
+        try:
+            existing = pyogrio.read_dataframe(self.gpkg_path, layer=BASE_LAYER)
+        except Exception:
+            return False
+        return (len(existing) == len(self.base)
+                and (existing['grid_id'].to_numpy() == self.base['grid_id'].to_numpy()).all()
+                and existing.geometry.geom_equals_exact(self.base.geometry, tolerance=1e-6, align=False).all())
+
+    def _write_base(self):
+        """写入渔网几何图层（每个导出器最多写一次），先写临时文件再替换，避免残留半成品"""
+        if not self._base_matches():
+            tmp_path = f'{self.gpkg_path}.{os.getpid()}.tmp.gpkg'
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self.base.to_file(tmp_path, layer=BASE_LAYER, driver='GPKG')
+            os.replace(tmp_path, self.gpkg_path)
+        self._base_written = True
+
+    def _write_table(self, table, layer, csv_path):
+        """写出一张属性表：CSV供下游脚本读取，GeoPackage属性表供GIS软件与几何图层连接"""
+        if not self._base_written:
+            self._write_base()
+        table.to_csv(csv_path, index=False, encoding='utf-8')
+        pyogrio.write_dataframe(table, self.gpkg_path, layer=layer)
+        return csv_path
+
+    def submit(self, table, layer, csv_path):
+        """
+        提交一张属性表到后台线程导出
+
+        Args:
+            table (pd.DataFrame): 以 grid_id 为键的属性表，写出期间不应再被修改
+            layer (str): GeoPackage中的属性表名称
+            csv_path (str): CSV输出路径
+
+        Returns:
+            concurrent.futures.Future: 导出任务，结果为CSV路径
+        """
+        future = self._executor.submit(self._write_table, table, layer, csv_path)
+        self._futures.append(future)
+        return future
+
+    def close(self):
+        """
+        等待全部导出任务完成并关闭后台线程
+
+        Raises:
+            Exception: 任一导出任务失败时重新抛出其异常
+        """
+        futures, self._futures = self._futures, []
+        try:
+            for future in futures:
+                future.result()
+        finally:
+            self._executor.shutdown(wait=True)
+
+
+def load_period_layer(gpkg_path, layer):
+    """
+    读取渔网几何图层并连接某个时段的属性表
+
+    Args:
+        gpkg_path (str): GeoPackage路径
+        layer (str): 属性表名称（时段名称）
+
+    Returns:
+        gpd.GeoDataFrame: 带有该时段各项指标的渔网数据
+    """
+    base = gpd.read_file(gpkg_path, layer=BASE_LAYER)
+    table = pd.DataFrame(pyogrio.read_dataframe(gpkg_path, layer=layer))
+    return base.merge(table, on='grid_id', how='left')
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+网格 × 时间段 里程立方体
+功能：一次遍历全天订单，得到每个网格在每个时间段（15/30/60分钟）内的轨迹段数量和里程，
+任意时间窗口（如7-9点、17-19点）都可直接从立方体中切片求和，无需重新扫描订单
+"""
+
+import numpy as np
+import pandas as pd
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def parse_time_of_day(value):
+    """
+    将时间窗口端点解析为一天中的分钟数
+
+    Args:
+        value: 'HH:MM' 字符串或小时数（如 7、6.5）
+
+    Returns:
+        float: 分钟数
+    """
+    if isinstance(value, str):
+        hour, _, minute = value.partition(':')
+        return int(hour) * 60 + int(minute or 0)
+    return float(value) * 60
+
+
+def time_of_day_bins(times, bin_minutes):
+    """
+    计算时间戳在一天中所属的时间段编号
+
+    Args:
+        times (pd.Series): 时间列（字符串或datetime）
+        bin_minutes (int): 时间段长度（分钟）
+
+    Returns:
+        np.ndarray: 时间段编号，无法解析的时间为 -1
+    """
+    times = pd.to_datetime(times, errors='coerce', format='ISO8601')
+    minutes = (times.dt.hour * 60 + times.dt.minute).to_numpy(dtype=np.float64, na_value=np.nan)
+    bins = np.full(len(minutes), -1, dtype=np.int64)
+    valid = np.isfinite(minutes)
+    bins[valid] = minutes[valid].astype(np.int64) // bin_minutes
+    return bins
+
+
+class GridTimeCube:
+    """网格 × 时间段 的轨迹段数量和里程稠密数组"""
+
+    def __init__(self, grid_ids, bin_minutes=30):
+        """
+        初始化空立方体
+
+        Args:
+            grid_ids (array-like): 网格ID数组，决定立方体第一维的顺序
+            bin_minutes (int): 时间段长度（分钟），需能整除一天的分钟数
+        """
+        if MINUTES_PER_DAY % bin_minutes != 0:
+            raise ValueError(f"时间段长度{bin_minutes}分钟不能整除一天")
+        self.grid_ids = np.asarray(grid_ids)
+        self.bin_minutes = int(bin_minutes)
+        self.n_bins = MINUTES_PER_DAY // self.bin_minutes
+        self.counts = np.zeros((len(self.grid_ids), self.n_bins), dtype=np.int64)
+        self.totals = np.zeros((len(self.grid_ids), self.n_bins), dtype=np.float64)
+
+    def time_bins(self, times):
+        """
+        计算时间戳所属的时间段编号
+
+        Args:
+            times (pd.Series): 时间列（字符串或datetime）
+
+        Returns:
+            np.ndarray: 时间段编号，无法解析的时间为 -1
+        """
+        return time_of_day_bins(times, self.bin_minutes)
+
+    def add(self, grid_pos, time_bins, segment_lengths, counted=None):
+        """
+        累加一批轨迹段
+
+        Args:
+            grid_pos (np.ndarray): 轨迹段所在网格位置
+            time_bins (np.ndarray): 轨迹段所属订单的时间段编号，-1 的记录被忽略
+            segment_lengths (np.ndarray): 网格内长度
+            counted (np.ndarray, optional): 计入轨迹段数量的布尔掩码，默认全部计入；里程始终全部累加
+        """
+        valid = time_bins >= 0
+        flat = grid_pos[valid] * self.n_bins + time_bins[valid]
+        size = self.counts.size
+        count_flat = flat if counted is None else flat[counted[valid]]
+        self.counts += np.bincount(count_flat, minlength=size).reshape(self.counts.shape)
+        self.totals += np.bincount(flat, weights=segment_lengths[valid], minlength=size).reshape(self.totals.shape)
+
+    def window(self, start, end):
+        """
+        切出 [start, end) 时间窗口内各网格的轨迹段数量和里程
+
+        Args:
+            start: 窗口起点，'HH:MM' 字符串或小时数
+            end: 窗口终点，'HH:MM' 字符串或小时数
+
+        Returns:
+            tuple: (网格轨迹段数量数组, 网格总里程数组)，按 grid_ids 顺序排列
+        """
+        start_min = parse_time_of_day(start)
+        end_min = parse_time_of_day(end)
+        if not 0 <= start_min < end_min <= MINUTES_PER_DAY:
+            raise ValueError(f"无效的时间窗口: {start} - {end}")
+        if start_min % self.bin_minutes or end_min % self.bin_minutes:
+            raise ValueError(f"时间窗口 {start} - {end} 未对齐到{self.bin_minutes}分钟时间段")
+
+        first = int(start_min) // self.bin_minutes
+        last = int(end_min) // self.bin_minutes
+        return (self.counts[:, first:last].sum(axis=1),
+                self.totals[:, first:last].sum(axis=1))
+
+    def save(self, path):
+        """
+        保存为压缩的npz文件
+
+        Args:
+            path (str): 输出路径
+        """
+        np.savez_compressed(path, grid_ids=self.grid_ids, bin_minutes=self.bin_minutes,
+                            counts=self.counts, totals=self.totals)
+
+    @classmethod
+    def load(cls, path):
+        """
+        从npz文件加载立方体
+
+        Args:
+            path (str): 文件路径
+
+        Returns:
+            GridTimeCube: 立方体对象
+        """
+        with np.load(path, allow_pickle=False) as data:
+            cube = cls(data['grid_ids'], int(data['bin_minutes']))
+            cube.counts = data['counts']
+            cube.totals = data['totals']
+        return cube
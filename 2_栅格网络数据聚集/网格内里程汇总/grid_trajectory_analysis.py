@@ -16,6 +16,7 @@ from shapely.geometry import Point, LineString, Polygon
 from shapely.ops import split
 from concurrent.futures import ProcessPoolExecutor, as_completed
 import time
+import tempfile
 import logging
 from tqdm import tqdm
 import pyproj
@@ -23,7 +24,19 @@ import json
 
 # 导入坐标转换工具
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '西安市500米渔网'))
 from coordinate_transformer import CoordinateTransformer
+from projection_cache import ProjectionCache
+from grid_traversal import HexGridIndex, traverse_segments
+from hex_grid import grid_index_from_gdf
+from strtree_overlay import segment_pairs_bulk
+from grid_time_cube import GridTimeCube
+from order_grid_incidence import OrderGridIncidence
+from road_graph import RoadGraph
+from road_router import RoadNetworkRouter
+from grid_result_export import GridResultExporter
+import shared_memory_workers
+import ping_trajectory
 
 # 配置日志
 logging.basicConfig(
@@ -36,10 +49,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 订单CSV的列名（根据提供的CSV示例格式）
+ORDER_COLUMNS = ['order_id', 'start_time', 'end_time', 'start_lon', 'start_lat', 
+                 'end_lon', 'end_lat', 'unknown1', 'unknown2', 'start_x', 'start_y', 
+                 'end_x', 'end_y', 'start_point', 'end_point', 'unknown3', 'unknown4', 
+                 'unknown5', 'unknown6']
+
+# 流式处理时只读取轨迹段计算所需的坐标列
+COORDINATE_COLUMNS = ['start_lon', 'start_lat', 'end_lon', 'end_lat',
+                      'start_x', 'start_y', 'end_x', 'end_y']
+
 class GridTrajectoryAnalyzer:
     """网格轨迹段分析器"""
     
-    def __init__(self, grid_shapefile_path, morning_orders_path, evening_orders_path, output_dir):
+    def __init__(self, grid_shapefile_path, morning_orders_path, evening_orders_path, output_dir,
+                 road_shapefile_path=None):
         """
         初始化分析器
         
@@ -48,30 +72,66 @@ class GridTrajectoryAnalyzer:
             morning_orders_path (str): 早高峰订单数据路径
             evening_orders_path (str): 晚高峰订单数据路径
             output_dir (str): 输出目录路径
+            road_shapefile_path (str, optional): 路网shp文件路径，使用routed引擎时需要
         """
         self.grid_shapefile_path = grid_shapefile_path
         self.morning_orders_path = morning_orders_path
         self.evening_orders_path = evening_orders_path
         self.output_dir = output_dir
+        self.road_shapefile_path = road_shapefile_path
         
         # 初始化数据变量
         self.grid_gdf = None
         self.morning_orders_df = None
         self.evening_orders_df = None
         self.grid_spatial_index = None  # 网格空间索引
+        self.grid_lattice = None  # 规则渔网格点（用于向量化网格遍历）
+        self.grid_lattice_error = None  # 渔网不规则时记录原因，避免重复推断
+        self.road_router = None  # 路网路径还原器（routed引擎使用）
+        self.exporter = None  # 后台结果导出器，首次保存结果时创建
         
         # 初始化坐标转换器
         self.coord_transformer = CoordinateTransformer()
         self.proj_transformer = None  # 用于经纬度到投影坐标的转换
+        self.grid_crs = None  # 渔网坐标系，创建转换器时确定
+        self.projection_cache = ProjectionCache(self.coord_transformer)  # 订单文件旁的投影坐标缓存
         
         # 确保输出目录存在
         os.makedirs(self.output_dir, exist_ok=True)
-    
+
+    def __getstate__(self):
+        """序列化时不带后台导出器（含线程池），工作进程只需要网格和订单数据"""
+        state = self.__dict__.copy()
+        state['exporter'] = None
+        return state
+
     def load_and_prepare_data(self):
         """加载并准备数据"""
         logger.info("开始加载数据...")
         
         # 加载渔网数据
+        self.load_grid_data()
+        
+        # 加载早高峰订单数据
+        try:
+            self.morning_orders_df = pd.read_csv(self.morning_orders_path, names=ORDER_COLUMNS)
+            logger.info(f"成功加载早高峰订单数据，包含 {len(self.morning_orders_df)} 条记录")
+        except Exception as e:
+            logger.error(f"加载早高峰订单数据失败: {e}")
+            raise
+        
+        # 加载晚高峰订单数据
+        try:
+            self.evening_orders_df = pd.read_csv(self.evening_orders_path, names=ORDER_COLUMNS)
+            logger.info(f"成功加载晚高峰订单数据，包含 {len(self.evening_orders_df)} 条记录")
+        except Exception as e:
+            logger.error(f"加载晚高峰订单数据失败: {e}")
+            raise
+        
+        logger.info("数据加载完成")
+    
+    def load_grid_data(self):
+        """加载渔网数据并创建空间索引"""
         try:
             self.grid_gdf = gpd.read_file(self.grid_shapefile_path)
             logger.info(f"成功加载渔网数据，包含 {len(self.grid_gdf)} 个网格")
@@ -95,29 +155,6 @@ class GridTrajectoryAnalyzer:
         except Exception as e:
             logger.error(f"加载渔网数据失败: {e}")
             raise
-        
-        # 加载早高峰订单数据
-        try:
-            # 根据提供的CSV示例格式，设置列名
-            columns = ['order_id', 'start_time', 'end_time', 'start_lon', 'start_lat', 
-                      'end_lon', 'end_lat', 'unknown1', 'unknown2', 'start_x', 'start_y', 
-                      'end_x', 'end_y', 'start_point', 'end_point', 'unknown3', 'unknown4', 
-                      'unknown5', 'unknown6']
-            self.morning_orders_df = pd.read_csv(self.morning_orders_path, names=columns)
-            logger.info(f"成功加载早高峰订单数据，包含 {len(self.morning_orders_df)} 条记录")
-        except Exception as e:
-            logger.error(f"加载早高峰订单数据失败: {e}")
-            raise
-        
-        # 加载晚高峰订单数据
-        try:
-            self.evening_orders_df = pd.read_csv(self.evening_orders_path, names=columns)
-            logger.info(f"成功加载晚高峰订单数据，包含 {len(self.evening_orders_df)} 条记录")
-        except Exception as e:
-            logger.error(f"加载晚高峰订单数据失败: {e}")
-            raise
-        
-        logger.info("数据加载完成")
     
     def convert_coordinates(self):
         """将订单坐标转换为渔网坐标系"""
@@ -134,6 +171,24 @@ class GridTrajectoryAnalyzer:
             
             logger.info("正在进行坐标转换...")
             
+            # 转换早高峰订单坐标
+            logger.info("转换早高峰订单坐标...")
+            for df, path in [(self.morning_orders_df, self.morning_orders_path),
+                             (self.evening_orders_df, self.evening_orders_path)]:
+                self._project_orders(df, path)
+        else:
+            logger.info("直接使用订单数据中的投影坐标")
+        
+        logger.info("坐标转换完成")
+    
+    def _get_proj_transformer(self):
+        """
+        获取经纬度到渔网坐标系的转换器，首次调用时创建
+        
+        Returns:
+            pyproj.Transformer: 坐标转换器
+        """
+        if self.proj_transformer is None:
             # 获取渔网坐标系
             grid_crs = self.grid_gdf.crs
             if grid_crs is None:
@@ -143,40 +198,51 @@ class GridTrajectoryAnalyzer:
             
             # 创建坐标转换器
             wgs84 = pyproj.CRS("EPSG:4326")
+            self.grid_crs = grid_crs
             self.proj_transformer = self.coord_transformer.get_transformer(wgs84, grid_crs)
-            
-            # 转换早高峰订单坐标
-            logger.info("转换早高峰订单坐标...")
-            for df in [self.morning_orders_df, self.evening_orders_df]:
-                # 转换起点坐标
-                start_x, start_y = self.coord_transformer.batch_transform_coordinates(
-                    self.proj_transformer, df['start_lon'], df['start_lat']
-                )
-                df['start_x'] = start_x
-                df['start_y'] = start_y
-                
-                # 转换终点坐标
-                end_x, end_y = self.coord_transformer.batch_transform_coordinates(
-                    self.proj_transformer, df['end_lon'], df['end_lat']
-                )
-                df['end_x'] = end_x
-                df['end_y'] = end_y
-        else:
-            logger.info("直接使用订单数据中的投影坐标")
+        return self.proj_transformer
+    
+    def _project_orders(self, df, source_path=None, tag=''):
+        """
+        将订单起终点经纬度转换为渔网坐标系，结果写回 start_x/start_y/end_x/end_y 列
         
-        logger.info("坐标转换完成")
+        Args:
+            df (pd.DataFrame): 订单数据
+            source_path (str, optional): 订单文件路径，提供时投影结果缓存在该文件旁，
+                重复运行时直接读取缓存
+            tag (str): 同一订单文件中区分不同数据块的缓存标签
+        """
+        self._get_proj_transformer()
+        # 整列一次转换，非数值记录（如表头行）置为NaN
+        lon_lat = {col: pd.to_numeric(df[col], errors='coerce').to_numpy()
+                   for col in ['start_lon', 'start_lat', 'end_lon', 'end_lat']}
+        
+        # 转换起点、终点坐标
+        for end in ['start', 'end']:
+            x, y = self.projection_cache.transform(
+                lon_lat[f'{end}_lon'], lon_lat[f'{end}_lat'], source_path,
+                "EPSG:4326", self.grid_crs, tag=f'{tag}{end}'
+            )
+            df[f'{end}_x'] = x
+            df[f'{end}_y'] = y
     
-    def _need_coordinate_transformation(self):
+    def _need_coordinate_transformation(self, orders_df=None):
         """
         判断是否需要进行坐标转换
         
+        Args:
+            orders_df (pd.DataFrame, optional): 待判断的订单数据，默认使用早高峰订单
+        
         Returns:
             bool: 是否需要转换
         """
+        if orders_df is None:
+            orders_df = self.morning_orders_df
+        
         # 简单判断：如果坐标数值很小（经纬度范围），则需要转换
         try:
             # 确保坐标数据是浮点数类型
-            morning_x_float = pd.to_numeric(self.morning_orders_df['start_x'], errors='coerce')
+            morning_x_float = pd.to_numeric(orders_df['start_x'], errors='coerce')
             morning_x_mean = morning_x_float.mean()
             return morning_x_mean < 180  # 经纬度的x值通常小于180
         except Exception as e:
@@ -576,9 +642,430 @@ class GridTrajectoryAnalyzer:
         
         return batch_results
     
+    def process_orders_shared(self, orders_df, num_workers=None):
+        """
+        共享内存并行处理订单数据
+        
+        渔网几何和订单坐标只写入共享内存一次，每个工作进程只接收下标范围，
+        在私有的稠密网格数组中累加，最后对所有进程结果做一次向量求和
+        
+        Args:
+            orders_df (pd.DataFrame): 订单数据
+            num_workers (int, optional): 工作进程数，默认使用全部CPU核心
+            
+        Returns:
+            tuple: (网格轨迹段数量, 网格轨迹段总里程)
+        """
+        if num_workers is None:
+            num_workers = os.cpu_count() or 4
+        
+        num_orders = len(orders_df)
+        logger.info(f"开始共享内存并行处理 {num_orders} 条订单，使用{num_workers}个进程...")
+        start_time = time.time()
+        
+        grid_wkb, grid_offsets = shared_memory_workers.pack_geometries(self.grid_gdf.geometry.values)
+        orders = np.column_stack([
+            pd.to_numeric(orders_df[col], errors='coerce').to_numpy(dtype=np.float64)
+            for col in ['start_x', 'start_y', 'end_x', 'end_y']
+        ])
+        
+        # 每个进程分配若干个下标范围，兼顾负载均衡和任务调度开销
+        num_ranges = max(1, min(num_orders, num_workers * 4))
+        bounds = np.linspace(0, num_orders, num_ranges + 1).astype(int)
+        
+        grid_ids = self.grid_gdf['id'].to_numpy()
+        counts = np.zeros(len(grid_ids), dtype=np.int64)
+        totals = np.zeros(len(grid_ids), dtype=np.float64)
+        error_count = 0
+        
+        with shared_memory_workers.SharedArrayPool({
+            'grid_wkb': grid_wkb,
+            'grid_offsets': grid_offsets,
+            'orders': orders,
+        }) as pool:
+            with ProcessPoolExecutor(max_workers=num_workers,
+                                     initializer=shared_memory_workers.init_worker,
+                                     initargs=(pool.spec,)) as executor:
+                future_to_range = {
+                    executor.submit(shared_memory_workers.process_range, int(lo), int(hi)): (int(lo), int(hi))
+                    for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo
+                }
+                with tqdm(total=num_orders) as pbar:
+                    for future in as_completed(future_to_range):
+                        range_start, range_end = future_to_range[future]
+                        range_counts, range_totals, range_errors = future.result()
+                        counts += range_counts
+                        totals += range_totals
+                        error_count += range_errors
+                        pbar.update(range_end - range_start)
+        
+        grid_segment_counts, grid_segment_totals = self._dense_to_results(grid_ids, counts, totals)
+        
+        elapsed = time.time() - start_time
+        logger.info(f"订单处理完成，耗时{elapsed:.2f}秒")
+        logger.info(f"处理订单数: {num_orders}, 错误数: {error_count}")
+        logger.info(f"轨迹段总数: {int(counts.sum())}, 总里程: {totals.sum():.2f}米")
+        
+        return grid_segment_counts, grid_segment_totals
+    
+    def process_orders_streaming(self, orders_path, chunk_size=500000, num_workers=None, engine='lattice'):
+        """
+        流式处理订单文件：按固定行数分块读取、投影并计算轨迹段，累加到各网格的运行总量中，
+        峰值内存只取决于分块大小而与订单总量无关
+        
+        Args:
+            orders_path (str): 订单CSV文件路径
+            chunk_size (int): 每块读取的订单数
+            num_workers (int, optional): 工作进程数（shapely/shared引擎使用）
+            engine (str): 每块使用的轨迹段计算引擎，见process_orders
+            
+        Returns:
+            tuple: (网格轨迹段数量, 网格轨迹段总里程)
+        """
+        logger.info(f"开始流式处理订单文件: {orders_path}，每块{chunk_size}条")
+        start_time = time.time()
+        
+        grid_ids = self.grid_gdf['id'].to_numpy()
+        grid_pos = pd.Series(np.arange(len(grid_ids)), index=grid_ids)
+        counts = np.zeros(len(grid_ids), dtype=np.int64)
+        totals = np.zeros(len(grid_ids), dtype=np.float64)
+        num_orders = 0
+        
+        reader = pd.read_csv(orders_path, names=ORDER_COLUMNS, usecols=COORDINATE_COLUMNS,
+                             chunksize=chunk_size)
+        for chunk_index, chunk in enumerate(reader):
+            # 表头行等非数值记录在转换时置为NaN，计算轨迹段时自动跳过
+            for col in COORDINATE_COLUMNS:
+                chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+            if self._need_coordinate_transformation(chunk):
+                self._project_orders(chunk, orders_path, tag=f'chunk{chunk_index:05d}_')
+            
+            chunk_counts, chunk_totals = self.process_orders(chunk, num_workers, engine)
+            if chunk_counts:
+                pos = grid_pos.loc[list(chunk_counts.keys())].to_numpy()
+                counts[pos] += np.fromiter(chunk_counts.values(), dtype=np.int64, count=len(pos))
+                totals[pos] += np.fromiter((chunk_totals[g] for g in chunk_counts), dtype=np.float64, count=len(pos))
+            
+            num_orders += len(chunk)
+            logger.info(f"已处理第{chunk_index + 1}块，累计{num_orders}条订单，"
+                        f"已耗时: {time.time() - start_time:.2f}秒")
+        
+        grid_segment_counts, grid_segment_totals = self._dense_to_results(grid_ids, counts, totals)
+        
+        logger.info(f"流式处理完成，共{num_orders}条订单，耗时{time.time() - start_time:.2f}秒")
+        logger.info(f"轨迹段总数: {int(counts.sum())}, 总里程: {totals.sum():.2f}米")
+        
+        return grid_segment_counts, grid_segment_totals
+    
+    def _get_grid_lattice(self):
+        """
+        获取规则渔网格点，首次调用时从渔网数据推断（方形渔网或六边形网格）
+
+        Returns:
+            RegularGridLattice or HexGridIndex: 规则网格对象
+        """
+        if self.grid_lattice is None:
+            self.grid_lattice = grid_index_from_gdf(self.grid_gdf, id_col='id')
+            if isinstance(self.grid_lattice, HexGridIndex):
+                logger.info(f"六边形网格: 原点({self.grid_lattice.origin_x:.3f}, {self.grid_lattice.origin_y:.3f}), "
+                            f"外接圆半径{self.grid_lattice.size:.1f}米, "
+                            f"单元面积{self.grid_lattice.cell_area:.0f}平方米")
+            else:
+                logger.info(f"规则网格: 原点({self.grid_lattice.origin_x:.3f}, {self.grid_lattice.origin_y:.3f}), "
+                            f"边长{self.grid_lattice.cell_size:.1f}米, "
+                            f"{self.grid_lattice.n_rows}行×{self.grid_lattice.n_cols}列")
+        return self.grid_lattice
+    
+    def load_road_network(self, road_shapefile_path, **router_kwargs):
+        """
+        加载路网并构建路径还原器，供routed引擎使用
+        
+        Args:
+            road_shapefile_path (str): 路网shp文件路径（如西安市路网_转换后.shp）
+            **router_kwargs: 传给RoadNetworkRouter的参数，如max_snap_distance
+        """
+        logger.info(f"开始加载路网数据: {road_shapefile_path}")
+        start_time = time.time()
+        # 路网图缓存在路网文件旁，路网文件、渔网或构建参数未变化时直接内存映射加载
+        road_graph = RoadGraph.load_or_build(road_shapefile_path, grid_gdf=self.grid_gdf, id_col='id')
+        logger.info(f"路网图加载完成: {road_graph.n_nodes}个节点, {road_graph.adjacency.nnz // 2}条边, "
+                    f"耗时{time.time() - start_time:.2f}秒")
+        self.road_router = RoadNetworkRouter(road_graph, self._get_grid_lattice(), **router_kwargs)
+    
+    def _prepare_engine(self, engine):
+        """
+        在渔网加载后准备引擎所需的数据（routed引擎需要加载路网）
+        
+        Args:
+            engine (str): 轨迹段计算引擎
+        """
+        if engine == 'routed' and self.road_router is None:
+            if self.road_shapefile_path is None:
+                raise ValueError("routed引擎需要提供road_shapefile_path")
+            self.load_road_network(self.road_shapefile_path)
+    
+    def _resolve_vector_engine(self, engine):
+        """
+        确定实际使用的向量化引擎：渔网不是规则网格时，'lattice' 回退为 'strtree'
+        
+        Args:
+            engine (str): 'lattice'、'strtree' 或 'routed'
+            
+        Returns:
+            str: 实际使用的引擎
+        """
+        if engine == 'routed':
+            if self.road_router is None:
+                raise ValueError("routed引擎需要先调用load_road_network加载路网")
+            return engine
+        if engine == 'strtree':
+            return engine
+        if engine != 'lattice':
+            raise ValueError(f"未知的向量化引擎: {engine}")
+        
+        if self.grid_lattice is None and self.grid_lattice_error is None:
+            try:
+                self._get_grid_lattice()
+            except ValueError as e:
+                self.grid_lattice_error = str(e)
+                logger.warning(f"无法使用规则网格遍历，回退到批量空间索引引擎: {e}")
+        return 'strtree' if self.grid_lattice_error is not None else 'lattice'
+    
+    def _segment_pairs(self, orders_df, engine='lattice'):
+        """
+        计算每个订单经过的网格及网格内线段长度
+        
+        Args:
+            orders_df (pd.DataFrame): 订单数据，需包含 start_x/start_y/end_x/end_y 列
+            engine (str): 'lattice' 规则网格遍历；'strtree' 批量空间索引查询与向量化求交；
+                'routed' 按路网最短路径还原轨迹
+            
+        Returns:
+            tuple: (订单行号数组, 网格位置数组, 网格内长度数组)，网格位置对应 grid_gdf 的行顺序
+        """
+        coords = [pd.to_numeric(orders_df[col], errors='coerce').to_numpy()
+                  for col in ['start_x', 'start_y', 'end_x', 'end_y']]
+        engine = self._resolve_vector_engine(engine)
+        if engine == 'routed':
+            return self.road_router.attribute_orders(*coords)
+        if engine == 'lattice':
+            return traverse_segments(self._get_grid_lattice(), *coords)
+        return segment_pairs_bulk(self.grid_gdf.geometry.values, self.grid_spatial_index, *coords)
+    
+    @staticmethod
+    def _dense_to_results(grid_ids, counts, totals):
+        """
+        将按网格排列的稠密数组转换为 (网格轨迹段数量, 网格轨迹段总里程) 字典，只保留有轨迹的网格
+        
+        Args:
+            grid_ids (np.ndarray): 网格ID数组
+            counts (np.ndarray): 轨迹段数量数组
+            totals (np.ndarray): 总里程数组
+            
+        Returns:
+            tuple: (网格轨迹段数量, 网格轨迹段总里程)
+        """
+        touched = np.flatnonzero(counts)
+        touched_ids = grid_ids[touched].tolist()
+        return (dict(zip(touched_ids, counts[touched].tolist())),
+                dict(zip(touched_ids, totals[touched].tolist())))
+    
+    def build_time_cube(self, orders_path, bin_minutes=30, chunk_size=500000, engine='lattice'):
+        """
+        一次遍历全天订单文件，构建 网格 × 时间段 的轨迹段数量和里程立方体
+        
+        订单按开始时间归入时间段，之后任意时间窗口都可通过 GridTimeCube.window 切片得到
+        
+        Args:
+            orders_path (str): 全天订单CSV文件路径
+            bin_minutes (int): 时间段长度（分钟），如15、30、60
+            chunk_size (int): 每块读取的订单数
+            engine (str): 向量化引擎，见_segment_pairs
+            
+        Returns:
+            GridTimeCube: 网格时间立方体
+        """
+        logger.info(f"开始构建{bin_minutes}分钟时间段的网格里程立方体: {orders_path}")
+        start_time = time.time()
+        
+        cube = GridTimeCube(self.grid_gdf['id'].to_numpy(), bin_minutes)
+        num_orders = 0
+        
+        reader = pd.read_csv(orders_path, names=ORDER_COLUMNS, usecols=['start_time'] + COORDINATE_COLUMNS,
+                             chunksize=chunk_size)
+        for chunk_index, chunk in enumerate(reader):
+            for col in COORDINATE_COLUMNS:
+                chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+            if self._need_coordinate_transformation(chunk):
+                self._project_orders(chunk, orders_path, tag=f'chunk{chunk_index:05d}_')
+            
+            order_index, grid_pos, segment_lengths = self._segment_pairs(chunk, engine)
+            order_bins = cube.time_bins(chunk['start_time'])
+            cube.add(grid_pos, order_bins[order_index], segment_lengths)
+            
+            num_orders += len(chunk)
+            logger.info(f"累计处理{num_orders}条订单，已耗时: {time.time() - start_time:.2f}秒")
+        
+        logger.info(f"立方体构建完成: {len(cube.grid_ids)}个网格 × {cube.n_bins}个时间段，"
+                    f"轨迹段总数: {int(cube.counts.sum())}, 总里程: {cube.totals.sum():.2f}米")
+        return cube
+    
+    def build_ping_cube(self, ping_path, bin_minutes=60, chunk_size=2000000, n_partitions=16,
+                        max_gap_minutes=10, max_speed_kmh=30, engine='lattice'):
+        """
+        由GPS轨迹点构建实际骑行折线的 网格 × 时间段 轨迹段数量和里程立方体
+
+        轨迹点先按单车哈希分区落盘，再逐分区按 (单车, 时间) 排序生成相邻点线段，
+        线段按起点时间归入时间段；全天里程即 cube.window(0, 24)。
+        轨迹段数量与订单立方体口径一致，为经过网格的骑行次数：同一次骑行（换车或轨迹中断处切分）
+        在同一网格内的多条相邻点线段只在其最早一条所在的时间段计数一次，里程仍全部累加
+
+        Args:
+            ping_path (str): 轨迹点CSV文件路径（含 共享单车编号/经度/纬度/获取时间 列）
+            bin_minutes (int): 时间段长度（分钟）
+            chunk_size (int): 每块读取的轨迹点数
+            n_partitions (int): 单车哈希分区数
+            max_gap_minutes (float): 相邻两点的最大时间间隔（分钟），超过视为轨迹中断
+            max_speed_kmh (float): 相邻两点的最大隐含速度（千米/小时），超过视为定位漂移
+            engine (str): 'lattice' 或 'strtree'，见_segment_pairs
+
+        Returns:
+            GridTimeCube: 网格时间立方体
+        """
+        if engine not in ('lattice', 'strtree'):
+            raise ValueError(f"轨迹点里程只支持lattice或strtree引擎: {engine}")
+
+        logger.info(f"开始由GPS轨迹点计算网格里程: {ping_path}")
+        start_time = time.time()
+
+        cube = GridTimeCube(self.grid_gdf['id'].to_numpy(), bin_minutes)
+        num_segments = 0
+
+        with tempfile.TemporaryDirectory(dir=self.output_dir) as work_dir:
+            partitions, num_read, num_valid = ping_trajectory.partition_pings(
+                ping_path, work_dir, self._get_proj_transformer(), n_partitions, chunk_size
+            )
+            logger.info(f"轨迹点分区完成: 读取{num_read}个点，有效{num_valid}个点，"
+                        f"已耗时: {time.time() - start_time:.2f}秒")
+
+            for paths in partitions:
+                if not paths:
+                    continue
+                keys, seconds, x, y = ping_trajectory.load_partition(paths)
+                x0, y0, x1, y1, seg_seconds, seg_trip = ping_trajectory.ping_segments(
+                    keys, seconds, x, y, max_gap_seconds=max_gap_minutes * 60,
+                    max_speed=max_speed_kmh / 3.6
+                )
+                segments = pd.DataFrame({'start_x': x0, 'start_y': y0, 'end_x': x1, 'end_y': y1})
+                seg_index, grid_pos, segment_lengths = self._segment_pairs(segments, engine)
+                seg_bins = cube.time_bins(pd.Series(seg_seconds.astype('datetime64[s]')))
+
+                # 每个 (骑行, 网格) 只计数一次：按线段先后排序后取各组第一条（骑行编号在分区内唯一）
+                ride_keys = seg_trip[seg_index].astype(np.int64) * len(cube.grid_ids) + grid_pos
+                order = np.lexsort((seg_index, ride_keys))
+                sorted_keys = ride_keys[order]
+                first = np.ones(len(order), dtype=bool)
+                first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+                counted = np.zeros(len(order), dtype=bool)
+                counted[order[first]] = True
+                cube.add(grid_pos, seg_bins[seg_index], segment_lengths, counted=counted)
+                num_segments += len(segments)
+
+        logger.info(f"轨迹点里程计算完成: {num_segments}条相邻点线段，耗时{time.time() - start_time:.2f}秒，"
+                    f"骑行-网格计数: {int(cube.counts.sum())}, 总里程: {cube.totals.sum():.2f}米")
+        return cube
+
+    def save_time_window(self, cube, start, end, period_name):
+        """
+        从立方体切出时间窗口并按save_results的格式保存
+        
+        Args:
+            cube (GridTimeCube): 网格时间立方体
+            start: 窗口起点，'HH:MM' 字符串或小时数
+            end: 窗口终点，'HH:MM' 字符串或小时数
+            period_name (str): 时段名称，用于输出文件名
+        """
+        counts, totals = cube.window(start, end)
+        self.save_results(self._dense_to_results(cube.grid_ids, counts, totals), period_name)
+    
+    def build_incidence(self, orders_df, engine='lattice'):
+        """
+        构建 订单 × 网格 稀疏关联矩阵，保留每个订单对每个网格的里程贡献
+        
+        Args:
+            orders_df (pd.DataFrame): 订单数据
+            engine (str): 向量化引擎，见_segment_pairs
+            
+        Returns:
+            OrderGridIncidence: 关联矩阵，行顺序与orders_df一致
+        """
+        order_index, grid_pos, segment_lengths = self._segment_pairs(orders_df, engine)
+        incidence = OrderGridIncidence.from_pairs(
+            order_index, grid_pos, segment_lengths,
+            order_ids=orders_df['order_id'].to_numpy(),
+            start_times=orders_df['start_time'].to_numpy(),
+            grid_ids=self.grid_gdf['id'].to_numpy()
+        )
+        logger.info(f"关联矩阵构建完成: {incidence.matrix.shape[0]}个订单 × {incidence.matrix.shape[1]}个网格，"
+                    f"非零元素{incidence.matrix.nnz}个")
+        return incidence
+    
+    def process_orders_vectorized(self, orders_df, engine='lattice'):
+        """
+        向量化处理，一次性计算所有订单在各网格内的线段长度
+        
+        Args:
+            orders_df (pd.DataFrame): 订单数据
+            engine (str): 'lattice' 规则网格遍历；'strtree' 批量空间索引查询与向量化求交；
+                'routed' 按路网最短路径还原轨迹
+            
+        Returns:
+            tuple: (网格轨迹段数量, 网格轨迹段总里程)，与process_orders_parallel返回格式一致
+        """
+        logger.info(f"开始向量化处理 {len(orders_df)} 条订单...")
+        start_time = time.time()
+        
+        grid_ids = self.grid_gdf['id'].to_numpy()
+        _, grid_pos, segment_lengths = self._segment_pairs(orders_df, engine)
+        counts = np.bincount(grid_pos, minlength=len(grid_ids))
+        totals = np.bincount(grid_pos, weights=segment_lengths, minlength=len(grid_ids))
+        
+        grid_segment_counts, grid_segment_totals = self._dense_to_results(grid_ids, counts, totals)
+        
+        elapsed = time.time() - start_time
+        logger.info(f"订单处理完成，耗时{elapsed:.2f}秒")
+        logger.info(f"轨迹段总数: {int(counts.sum())}, 总里程: {totals.sum():.2f}米")
+        
+        return grid_segment_counts, grid_segment_totals
+    
+    def process_orders(self, orders_df, num_workers=None, engine='shapely'):
+        """
+        按指定引擎处理订单数据
+        
+        Args:
+            orders_df (pd.DataFrame): 订单数据
+            num_workers (int, optional): 工作进程数（shapely/shared引擎使用）
+            engine (str): 'shapely' 逐订单几何求交；'shared' 共享内存并行几何求交；
+                'strtree' 批量空间索引查询与向量化求交，适用于不规则网格；
+                'lattice' 规则网格向量化遍历，渔网不规则时自动回退到strtree引擎；
+                'routed' 按路网最短路径还原轨迹（需先调用load_road_network）
+            
+        Returns:
+            tuple: (网格轨迹段数量, 网格轨迹段总里程)
+        """
+        if engine in ('lattice', 'strtree', 'routed'):
+            return self.process_orders_vectorized(orders_df, engine)
+        elif engine == 'shared':
+            return self.process_orders_shared(orders_df, num_workers)
+        elif engine != 'shapely':
+            raise ValueError(f"未知的处理引擎: {engine}")
+        
+        return self.process_orders_parallel(orders_df, num_workers)
+    
     def save_results(self, results, period_name):
         """
-        保存分析结果，支持CSV、Shapefile和GeoJSON格式，确保包含所有网格
+        保存分析结果，确保包含所有网格。结果表在后台线程中写出为CSV和GeoPackage属性表，
+        渔网几何只在GeoPackage的 grid 图层中写入一次，通过 grid_id 连接
         
         Args:
             results (tuple): (网格轨迹段数量, 网格轨迹段总里程)
@@ -588,74 +1075,63 @@ class GridTrajectoryAnalyzer:
         
         logger.info(f"开始保存{period_name}结果...")
         
-        # 创建结果DataFrame，确保包含所有网格
-        result_data = []
-        # 首先添加所有网格，初始值为0
-        for idx, row in self.grid_gdf.iterrows():
-            grid_id = row['id']
-            # 检查该网格是否有轨迹数据
-            count = grid_segment_counts.get(grid_id, 0)
-            total_length = grid_segment_totals.get(grid_id, 0)
-            result_data.append({
-                'grid_id': grid_id,
-                'segment_count': count,
-                'total_length_m': total_length
-            })
-        
-        result_df = pd.DataFrame(result_data)
-        
-        # 按grid_id排序
-        result_df = result_df.sort_values('grid_id')
+        # 按渔网顺序展开为包含所有网格的结果表，无轨迹的网格为0
+        grid_ids = self.grid_gdf['id']
+        result_df = pd.DataFrame({
+            'grid_id': grid_ids.to_numpy(),
+            'segment_count': grid_ids.map(grid_segment_counts).fillna(0).astype(np.int64).to_numpy(),
+            'total_length_m': grid_ids.map(grid_segment_totals).fillna(0.0).astype(np.float64).to_numpy(),
+        }).sort_values('grid_id', kind='stable').reset_index(drop=True)
         
-        # 保存到CSV文件
+        if self.exporter is None:
+            self.exporter = GridResultExporter(self.grid_gdf, self.output_dir)
         csv_output_path = os.path.join(self.output_dir, f'{period_name}_grid_trajectory_stats.csv')
-        result_df.to_csv(csv_output_path, index=False, encoding='utf-8')
-        logger.info(f"CSV结果已保存到: {csv_output_path}")
+        self.exporter.submit(result_df, period_name, csv_output_path)
+        logger.info(f"{period_name}结果已提交后台写出: {csv_output_path}，"
+                    f"{self.exporter.gpkg_path}（属性表 {period_name}）")
         logger.info(f"共包含 {len(result_df)} 个网格记录")
         
-        # 合并结果到原始网格数据，保存为Shapefile
-        if hasattr(self, 'grid_gdf'):
-            # 合并结果到网格数据
-            merged_gdf = self.grid_gdf.merge(result_df, left_on='id', right_on='grid_id', how='left')
-            
-            # 处理可能的空值
-            merged_gdf['segment_count'] = merged_gdf['segment_count'].fillna(0).astype(int)
-            merged_gdf['total_length_m'] = merged_gdf['total_length_m'].fillna(0.0)
-            
-            # 保存为Shapefile
-            shp_output_path = os.path.join(self.output_dir, f'{period_name}_grid_trajectory_stats.shp')
-            merged_gdf.to_file(shp_output_path, driver='ESRI Shapefile', encoding='utf-8')
-            logger.info(f"Shapefile结果已保存到: {shp_output_path}")
-            
-            # 保存为GeoJSON
-            geojson_output_path = os.path.join(self.output_dir, f'{period_name}_grid_trajectory_stats.geojson')
-            merged_gdf.to_file(geojson_output_path, driver='GeoJSON', encoding='utf-8')
-            logger.info(f"GeoJSON结果已保存到: {geojson_output_path}")
-            
-            # 记录有轨迹经过的网格数量
-            non_zero_grids = (merged_gdf['segment_count'] > 0).sum()
-            logger.info(f"有轨迹经过的网格数量: {non_zero_grids}/{len(merged_gdf)}")
-        else:
-            logger.warning("网格数据未加载，无法保存Shapefile和GeoJSON格式")
+        # 记录有轨迹经过的网格数量
+        non_zero_grids = (result_df['segment_count'] > 0).sum()
+        logger.info(f"有轨迹经过的网格数量: {non_zero_grids}/{len(result_df)}")
+    
+    def finish_exports(self):
+        """等待后台导出全部完成，导出失败时抛出异常"""
+        if self.exporter is not None:
+            exporter, self.exporter = self.exporter, None
+            exporter.close()
+            logger.info(f"结果文件写出完成: {exporter.gpkg_path}")
     
-    def analyze(self, num_workers=8):
+    def analyze(self, num_workers=8, engine='shapely', chunk_size=None, save_incidence=False):
         """
         执行完整分析流程
         
         Args:
             num_workers (int): 并行工作线程数
+            engine (str): 轨迹段计算引擎，见process_orders
+            chunk_size (int, optional): 指定时使用流式模式，按该行数分块读取订单文件
+            save_incidence (bool): 是否同时保存 订单 × 网格 稀疏关联矩阵（需使用lattice、strtree或routed引擎）
         """
+        if save_incidence and (chunk_size is not None or engine not in ('lattice', 'strtree', 'routed')):
+            raise ValueError("保存关联矩阵需要非流式模式，并使用lattice、strtree或routed引擎")
+        
+        if chunk_size is not None:
+            self.analyze_streaming(chunk_size, num_workers, engine)
+            return
+        
         try:
             # 1. 加载数据
             self.load_and_prepare_data()
             
             # 2. 坐标转换
             self.convert_coordinates()
+            self._prepare_engine(engine)
             
             # 3. 分析早高峰数据
             logger.info("===== 开始分析早高峰数据 =====")
             morning_start_time = time.time()
-            morning_results = self.process_orders_parallel(self.morning_orders_df, num_workers)
+            morning_results = self._process_period(self.morning_orders_df, "早高峰", num_workers,
+                                                   engine, save_incidence)
             self.save_results(morning_results, "早高峰")
             morning_time = time.time() - morning_start_time
             logger.info(f"早高峰数据分析耗时: {morning_time:.2f} 秒")
@@ -663,17 +1139,103 @@ class GridTrajectoryAnalyzer:
             # 4. 分析晚高峰数据
             logger.info("===== 开始分析晚高峰数据 =====")
             evening_start_time = time.time()
-            evening_results = self.process_orders_parallel(self.evening_orders_df, num_workers)
+            evening_results = self._process_period(self.evening_orders_df, "晚高峰", num_workers,
+                                                   engine, save_incidence)
             self.save_results(evening_results, "晚高峰")
             evening_time = time.time() - evening_start_time
             logger.info(f"晚高峰数据分析耗时: {evening_time:.2f} 秒")
             
+            self.finish_exports()
             logger.info("===== 分析完成 =====")
             logger.info(f"总耗时: {(morning_time + evening_time):.2f} 秒")
             
         except Exception as e:
             logger.error(f"分析过程中出错: {e}")
             raise
+        finally:
+            self.finish_exports()
+
+    def _process_period(self, orders_df, period_name, num_workers, engine, save_incidence):
+        """
+        处理一个时段的订单；需要保存关联矩阵时由关联矩阵汇总结果，避免重复计算轨迹段
+        
+        Args:
+            orders_df (pd.DataFrame): 订单数据
+            period_name (str): 时段名称
+            num_workers (int): 工作进程数
+            engine (str): 轨迹段计算引擎
+            save_incidence (bool): 是否保存关联矩阵
+            
+        Returns:
+            tuple: (网格轨迹段数量, 网格轨迹段总里程)
+        """
+        if not save_incidence:
+            return self.process_orders(orders_df, num_workers, engine)
+        
+        incidence = self.build_incidence(orders_df, engine)
+        incidence_path = os.path.join(self.output_dir, f'{period_name}_order_grid_incidence.npz')
+        incidence.save(incidence_path)
+        logger.info(f"关联矩阵已保存到: {incidence_path}")
+        
+        counts, totals = incidence.aggregate()
+        return self._dense_to_results(incidence.grid_ids, counts, totals)
+    
+    def analyze_streaming(self, chunk_size=500000, num_workers=None, engine='lattice'):
+        """
+        以流式模式执行完整分析流程，订单文件不整体读入内存
+        
+        Args:
+            chunk_size (int): 每块读取的订单数
+            num_workers (int, optional): 工作进程数
+            engine (str): 轨迹段计算引擎，见process_orders
+        """
+        try:
+            self.load_grid_data()
+            self._prepare_engine(engine)
+            
+            total_time = 0
+            for period_name, orders_path in [("早高峰", self.morning_orders_path),
+                                             ("晚高峰", self.evening_orders_path)]:
+                logger.info(f"===== 开始流式分析{period_name}数据 =====")
+                period_start_time = time.time()
+                results = self.process_orders_streaming(orders_path, chunk_size, num_workers, engine)
+                self.save_results(results, period_name)
+                period_time = time.time() - period_start_time
+                total_time += period_time
+                logger.info(f"{period_name}数据分析耗时: {period_time:.2f} 秒")
+            
+            self.finish_exports()
+            logger.info("===== 分析完成 =====")
+            logger.info(f"总耗时: {total_time:.2f} 秒")
+            
+        except Exception as e:
+            logger.error(f"分析过程中出错: {e}")
+            raise
+        finally:
+            self.finish_exports()
+
+    def analyze_pings(self, ping_path, period_name="全天GPS轨迹", **cube_kwargs):
+        """
+        由GPS轨迹点计算全天网格里程并保存，同时保存时间立方体供任意时段切片
+
+        Args:
+            ping_path (str): 轨迹点CSV文件路径
+            period_name (str): 输出文件名前缀
+            **cube_kwargs: 传给build_ping_cube的参数
+        """
+        try:
+            self.load_grid_data()
+            cube = self.build_ping_cube(ping_path, **cube_kwargs)
+            cube_path = os.path.join(self.output_dir, f'{period_name}_grid_time_cube.npz')
+            cube.save(cube_path)
+            logger.info(f"网格时间立方体已保存到: {cube_path}")
+            self.save_time_window(cube, 0, 24, period_name)
+            self.finish_exports()
+        except Exception as e:
+            logger.error(f"分析过程中出错: {e}")
+            raise
+        finally:
+            self.finish_exports()
 
 def main():
     """主函数"""
@@ -702,10 +1264,11 @@ def main():
     )
     
     # 执行分析
-    # 根据CPU核心数设置工作线程数
-    num_workers = min(os.cpu_count() or 4, 8)
+    # 根据CPU核心数设置工作进程数（共享内存引擎不再受序列化开销限制）
+    num_workers = os.cpu_count() or 4
     logger.info(f"使用{num_workers}个工作线程执行分析")
-    analyzer.analyze(num_workers=num_workers)
+    # 渔网为规则500米网格，使用向量化网格遍历引擎
+    analyzer.analyze(num_workers=num_workers, engine='lattice')
     
     logger.info(f"所有分析结果已保存到: {OUTPUT_DIR}")
 
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+规则渔网网格遍历工具
+功能：针对轴对齐的规则渔网（西安市渔网创建.py 生成的500米网格），
+用DDA（数字微分分析）思路一次性向量化计算所有OD直线在每个网格内的线段长度，
+无需为每个订单构建shapely几何对象。六边形网格（hex_grid.py）沿三组边方向做同样的计算
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '西安市500米渔网'))
+from fishnet_index import FishnetIndex
+from hex_grid import SQRT3, HexGridIndex
+
+
+# 规则网格即渔网格点索引，与POI、交通站点等脚本共用 西安市500米渔网/fishnet_index.py
+RegularGridLattice = FishnetIndex
+
+
+def _crossing_params(c0, c1, a0, da, seg_index):
+    """
+    计算一组线段沿单个坐标轴穿越网格边界时的参数t
+
+    Args:
+        c0 (np.ndarray): 起点所在格号
+        c1 (np.ndarray): 终点所在格号
+        a0 (np.ndarray): 起点的格点坐标（以网格边长为单位）
+        da (np.ndarray): 终点与起点的格点坐标差
+        seg_index (np.ndarray): 线段编号
+
+    Returns:
+        tuple: (线段编号数组, 参数t数组)
+    """
+    n_cross = np.abs(c1 - c0)
+    seg = np.repeat(seg_index, n_cross)
+    if len(seg) == 0:
+        return seg, np.empty(0, dtype=np.float64)
+
+    # 每条线段内第k次穿越（k从1开始）
+    group_start = np.repeat(np.cumsum(n_cross) - n_cross, n_cross)
+    k = np.arange(len(seg)) - group_start + 1
+
+    step = np.sign(c1 - c0)[seg]
+    # 正向穿越边界 c0+k，反向穿越边界 c0-k+1
+    boundary = c0[seg] + np.where(step > 0, k, 1 - k)
+    t = (boundary - a0[seg]) / da[seg]
+    return seg, t
+
+
+def traverse_segments(lattice, start_x, start_y, end_x, end_y, min_length=1e-6):
+    """
+    向量化计算所有直线段在每个网格内的长度
+
+    Args:
+        lattice (RegularGridLattice or HexGridIndex): 规则网格或六边形网格
+        start_x, start_y, end_x, end_y (array-like): 起终点投影坐标
+        min_length (float): 小于该值的网格内线段视为浮点误差并丢弃
+
+    Returns:
+        tuple: (线段编号数组, 网格位置数组, 网格内长度数组)，
+        零长度线段（起终点重合）记为其所在网格、长度为0
+    """
+    if isinstance(lattice, HexGridIndex):
+        return traverse_hex_segments(lattice, start_x, start_y, end_x, end_y, min_length)
+
+    x0 = np.asarray(start_x, dtype=np.float64)
+    y0 = np.asarray(start_y, dtype=np.float64)
+    x1 = np.asarray(end_x, dtype=np.float64)
+    y1 = np.asarray(end_y, dtype=np.float64)
+
+    valid = np.isfinite(x0) & np.isfinite(y0) & np.isfinite(x1) & np.isfinite(y1)
+    seg_index = np.flatnonzero(valid)
+    x0, y0, x1, y1 = x0[valid], y0[valid], x1[valid], y1[valid]
+
+    # 转换到以网格边长为单位的格点坐标
+    u0 = (x0 - lattice.origin_x) / lattice.cell_size
+    v0 = (y0 - lattice.origin_y) / lattice.cell_size
+    du = (x1 - x0) / lattice.cell_size
+    dv = (y1 - y0) / lattice.cell_size
+    lengths = np.hypot(x1 - x0, y1 - y0)
+
+    # 起终点重合的订单：只计入起点所在网格，里程为0
+    is_point = lengths < min_length
+    point_seg = seg_index[is_point]
+    point_pos = lattice.lookup(np.floor(v0[is_point]).astype(np.int64),
+                               np.floor(u0[is_point]).astype(np.int64))
+
+    line = ~is_point
+    local = np.flatnonzero(line)
+    u0, v0, du, dv, lengths = u0[line], v0[line], du[line], dv[line], lengths[line]
+    n = len(local)
+    local_index = np.arange(n)
+
+    col0 = np.floor(u0).astype(np.int64)
+    row0 = np.floor(v0).astype(np.int64)
+    col1 = np.floor(u0 + du).astype(np.int64)
+    row1 = np.floor(v0 + dv).astype(np.int64)
+
+    seg_x, t_x = _crossing_params(col0, col1, u0, du, local_index)
+    seg_y, t_y = _crossing_params(row0, row1, v0, dv, local_index)
+
+    # 每条线段的参数序列：0、所有边界穿越点、1，按 (线段, t) 排序
+    seg_all = np.concatenate([local_index, seg_x, seg_y, local_index])
+    t_all = np.concatenate([np.zeros(n), t_x, t_y, np.ones(n)])
+    order = np.lexsort((t_all, seg_all))
+    seg_all = seg_all[order]
+    t_all = t_all[order]
+
+    same = seg_all[1:] == seg_all[:-1]
+    piece_seg = seg_all[:-1][same]
+    t_start = t_all[:-1][same]
+    t_end = t_all[1:][same]
+
+    piece_len = (t_end - t_start) * lengths[piece_seg]
+    keep = piece_len > min_length
+    piece_seg = piece_seg[keep]
+    piece_len = piece_len[keep]
+    t_mid = (t_start[keep] + t_end[keep]) * 0.5
+
+    # 用线段中点确定所在网格
+    cols = np.floor(u0[piece_seg] + t_mid * du[piece_seg]).astype(np.int64)
+    rows = np.floor(v0[piece_seg] + t_mid * dv[piece_seg]).astype(np.int64)
+    piece_pos = lattice.lookup(rows, cols)
+
+    out_seg = np.concatenate([seg_index[local[piece_seg]], point_seg])
+    out_pos = np.concatenate([piece_pos, point_pos])
+    out_len = np.concatenate([piece_len, np.zeros(len(point_seg))])
+
+    in_grid = out_pos >= 0
+    return out_seg[in_grid], out_pos[in_grid], out_len[in_grid]
+
+
+def traverse_hex_segments(hex_index, start_x, start_y, end_x, end_y, min_length=1e-6):
+    """
+    向量化计算所有直线段在每个六边形内的长度
+
+    尖顶六边形的边只有三个方向，每个方向的边都落在一组间距为 √3/2 倍外接圆半径的平行线上。
+    沿三组平行线的法向分别按DDA求穿越参数，合并后切出的每一小段必然落在单个六边形内
+    （平行线也穿过六边形内部，同一六边形内相邻的小段最后合并为一段）
+
+    Args:
+        hex_index (HexGridIndex): 六边形网格
+        start_x, start_y, end_x, end_y (array-like): 起终点投影坐标
+        min_length (float): 小于该值的网格内线段视为浮点误差并丢弃
+
+    Returns:
+        tuple: (线段编号数组, 网格位置数组, 网格内长度数组)，与 traverse_segments 相同
+    """
+    x0 = np.asarray(start_x, dtype=np.float64)
+    y0 = np.asarray(start_y, dtype=np.float64)
+    x1 = np.asarray(end_x, dtype=np.float64)
+    y1 = np.asarray(end_y, dtype=np.float64)
+
+    valid = np.isfinite(x0) & np.isfinite(y0) & np.isfinite(x1) & np.isfinite(y1)
+    seg_index = np.flatnonzero(valid)
+    x0, y0, x1, y1 = x0[valid], y0[valid], x1[valid], y1[valid]
+    lengths = np.hypot(x1 - x0, y1 - y0)
+
+    is_point = lengths < min_length
+    point_seg = seg_index[is_point]
+    point_pos = hex_index.locate(x0[is_point], y0[is_point])
+
+    line = ~is_point
+    local = np.flatnonzero(line)
+    x0, y0, x1, y1, lengths = x0[line], y0[line], x1[line], y1[line], lengths[line]
+    n = len(local)
+    local_index = np.arange(n)
+
+    # 相对原点的坐标，在三组边方向的法向上投影，以平行线间距为单位
+    spacing = hex_index.line_spacing
+    dx0, dy0 = x0 - hex_index.origin_x, y0 - hex_index.origin_y
+    dx1, dy1 = x1 - hex_index.origin_x, y1 - hex_index.origin_y
+    seg_parts, t_parts = [local_index], [np.zeros(n)]
+    for nx, ny in ((1.0, 0.0), (0.5, SQRT3 / 2.0), (-0.5, SQRT3 / 2.0)):
+        a0 = (dx0 * nx + dy0 * ny) / spacing
+        a1 = (dx1 * nx + dy1 * ny) / spacing
+        seg_a, t_a = _crossing_params(np.floor(a0).astype(np.int64), np.floor(a1).astype(np.int64),
+                                      a0, a1 - a0, local_index)
+        seg_parts.append(seg_a)
+        t_parts.append(t_a)
+    seg_parts.append(local_index)
+    t_parts.append(np.ones(n))
+
+    seg_all = np.concatenate(seg_parts)
+    t_all = np.concatenate(t_parts)
+    order = np.lexsort((t_all, seg_all))
+    seg_all = seg_all[order]
+    t_all = t_all[order]
+
+    same = seg_all[1:] == seg_all[:-1]
+    piece_seg = seg_all[:-1][same]
+    t_start = t_all[:-1][same]
+    t_end = t_all[1:][same]
+
+    piece_len = (t_end - t_start) * lengths[piece_seg]
+    keep = piece_len > min_length
+    piece_seg = piece_seg[keep]
+    piece_len = piece_len[keep]
+    t_mid = (t_start[keep] + t_end[keep]) * 0.5
+
+    # 用小段中点确定所在六边形
+    piece_pos = hex_index.locate(x0[piece_seg] + t_mid * (x1 - x0)[piece_seg],
+                                 y0[piece_seg] + t_mid * (y1 - y0)[piece_seg])
+
+    # 合并同一线段在同一六边形内连续的小段
+    if len(piece_seg):
+        run_start = np.ones(len(piece_seg), dtype=bool)
+        run_start[1:] = (piece_seg[1:] != piece_seg[:-1]) | (piece_pos[1:] != piece_pos[:-1])
+        starts = np.flatnonzero(run_start)
+        piece_len = np.add.reduceat(piece_len, starts)
+        piece_seg = piece_seg[starts]
+        piece_pos = piece_pos[starts]
+
+    out_seg = np.concatenate([seg_index[local[piece_seg]], point_seg])
+    out_pos = np.concatenate([piece_pos, point_pos])
+    out_len = np.concatenate([piece_len, np.zeros(len(point_seg))])
+
+    in_grid = out_pos >= 0
+    return out_seg[in_grid], out_pos[in_grid], out_len[in_grid]
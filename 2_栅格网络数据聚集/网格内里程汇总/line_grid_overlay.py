@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+线要素网格裁剪长度工具
+功能：将道路等折线在网格边界处切分，统计每条线在每个网格内的实际长度（而不是整条线的长度）。
+规则渔网（方形或六边形）时把折线拆成相邻顶点之间的直线段，用 grid_traversal.traverse_segments
+向量化遍历；不规则网格时回退为空间索引批量求交。线要素按块分配给多个进程并行计算
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from grid_traversal import traverse_segments
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '西安市500米渔网'))
+from hex_grid import grid_index_from_gdf
+
+# 工作进程内的全局状态，由 _init_worker 在进程启动时填充
+_worker_state = {}
+
+
+def polyline_segments(geometries):
+    """
+    将线几何拆分为相邻顶点组成的直线段
+
+    Args:
+        geometries (np.ndarray): 线几何数组（LineString/MultiLineString）
+
+    Returns:
+        tuple: (所属线要素编号, 起点X, 起点Y, 终点X, 终点Y)
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    parts, line_index = shapely.get_parts(geometries, return_index=True)
+    is_line = shapely.get_type_id(parts) == shapely.GeometryType.LINESTRING
+    parts, line_index = parts[is_line], line_index[is_line]
+    coords, part_index = shapely.get_coordinates(parts, return_index=True)
+
+    # 同一部件内相邻的两个顶点组成一条直线段
+    same_part = part_index[1:] == part_index[:-1]
+    start = np.flatnonzero(same_part)
+    return (line_index[part_index[start]], coords[start, 0], coords[start, 1],
+            coords[start + 1, 0], coords[start + 1, 1])
+
+
+def _init_worker(grid_index, grid_geoms):
+    """工作进程初始化：保存网格索引，不规则网格时构建空间索引"""
+    _worker_state['grid_index'] = grid_index
+    _worker_state['grid_geoms'] = grid_geoms
+    _worker_state['tree'] = shapely.STRtree(grid_geoms) if grid_index is None else None
+
+
+def _clip_chunk(geometries, min_length):
+    """
+    计算一块线要素在各网格内的长度
+
+    Returns:
+        tuple: (块内线要素编号数组, 网格位置数组, 网格内长度数组)，同一 (线, 网格) 可能出现多次
+    """
+    grid_index = _worker_state['grid_index']
+    if grid_index is not None:
+        line_index, x0, y0, x1, y1 = polyline_segments(geometries)
+        seg, pos, length = traverse_segments(grid_index, x0, y0, x1, y1, min_length)
+        return line_index[seg], pos, length
+
+    grid_geoms = _worker_state['grid_geoms']
+    line_index, pos = _worker_state['tree'].query(geometries, predicate='intersects')
+    length = shapely.length(shapely.intersection(geometries[line_index], grid_geoms[pos]))
+    return line_index, pos, length
+
+
+def _sum_pairs(line_index, pos, length, n_grids, min_length):
+    """按 (线, 网格) 合并长度，丢弃长度不超过 min_length 的组合（仅接触网格边界或顶点）"""
+    keys = line_index.astype(np.int64) * n_grids + pos
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    totals = np.bincount(inverse, weights=length, minlength=len(unique_keys))
+    keep = totals > min_length
+    return unique_keys[keep] // n_grids, unique_keys[keep] % n_grids, totals[keep]
+
+
+def clip_lines_to_grid(geometries, grid_gdf, id_col='grid_id', num_workers=None, chunk_size=20000,
+                       min_length=1e-6):
+    """
+    计算每条线要素在每个网格内的裁剪长度
+
+    Args:
+        geometries (array-like): 线几何数组（与网格同一投影坐标系）
+        grid_gdf (gpd.GeoDataFrame): 网格数据
+        id_col (str): 网格ID列名
+        num_workers (int, optional): 工作进程数，默认使用全部CPU核心；为1时在当前进程内计算
+        chunk_size (int): 每个任务处理的线要素数
+        min_length (float): 小于该值的网格内长度视为浮点误差
+
+    Returns:
+        pd.DataFrame: line_index（线要素在输入中的位置）、grid_pos（网格位置）、grid_id、length_m
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    grid_geoms = np.asarray(grid_gdf.geometry.values, dtype=object)
+    n_grids = len(grid_gdf)
+    try:
+        grid_index = grid_index_from_gdf(grid_gdf, id_col=id_col)
+        print(f"网格为规则网格（{type(grid_index).__name__}），按直线段遍历网格计算裁剪长度")
+    except ValueError as e:
+        grid_index = None
+        print(f"警告: 网格不是规则网格，使用空间索引求交计算裁剪长度: {e}")
+
+    starts = range(0, len(geometries), chunk_size)
+    if num_workers is None:
+        num_workers = os.cpu_count() or 4
+    num_workers = max(1, min(num_workers, len(starts)))
+
+    results = []
+    if num_workers == 1:
+        _init_worker(grid_index, grid_geoms)
+        for start in starts:
+            results.append((start, _clip_chunk(geometries[start:start + chunk_size], min_length)))
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                                 initargs=(grid_index, grid_geoms)) as executor:
+            futures = [(start, executor.submit(_clip_chunk, geometries[start:start + chunk_size], min_length))
+                       for start in starts]
+            results = [(start, future.result()) for start, future in futures]
+
+    if results:
+        line_index = np.concatenate([chunk[0] + start for start, chunk in results]).astype(np.int64)
+        pos = np.concatenate([chunk[1] for _, chunk in results]).astype(np.int64)
+        length = np.concatenate([chunk[2] for _, chunk in results])
+    else:
+        line_index = pos = np.empty(0, dtype=np.int64)
+        length = np.empty(0, dtype=np.float64)
+
+    line_index, pos, length = _sum_pairs(line_index, pos, length, n_grids, min_length)
+    return pd.DataFrame({
+        'line_index': line_index,
+        'grid_pos': pos,
+        'grid_id': grid_gdf[id_col].to_numpy()[pos],
+        'length_m': length,
+    })
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+网格 → 网格 OD流量矩阵
+功能：订单映射到渔网后，按时间段保存 起点网格 × 终点网格 的稀疏流量矩阵（订单数和总里程），
+一次遍历即可完成全部时间段的累加。任意时间窗口的前k大流向、行政区内/区间流量汇总、
+起终点边际统计都直接在稀疏矩阵上计算，无需对数百万行订单反复groupby
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from grid_time_cube import MINUTES_PER_DAY, parse_time_of_day, time_of_day_bins
+
+
+class ODFlowMatrix:
+    """按时间段划分的 起点网格 × 终点网格 稀疏流量矩阵"""
+
+    def __init__(self, grid_ids, bin_minutes=60):
+        """
+        初始化空流量矩阵
+
+        Args:
+            grid_ids (array-like): 网格ID数组，决定矩阵行列的顺序
+            bin_minutes (int): 时间段长度（分钟），需能整除一天的分钟数
+        """
+        if MINUTES_PER_DAY % bin_minutes != 0:
+            raise ValueError(f"时间段长度{bin_minutes}分钟不能整除一天")
+        self.grid_ids = np.asarray(grid_ids)
+        self.bin_minutes = int(bin_minutes)
+        self.n_bins = MINUTES_PER_DAY // self.bin_minutes
+        n = len(self.grid_ids)
+        self.counts = [sparse.csr_matrix((n, n), dtype=np.int64) for _ in range(self.n_bins)]
+        self.mileage = [sparse.csr_matrix((n, n), dtype=np.float64) for _ in range(self.n_bins)]
+        self._id_order = np.argsort(self.grid_ids, kind='stable')
+
+    @property
+    def n_grids(self):
+        """网格数量（矩阵行列数）"""
+        return len(self.grid_ids)
+
+    def positions(self, ids):
+        """
+        将网格ID映射为矩阵行列位置
+
+        Args:
+            ids (array-like): 网格ID数组（可含NaN）
+
+        Returns:
+            np.ndarray: 位置数组，ID无效或不在渔网中时为 -1
+        """
+        ids = pd.to_numeric(pd.Series(np.asarray(ids)), errors='coerce').to_numpy(dtype=np.float64)
+        sorted_ids = self.grid_ids[self._id_order]
+        idx = np.searchsorted(sorted_ids, ids)
+        idx = np.clip(idx, 0, max(self.n_grids - 1, 0))
+        found = np.isfinite(ids) & (sorted_ids[idx] == ids) if self.n_grids else np.zeros(len(ids), dtype=bool)
+        pos = np.full(len(ids), -1, dtype=np.int64)
+        pos[found] = self._id_order[idx[found]]
+        return pos
+
+    def time_bins(self, times):
+        """
+        计算时间戳所属的时间段编号
+
+        Args:
+            times (pd.Series): 时间列（字符串或datetime）
+
+        Returns:
+            np.ndarray: 时间段编号，无法解析的时间为 -1
+        """
+        return time_of_day_bins(times, self.bin_minutes)
+
+    def add(self, origin_pos, dest_pos, time_bins, mileage=None):
+        """
+        累加一批订单：全部时间段的 (时间段, 起点, 终点) 组合键一次排序去重后用bincount求和
+
+        Args:
+            origin_pos (np.ndarray): 起点网格位置，-1 的记录被忽略
+            dest_pos (np.ndarray): 终点网格位置，-1 的记录被忽略
+            time_bins (np.ndarray): 时间段编号，-1 的记录被忽略
+            mileage (np.ndarray, optional): 订单行驶里程，缺失值按0计
+        """
+        origin_pos = np.asarray(origin_pos, dtype=np.int64)
+        dest_pos = np.asarray(dest_pos, dtype=np.int64)
+        time_bins = np.asarray(time_bins, dtype=np.int64)
+        valid = (origin_pos >= 0) & (dest_pos >= 0) & (time_bins >= 0)
+        if not valid.any():
+            return
+
+        n = self.n_grids
+        keys = (time_bins[valid] * n + origin_pos[valid]) * n + dest_pos[valid]
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(unique_keys))
+        if mileage is None:
+            totals = np.zeros(len(unique_keys))
+        else:
+            weights = np.asarray(mileage, dtype=np.float64)[valid]
+            totals = np.bincount(inverse, weights=np.where(np.isfinite(weights), weights, 0.0),
+                                 minlength=len(unique_keys))
+
+        # 组合键已排序，同一时间段的流向连续排列
+        key_bins = unique_keys // (n * n)
+        cells = unique_keys % (n * n)
+        bounds = np.searchsorted(key_bins, np.arange(self.n_bins + 1))
+        for b in np.unique(key_bins):
+            sl = slice(bounds[b], bounds[b + 1])
+            rows, cols = cells[sl] // n, cells[sl] % n
+            self.counts[b] = self.counts[b] + sparse.csr_matrix((counts[sl], (rows, cols)), shape=(n, n))
+            self.mileage[b] = self.mileage[b] + sparse.csr_matrix((totals[sl], (rows, cols)), shape=(n, n))
+
+    @classmethod
+    def from_orders(cls, data, grid_ids, bin_minutes=60, origin_col='起点网格ID', dest_col='终点网格ID',
+                    time_col='订单开始时间', mileage_col='行驶里程'):
+        """
+        由已映射到渔网的订单表构建流量矩阵
+
+        Args:
+            data (pd.DataFrame): 订单数据
+            grid_ids (array-like): 网格ID数组
+            bin_minutes (int): 时间段长度（分钟）
+            origin_col, dest_col (str): 起点、终点网格ID列名
+            time_col (str): 订单时间列名，缺失时全部订单计入第一个时间段，应配合 bin_minutes=1440 使用
+            mileage_col (str): 行驶里程列名，缺失时只统计订单数
+
+        Returns:
+            ODFlowMatrix: 流量矩阵
+        """
+        flow = cls(grid_ids, bin_minutes)
+        if time_col in data.columns:
+            time_bins = flow.time_bins(data[time_col])
+        else:
+            time_bins = np.zeros(len(data), dtype=np.int64)
+        mileage = data[mileage_col].to_numpy(dtype=np.float64) if mileage_col in data.columns else None
+        flow.add(flow.positions(data[origin_col]), flow.positions(data[dest_col]), time_bins, mileage)
+        return flow
+
+    def _bin_range(self, start, end):
+        """将 [start, end) 时间窗口转换为时间段编号范围，均为None时返回全部时间段"""
+        if start is None and end is None:
+            return 0, self.n_bins
+        start_min = parse_time_of_day(start if start is not None else 0)
+        end_min = parse_time_of_day(end if end is not None else 24)
+        if not 0 <= start_min < end_min <= MINUTES_PER_DAY:
+            raise ValueError(f"无效的时间窗口: {start} - {end}")
+        if start_min % self.bin_minutes or end_min % self.bin_minutes:
+            raise ValueError(f"时间窗口 {start} - {end} 未对齐到{self.bin_minutes}分钟时间段")
+        return int(start_min) // self.bin_minutes, int(end_min) // self.bin_minutes
+
+    def window(self, start=None, end=None):
+        """
+        汇总 [start, end) 时间窗口内的流量矩阵
+
+        Args:
+            start: 窗口起点，'HH:MM' 字符串或小时数，默认0点
+            end: 窗口终点，'HH:MM' 字符串或小时数，默认24点
+
+        Returns:
+            tuple: (订单数矩阵, 总里程矩阵)，均为CSR稀疏矩阵
+        """
+        first, last = self._bin_range(start, end)
+        n = self.n_grids
+        counts = sparse.csr_matrix((n, n), dtype=np.int64)
+        mileage = sparse.csr_matrix((n, n), dtype=np.float64)
+        for b in range(first, last):
+            if self.counts[b].nnz:
+                counts = counts + self.counts[b]
+                mileage = mileage + self.mileage[b]
+        return counts, mileage
+
+    def marginals(self, start=None, end=None):
+        """
+        计算每个网格的起点订单数和终点订单数
+
+        Args:
+            start, end: 时间窗口，同 window
+
+        Returns:
+            tuple: (起点订单数数组, 终点订单数数组)，按 grid_ids 顺序排列
+        """
+        counts, _ = self.window(start, end)
+        return np.asarray(counts.sum(axis=1)).ravel(), np.asarray(counts.sum(axis=0)).ravel()
+
+    def top_flows(self, k=20, start=None, end=None, by='count', include_intra=True):
+        """
+        查询前k大流向
+
+        Args:
+            k (int): 返回的流向数量
+            start, end: 时间窗口，同 window
+            by (str): 排序依据，'count' 订单数或 'mileage' 总里程
+            include_intra (bool): 是否包含起终点在同一网格内的流向
+
+        Returns:
+            pd.DataFrame: 起点位置、终点位置、起点网格ID、终点网格ID、订单数、总里程、平均里程，按排序依据降序
+        """
+        if by not in ('count', 'mileage'):
+            raise ValueError(f"未知的排序依据: {by}")
+        counts, mileage = self.window(start, end)
+        ranked = (counts if by == 'count' else mileage).tocoo()
+        rows, cols, values = ranked.row, ranked.col, ranked.data
+        keep = values > 0
+        if not include_intra:
+            keep &= rows != cols
+        rows, cols, values = rows[keep], cols[keep], values[keep]
+
+        if len(values) > k:
+            part = np.argpartition(-values, k - 1)[:k]
+            rows, cols, values = rows[part], cols[part], values[part]
+        order = np.lexsort((cols, rows, -values))
+        rows, cols = rows[order], cols[order]
+
+        flow_counts = np.asarray(counts[rows, cols]).ravel() if len(rows) else np.zeros(0, dtype=np.int64)
+        flow_mileage = np.asarray(mileage[rows, cols]).ravel() if len(rows) else np.zeros(0)
+        return pd.DataFrame({
+            '起点位置': rows.astype(np.int64),
+            '终点位置': cols.astype(np.int64),
+            '起点网格ID': self.grid_ids[rows],
+            '终点网格ID': self.grid_ids[cols],
+            '订单数': flow_counts.astype(np.int64),
+            '总里程': flow_mileage,
+            '平均里程': flow_mileage / np.maximum(flow_counts, 1),
+        })
+
+    def group_flows(self, labels, start=None, end=None, missing_label='其他'):
+        """
+        按网格所属分区（如行政区）汇总分区内和分区间的流量
+
+        Args:
+            labels (array-like): 每个网格所属分区名称，按 grid_ids 顺序排列，缺失值归入 missing_label
+            start, end: 时间窗口，同 window
+            missing_label (str): 无分区网格的分区名称
+
+        Returns:
+            pd.DataFrame: 起点分区、终点分区、订单数、总里程、是否区内，每个分区对一行
+        """
+        labels = pd.Series(np.asarray(labels, dtype=object)).fillna(missing_label)
+        codes, names = pd.factorize(labels, sort=True)
+        n_groups = len(names)
+        # 网格 × 分区 的指示矩阵，P^T · M · P 即为分区 × 分区 流量
+        indicator = sparse.csr_matrix((np.ones(self.n_grids), (np.arange(self.n_grids), codes)),
+                                      shape=(self.n_grids, n_groups))
+        counts, mileage = self.window(start, end)
+        group_counts = (indicator.T @ counts @ indicator).toarray()
+        group_mileage = (indicator.T @ mileage @ indicator).toarray()
+
+        origin, dest = np.meshgrid(np.arange(n_groups), np.arange(n_groups), indexing='ij')
+        return pd.DataFrame({
+            '起点分区': np.asarray(names)[origin.ravel()],
+            '终点分区': np.asarray(names)[dest.ravel()],
+            '订单数': group_counts.ravel().astype(np.int64),
+            '总里程': group_mileage.ravel(),
+            '是否区内': (origin == dest).ravel(),
+        })
+
+    def save(self, path):
+        """
+        保存为压缩的npz文件（各时间段非零流向以坐标格式拼接保存）
+
+        Args:
+            path (str): 输出路径
+        """
+        bins, rows, cols, counts, mileage = [], [], [], [], []
+        for b in range(self.n_bins):
+            c = self.counts[b].tocoo()
+            bins.append(np.full(c.nnz, b, dtype=np.int64))
+            rows.append(c.row)
+            cols.append(c.col)
+            counts.append(c.data)
+            mileage.append(np.asarray(self.mileage[b][c.row, c.col]).ravel() if c.nnz else np.zeros(0))
+        np.savez_compressed(path, grid_ids=self.grid_ids, bin_minutes=self.bin_minutes,
+                            bins=np.concatenate(bins), rows=np.concatenate(rows), cols=np.concatenate(cols),
+                            counts=np.concatenate(counts), mileage=np.concatenate(mileage))
+
+    @classmethod
+    def load(cls, path):
+        """
+        从npz文件加载流量矩阵
+
+        Args:
+            path (str): 文件路径
+
+        Returns:
+            ODFlowMatrix: 流量矩阵
+        """
+        with np.load(path, allow_pickle=False) as data:
+            flow = cls(data['grid_ids'], int(data['bin_minutes']))
+            n = flow.n_grids
+            bins, rows, cols = data['bins'], data['rows'], data['cols']
+            for b in np.unique(bins):
+                sel = bins == b
+                flow.counts[b] = sparse.csr_matrix((data['counts'][sel], (rows[sel], cols[sel])), shape=(n, n))
+                flow.mileage[b] = sparse.csr_matrix((data['mileage'][sel], (rows[sel], cols[sel])), shape=(n, n))
+        return flow
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+订单 × 网格 稀疏关联矩阵
+功能：保存每个订单经过哪些网格及网格内线段长度（CSR稀疏矩阵，行为订单、列为网格），
+并附带订单ID和开始时间数组。按时间、运营商、行程长度、行政区等条件筛选订单后重新汇总时，
+只需一次稀疏矩阵-向量乘法，无需重新运行几何计算
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from grid_time_cube import parse_time_of_day
+
+
+class OrderGridIncidence:
+    """订单 × 网格 稀疏关联矩阵及订单属性数组"""
+
+    def __init__(self, matrix, order_ids, start_times, grid_ids):
+        """
+        初始化关联矩阵
+
+        Args:
+            matrix (scipy.sparse.csr_matrix): 订单 × 网格 矩阵，值为网格内线段长度（米）。
+                起终点重合等零长度轨迹段以显式0存储，保证轨迹段数量统计不丢失
+            order_ids (np.ndarray): 每行对应的订单ID
+            start_times (np.ndarray): 每行对应的订单开始时间（datetime64，无法解析为NaT）
+            grid_ids (np.ndarray): 每列对应的网格ID
+        """
+        self.matrix = matrix
+        self.order_ids = np.asarray(order_ids)
+        self.start_times = np.asarray(start_times, dtype='datetime64[ns]')
+        self.grid_ids = np.asarray(grid_ids)
+
+    @classmethod
+    def from_pairs(cls, order_index, grid_pos, segment_lengths, order_ids, start_times, grid_ids):
+        """
+        由 (订单, 网格, 长度) 三元组构建CSR矩阵
+
+        Args:
+            order_index (np.ndarray): 订单行号
+            grid_pos (np.ndarray): 网格位置（列号）
+            segment_lengths (np.ndarray): 网格内长度
+            order_ids (array-like): 订单ID，长度即矩阵行数
+            start_times (array-like): 订单开始时间
+            grid_ids (array-like): 网格ID，长度即矩阵列数
+
+        Returns:
+            OrderGridIncidence: 关联矩阵对象
+        """
+        n_orders = len(order_ids)
+        n_grids = len(grid_ids)
+        order = np.lexsort((grid_pos, order_index))
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(order_index, minlength=n_orders))])
+        # 直接用 (data, indices, indptr) 构造，保留显式0
+        matrix = sparse.csr_matrix(
+            (np.asarray(segment_lengths, dtype=np.float64)[order],
+             np.asarray(grid_pos, dtype=np.int32)[order],
+             indptr.astype(np.int64)),
+            shape=(n_orders, n_grids),
+        )
+        start_times = pd.to_datetime(pd.Series(start_times), errors='coerce', format='ISO8601').to_numpy()
+        return cls(matrix, _plain_array(order_ids), start_times, grid_ids)
+
+    def _pattern(self):
+        """返回与矩阵同结构、值全为1的矩阵，用于统计轨迹段数量"""
+        m = self.matrix
+        return sparse.csr_matrix((np.ones(m.nnz), m.indices, m.indptr), shape=m.shape)
+
+    def aggregate(self, order_mask=None):
+        """
+        按网格汇总所选订单的轨迹段数量和里程
+
+        Args:
+            order_mask (np.ndarray, optional): 长度为订单数的布尔数组，默认汇总全部订单
+
+        Returns:
+            tuple: (网格轨迹段数量数组, 网格总里程数组)，按 grid_ids 顺序排列
+        """
+        if order_mask is None:
+            weights = np.ones(self.matrix.shape[0])
+        else:
+            weights = np.asarray(order_mask, dtype=np.float64)
+        counts = self._pattern().T @ weights
+        totals = self.matrix.T @ weights
+        return np.rint(counts).astype(np.int64), totals
+
+    def time_mask(self, start, end):
+        """
+        选出开始时间落在一天中 [start, end) 范围内的订单
+
+        Args:
+            start: 起始时间，'HH:MM' 字符串或小时数
+            end: 结束时间，'HH:MM' 字符串或小时数
+
+        Returns:
+            np.ndarray: 布尔数组
+        """
+        times = pd.DatetimeIndex(self.start_times)
+        minutes = (times.hour * 60 + times.minute).to_numpy(dtype=np.float64, na_value=np.nan)
+        return (minutes >= parse_time_of_day(start)) & (minutes < parse_time_of_day(end))
+
+    def trip_lengths(self):
+        """
+        计算每个订单在网格内的总长度（即落在渔网范围内的轨迹长度）
+
+        Returns:
+            np.ndarray: 每个订单的长度（米）
+        """
+        return np.asarray(self.matrix.sum(axis=1)).ravel()
+
+    def save(self, path):
+        """
+        保存为压缩的npz文件
+
+        Args:
+            path (str): 输出路径
+        """
+        m = self.matrix
+        np.savez_compressed(path, data=m.data, indices=m.indices, indptr=m.indptr,
+                            shape=np.asarray(m.shape), order_ids=self.order_ids,
+                            start_times=self.start_times, grid_ids=self.grid_ids)
+
+    @classmethod
+    def load(cls, path):
+        """
+        从npz文件加载关联矩阵
+
+        Args:
+            path (str): 文件路径
+
+        Returns:
+            OrderGridIncidence: 关联矩阵对象
+        """
+        with np.load(path, allow_pickle=False) as data:
+            matrix = sparse.csr_matrix((data['data'], data['indices'], data['indptr']),
+                                       shape=tuple(data['shape']))
+            return cls(matrix, data['order_ids'], data['start_times'], data['grid_ids'])
+
+
+def _plain_array(values):
+    """将object类型的ID数组转换为定长字符串数组，使npz无需pickle即可保存"""
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = values.astype(str)
+    return values
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+GPS轨迹点折线里程工具
+功能：将全天共享单车GPS轨迹点（共享单车编号、经度、纬度、获取时间）按单车哈希分区落盘，
+每个分区整体按 (单车, 时间) 排序后，用一次相邻差分得到同一单车相邻两点构成的轨迹线段，
+线段再交给网格遍历引擎分配里程。全程按列数组处理，不存在逐单车的Python循环，
+分区保证同一单车的全部轨迹点落在同一分区内，跨读取分块的相邻点不会丢失
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+# 轨迹点CSV中参与计算的列
+PING_COLUMNS = ['共享单车编号', '经度', '纬度', '获取时间']
+
+
+def bike_keys(bike_ids):
+    """
+    将单车编号映射为64位哈希键，同一编号在不同分块中得到相同的键
+
+    Args:
+        bike_ids (array-like): 单车编号
+
+    Returns:
+        np.ndarray: uint64键数组
+    """
+    return pd.util.hash_array(np.asarray(bike_ids, dtype=str).astype(object))
+
+
+def partition_pings(ping_path, work_dir, transformer, n_partitions=16, chunk_size=2000000):
+    """
+    分块读取轨迹点文件，投影后按单车哈希写入分区文件
+
+    Args:
+        ping_path (str): 轨迹点CSV文件路径
+        work_dir (str): 分区文件目录
+        transformer (pyproj.Transformer): 经纬度到渔网坐标系的转换器（always_xy）
+        n_partitions (int): 分区数，单个分区需能整体读入内存
+        chunk_size (int): 每块读取的轨迹点数
+
+    Returns:
+        tuple: (每个分区的文件路径列表, 读取的轨迹点数, 有效轨迹点数)
+    """
+    partitions = [[] for _ in range(n_partitions)]
+    num_read = 0
+    num_valid = 0
+
+    reader = pd.read_csv(ping_path, usecols=PING_COLUMNS, dtype={'共享单车编号': str},
+                         chunksize=chunk_size)
+    for chunk_index, chunk in enumerate(reader):
+        num_read += len(chunk)
+        lon = pd.to_numeric(chunk['经度'], errors='coerce').to_numpy()
+        lat = pd.to_numeric(chunk['纬度'], errors='coerce').to_numpy()
+        times = pd.to_datetime(chunk['获取时间'], errors='coerce', format='ISO8601')
+        valid = (np.isfinite(lon) & np.isfinite(lat) & times.notna().to_numpy()
+                 & chunk['共享单车编号'].notna().to_numpy())
+        num_valid += int(valid.sum())
+
+        keys = bike_keys(chunk['共享单车编号'].to_numpy()[valid])
+        seconds = times.to_numpy()[valid].astype('datetime64[s]').astype(np.int64)
+        x, y = transformer.transform(lon[valid], lat[valid])
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+
+        # 按分区号排序后切片，每个分区一次写出
+        part = (keys % np.uint64(n_partitions)).astype(np.int64)
+        order = np.argsort(part, kind='stable')
+        bounds = np.searchsorted(part[order], np.arange(n_partitions + 1))
+        for p in np.flatnonzero(np.diff(bounds)):
+            rows = order[bounds[p]:bounds[p + 1]]
+            path = os.path.join(work_dir, f'part_{p:03d}_{chunk_index:05d}.npz')
+            np.savez(path, keys=keys[rows], seconds=seconds[rows], x=x[rows], y=y[rows])
+            partitions[p].append(path)
+
+    return partitions, num_read, num_valid
+
+
+def load_partition(paths):
+    """
+    读取一个分区的全部文件，并按 (单车, 时间) 排序
+
+    Args:
+        paths (list): 分区文件路径列表
+
+    Returns:
+        tuple: (单车键, 时间秒数, X坐标, Y坐标)，均已排序
+    """
+    columns = {name: [] for name in ('keys', 'seconds', 'x', 'y')}
+    for path in paths:
+        with np.load(path) as data:
+            for name in columns:
+                columns[name].append(data[name])
+    keys, seconds, x, y = (np.concatenate(columns[name]) for name in ('keys', 'seconds', 'x', 'y'))
+    order = np.lexsort((seconds, keys))
+    return keys[order], seconds[order], x[order], y[order]
+
+
+def ping_segments(keys, seconds, x, y, max_gap_seconds=600, max_speed=30 / 3.6, min_length=1e-6):
+    """
+    由已排序的轨迹点生成相邻两点构成的轨迹线段
+
+    同一单车相邻两点构成一条线段；时间间隔超过 max_gap_seconds 视为轨迹中断，
+    隐含速度超过 max_speed 视为定位漂移，长度不足 min_length 视为停放，均不生成线段
+
+    Args:
+        keys (np.ndarray): 单车键（已按单车、时间排序）
+        seconds (np.ndarray): 获取时间（秒）
+        x, y (np.ndarray): 投影坐标
+        max_gap_seconds (float): 最大时间间隔（秒）
+        max_speed (float): 最大速度（米/秒），None表示不限制
+        min_length (float): 最小线段长度（米）
+
+    Returns:
+        tuple: (起点X, 起点Y, 终点X, 终点Y, 起点时间秒数, 骑行编号)；换车或轨迹中断处开始新的骑行，
+            骑行编号只在本次输入内唯一
+    """
+    dt = np.diff(seconds)
+    lengths = np.hypot(np.diff(x), np.diff(y))
+    same_bike = keys[1:] == keys[:-1]
+    keep = same_bike & (dt > 0) & (dt <= max_gap_seconds) & (lengths >= min_length)
+    if max_speed is not None:
+        keep &= lengths <= max_speed * dt
+
+    # 漂移点和停放只丢弃线段，不切断骑行
+    trip = np.concatenate([[0], np.cumsum(~same_bike | (dt > max_gap_seconds))])
+    start = np.flatnonzero(keep)
+    return x[start], y[start], x[start + 1], y[start + 1], seconds[start], trip[start]
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+投影坐标缓存工具
+功能：按 源坐标列内容 + 坐标系对 的哈希值缓存投影结果，以 .npy 附属文件保存在源文件旁的
+.projection_cache 目录中。订单、POI、路网等脚本重复运行或下游脚本再次投影同一份数据时，
+直接以内存映射方式读取缓存，无需重新投影；源数据或坐标系变化时哈希随之变化，自动重新计算
+"""
+
+import glob
+import hashlib
+import os
+
+import numpy as np
+import pyproj
+import shapely
+
+from coordinate_transformer import CoordinateTransformer
+
+# 缓存格式版本，格式变化时递增使旧缓存失效
+CACHE_VERSION = b'projection-cache-v1'
+
+
+class ProjectionCache:
+    """以内容哈希为键的投影坐标缓存"""
+
+    def __init__(self, coord_transformer=None, cache_dirname='.projection_cache'):
+        """
+        初始化缓存
+
+        Args:
+            coord_transformer (CoordinateTransformer, optional): 实际执行投影的转换器，默认新建
+            cache_dirname (str): 源文件旁缓存目录的名称
+        """
+        self.coord_transformer = coord_transformer or CoordinateTransformer()
+        self.cache_dirname = cache_dirname
+
+    @staticmethod
+    def cache_key(xs, ys, source_crs, target_crs):
+        """
+        计算源坐标数组和坐标系对的哈希键
+
+        Args:
+            xs, ys (np.ndarray): 源坐标（float64）
+            source_crs: 源坐标系
+            target_crs: 目标坐标系
+
+        Returns:
+            str: 十六进制哈希值
+        """
+        digest = hashlib.blake2b(CACHE_VERSION, digest_size=16)
+        for crs in (source_crs, target_crs):
+            digest.update(pyproj.CRS.from_user_input(crs).to_wkt().encode('utf-8'))
+        digest.update(np.int64(len(xs)).tobytes())
+        digest.update(np.ascontiguousarray(xs, dtype=np.float64).data)
+        digest.update(np.ascontiguousarray(ys, dtype=np.float64).data)
+        return digest.hexdigest()
+
+    def _cache_path(self, source_path, tag, key):
+        """返回缓存文件路径：<源文件目录>/<缓存目录>/<源文件名>.<标签>.<哈希>.npy"""
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(source_path)), self.cache_dirname)
+        return os.path.join(cache_dir, f'{os.path.basename(source_path)}.{tag}.{key}.npy')
+
+    def _store(self, path, coords):
+        """原子写入缓存文件，并删除同一源文件、同一标签下已过期的旧缓存"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        prefix = path[:path.rindex('.', 0, len(path) - len('.npy'))]
+        for stale in glob.glob(glob.escape(prefix) + '.*.npy'):
+            if stale != path:
+                os.remove(stale)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, coords)
+        os.replace(tmp_path, path)
+
+    def transform(self, xs, ys, source_path=None, source_crs='EPSG:4326', target_crs='EPSG:4547', tag='xy'):
+        """
+        投影一组坐标，命中缓存时以内存映射方式读取
+
+        Args:
+            xs, ys (array-like): 源坐标（经度、纬度）
+            source_path (str, optional): 坐标所属的源文件，缓存保存在其旁边；为None时不使用缓存
+            source_crs: 源坐标系
+            target_crs: 目标坐标系
+            tag (str): 同一源文件中区分不同坐标列的标签（如 'start'、'end'）
+
+        Returns:
+            tuple: (x数组, y数组)，命中缓存时为只读内存映射数组
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if source_path is None:
+            transformer = self.coord_transformer.get_transformer(source_crs, target_crs)
+            return self.coord_transformer.batch_transform_coordinates(transformer, xs, ys)
+
+        path = self._cache_path(source_path, tag, self.cache_key(xs, ys, source_crs, target_crs))
+        if os.path.exists(path):
+            coords = np.load(path, mmap_mode='r')
+            return coords[0], coords[1]
+
+        transformer = self.coord_transformer.get_transformer(source_crs, target_crs)
+        out_x, out_y = self.coord_transformer.batch_transform_coordinates(transformer, xs, ys)
+        self._store(path, np.vstack([out_x, out_y]))
+        return out_x, out_y
+
+    def transform_geometries(self, geometries, source_path=None, source_crs='EPSG:4326',
+                             target_crs='EPSG:4547', tag='geometry'):
+        """
+        投影一组几何对象（如路网线要素）的全部顶点，命中缓存时直接读取投影后的顶点
+
+        Args:
+            geometries (array-like): shapely几何数组
+            source_path (str, optional): 几何所属的源文件；为None时不使用缓存
+            source_crs: 源坐标系
+            target_crs: 目标坐标系
+            tag (str): 缓存标签
+
+        Returns:
+            np.ndarray: 投影后的几何数组
+        """
+        geometries = np.asarray(geometries, dtype=object)
+        coords = shapely.get_coordinates(geometries)
+        x, y = self.transform(coords[:, 0], coords[:, 1], source_path, source_crs, target_crs, tag)
+        projected = np.column_stack([x, y])
+        return shapely.transform(geometries, lambda _: projected)
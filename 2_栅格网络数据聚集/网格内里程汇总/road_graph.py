@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+路网图构建工具
+功能：将路网线要素（西安市路网_转换后.shp）转换为无向加权图，
+顶点按吸附后的坐标去重为整数节点ID，边为相邻顶点之间的直线段，边权为长度（米），
+每条边记录所属道路的等级（fclass），每个节点记录所在网格ID。
+构建结果以 .npy 文件保存在路网文件旁的 .road_graph_cache 目录中，再次运行时以内存映射方式加载
+"""
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyproj
+import shapely
+from scipy import sparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '西安市500米渔网'))
+from hex_grid import grid_index_from_gdf
+
+# 共享单车无法通行的道路等级（OSM fclass）
+DEFAULT_EXCLUDED_FCLASSES = ('motorway', 'motorway_link')
+
+# 缓存格式版本，格式变化时递增使旧缓存失效
+GRAPH_CACHE_VERSION = b'road-graph-cache-v2'
+
+# 路网图中以 .npy 文件保存的数组
+GRAPH_ARRAYS = ('node_x', 'node_y', 'indptr', 'indices', 'length', 'edge_fclass', 'node_grid')
+
+
+class RoadGraph:
+    """路网无向图：节点坐标 + CSR邻接矩阵（值为边长）+ 边的道路等级 + 节点所在网格"""
+
+    def __init__(self, node_x, node_y, adjacency, edge_fclass=None, fclass_names=(), node_grid=None,
+                 snap_tolerance=None):
+        """
+        初始化路网图
+
+        Args:
+            node_x (np.ndarray): 节点X坐标
+            node_y (np.ndarray): 节点Y坐标
+            adjacency (scipy.sparse.csr_matrix): 对称邻接矩阵，值为边长（米）
+            edge_fclass (np.ndarray, optional): 每条有向边的道路等级编号（按CSR存储顺序），-1 表示未知
+            fclass_names (sequence): 道路等级名称，下标即 edge_fclass 中的编号
+            node_grid (np.ndarray, optional): 每个节点所在的网格ID，不在任何网格内时为 -1
+            snap_tolerance (float, optional): 构建时使用的顶点吸附精度（米）
+        """
+        self.node_x = node_x
+        self.node_y = node_y
+        self.adjacency = adjacency
+        self.n_nodes = len(node_x)
+        if edge_fclass is None:
+            edge_fclass = np.full(adjacency.nnz, -1, dtype=np.int16)
+        self.edge_fclass = edge_fclass
+        self.fclass_names = list(fclass_names)
+        self.node_grid = node_grid
+        self.snap_tolerance = snap_tolerance
+
+    @classmethod
+    def from_roads(cls, roads_gdf, snap_tolerance=0.5, excluded_fclasses=DEFAULT_EXCLUDED_FCLASSES):
+        """
+        由路网GeoDataFrame构建路网图
+
+        Args:
+            roads_gdf (gpd.GeoDataFrame): 路网数据（投影坐标系）
+            snap_tolerance (float): 顶点吸附精度（米），落在同一吸附格内的顶点视为同一节点
+            excluded_fclasses (tuple): 排除的道路等级
+
+        Returns:
+            RoadGraph: 路网图
+        """
+        if excluded_fclasses and 'fclass' in roads_gdf.columns:
+            roads_gdf = roads_gdf[~roads_gdf['fclass'].isin(excluded_fclasses)]
+
+        node_x, node_y, edge_u, edge_v, edge_line = _vertex_edges(roads_gdf.geometry.values, snap_tolerance)
+        lengths = np.hypot(node_x[edge_u] - node_x[edge_v], node_y[edge_u] - node_y[edge_v])
+
+        if 'fclass' in roads_gdf.columns:
+            codes, fclass_names = _factorize(roads_gdf['fclass'])
+            edge_codes = codes[edge_line]
+        else:
+            fclass_names = []
+            edge_codes = np.full(len(edge_u), -1, dtype=np.int16)
+        adjacency, edge_fclass = _symmetric_adjacency(edge_u, edge_v, lengths, len(node_x), edge_codes)
+        return cls(node_x, node_y, adjacency, edge_fclass, fclass_names, snap_tolerance=snap_tolerance)
+
+    def edge_keys(self):
+        """
+        返回CSR中每条有向边的键 u * n_nodes + v（按CSR存储顺序，单调递增），用于按端点查找边位置
+
+        Returns:
+            np.ndarray: int64键数组
+        """
+        rows = np.repeat(np.arange(self.n_nodes, dtype=np.int64), np.diff(self.adjacency.indptr))
+        return rows * self.n_nodes + self.adjacency.indices
+
+    def degrees(self):
+        """
+        返回每个节点的度（相邻节点数），度≥3的节点即道路交叉口
+
+        Returns:
+            np.ndarray: 节点度数组
+        """
+        return np.diff(self.adjacency.indptr)
+
+    def assign_grid(self, grid_index):
+        """
+        计算每个节点所在的网格ID
+
+        Args:
+            grid_index (FishnetIndex or HexGridIndex): 网格索引（见 hex_grid.grid_index_from_gdf）
+
+        Returns:
+            np.ndarray: 节点所在网格ID，不在任何网格内时为 -1
+        """
+        self.node_grid = np.asarray(grid_index.grid_id(self.node_x, self.node_y), dtype=np.int64)
+        return self.node_grid
+
+    def save(self, path):
+        """
+        以一组 .npy 文件加 meta.json 保存到目录，便于内存映射加载
+
+        Args:
+            path (str): 输出目录
+        """
+        os.makedirs(path, exist_ok=True)
+        node_grid = self.node_grid if self.node_grid is not None else np.empty(0, dtype=np.int64)
+        arrays = {
+            'node_x': self.node_x, 'node_y': self.node_y,
+            'indptr': self.adjacency.indptr, 'indices': self.adjacency.indices, 'length': self.adjacency.data,
+            'edge_fclass': self.edge_fclass, 'node_grid': node_grid,
+        }
+        for name in GRAPH_ARRAYS:
+            np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(arrays[name]))
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'n_nodes': int(self.n_nodes), 'n_edges': int(self.adjacency.nnz),
+                       'fclass_names': self.fclass_names, 'snap_tolerance': self.snap_tolerance},
+                      f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        从目录加载路网图
+
+        Args:
+            path (str): save 输出的目录
+            mmap_mode (str, optional): 传给 np.load 的内存映射模式，None 时读入内存
+
+        Returns:
+            RoadGraph: 路网图，数组默认为只读内存映射
+        """
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode) for name in GRAPH_ARRAYS}
+        n_nodes = meta['n_nodes']
+        adjacency = sparse.csr_matrix((arrays['length'], arrays['indices'], arrays['indptr']),
+                                      shape=(n_nodes, n_nodes), copy=False)
+        node_grid = arrays['node_grid'] if len(arrays['node_grid']) == n_nodes else None
+        return cls(arrays['node_x'], arrays['node_y'], adjacency, arrays['edge_fclass'],
+                   meta['fclass_names'], node_grid, meta['snap_tolerance'])
+
+    @classmethod
+    def load_or_build(cls, road_path, target_crs=None, grid_gdf=None, id_col='grid_id', snap_tolerance=0.5,
+                      excluded_fclasses=DEFAULT_EXCLUDED_FCLASSES, cache_dirname='.road_graph_cache'):
+        """
+        加载路网文件对应的缓存路网图，缓存不存在或已过期时读取路网文件重新构建并写入缓存
+
+        缓存键由路网文件（及同名附属文件）的大小和修改时间、目标坐标系、构建参数和网格几何共同决定，
+        任一变化都会重新构建
+
+        Args:
+            road_path (str): 路网文件路径（如西安市路网_转换后.shp）
+            target_crs (optional): 路网图使用的投影坐标系，默认与网格一致（无网格时保持路网原坐标系）
+            grid_gdf (gpd.GeoDataFrame, optional): 网格数据，提供时计算节点所在网格ID
+            id_col (str): 网格ID列名
+            snap_tolerance (float): 顶点吸附精度（米）
+            excluded_fclasses (tuple): 排除的道路等级
+            cache_dirname (str): 路网文件旁缓存目录的名称
+
+        Returns:
+            RoadGraph: 路网图
+        """
+        if target_crs is None and grid_gdf is not None:
+            target_crs = grid_gdf.crs
+        key = _graph_cache_key(road_path, target_crs, grid_gdf, id_col, snap_tolerance, excluded_fclasses)
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(road_path)), cache_dirname)
+        path = os.path.join(cache_dir, f'{os.path.basename(road_path)}.{key}')
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            return cls.load(path)
+
+        roads = gpd.read_file(road_path)
+        if target_crs is not None and roads.crs != target_crs:
+            roads = roads.to_crs(target_crs)
+        graph = cls.from_roads(roads, snap_tolerance, excluded_fclasses)
+        if grid_gdf is not None:
+            graph.assign_grid(grid_index_from_gdf(grid_gdf, id_col=id_col))
+
+        # 先写临时目录再整体替换，并删除同一路网文件已过期的旧缓存
+        os.makedirs(cache_dir, exist_ok=True)
+        for stale in glob.glob(os.path.join(glob.escape(cache_dir), glob.escape(os.path.basename(road_path)) + '.*')):
+            if stale != path:
+                shutil.rmtree(stale, ignore_errors=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        graph.save(tmp_path)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            # 其他进程已写入同一缓存
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        return graph
+
+
+def _graph_cache_key(road_path, target_crs, grid_gdf, id_col, snap_tolerance, excluded_fclasses):
+    """
+    计算路网图缓存键
+
+    Returns:
+        str: 十六进制哈希值
+    """
+    digest = hashlib.blake2b(GRAPH_CACHE_VERSION, digest_size=16)
+    stem = os.path.splitext(road_path)[0]
+    for ext in ('', '.shp', '.dbf', '.shx', '.prj', '.cpg'):
+        source = road_path if ext == '' else stem + ext
+        if os.path.exists(source):
+            stat = os.stat(source)
+            digest.update(f'{ext}:{stat.st_size}:{stat.st_mtime_ns};'.encode('utf-8'))
+    if target_crs is not None:
+        digest.update(pyproj.CRS.from_user_input(target_crs).to_wkt().encode('utf-8'))
+    digest.update(f'{snap_tolerance!r};{sorted(excluded_fclasses or ())!r}'.encode('utf-8'))
+    if grid_gdf is not None:
+        digest.update(np.ascontiguousarray(grid_gdf[id_col].to_numpy(), dtype=np.int64).data)
+        for wkb in shapely.to_wkb(grid_gdf.geometry.values):
+            digest.update(wkb)
+    return digest.hexdigest()
+
+
+def snap_coordinates(coords, snap_tolerance):
+    """
+    将坐标按吸附精度取整，落在同一吸附格内的点取整结果相同（路网节点去重与交叉口去重共用）
+
+    Args:
+        coords (np.ndarray): (n, 2) 坐标数组
+        snap_tolerance (float): 吸附精度（米）
+
+    Returns:
+        np.ndarray: (n, 2) int64吸附格坐标
+    """
+    return np.round(np.asarray(coords, dtype=np.float64) / snap_tolerance).astype(np.int64)
+
+
+def _factorize(values):
+    """
+    将道路等级编码为整数
+
+    Returns:
+        tuple: (编号数组（缺失值为 -1）, 等级名称列表)
+    """
+    codes, names = pd.factorize(values)
+    return codes.astype(np.int16), [str(name) for name in names]
+
+
+def _vertex_edges(geometries, snap_tolerance):
+    """
+    将线几何拆分为相邻顶点组成的边，并按吸附坐标对顶点去重
+
+    Args:
+        geometries (np.ndarray): 线几何数组（LineString/MultiLineString）
+        snap_tolerance (float): 吸附精度（米）
+
+    Returns:
+        tuple: (节点X, 节点Y, 边起点节点ID, 边终点节点ID, 边所属线要素编号)
+    """
+    parts, part_line = shapely.get_parts(np.asarray(geometries, dtype=object), return_index=True)
+    is_line = shapely.get_type_id(parts) == shapely.GeometryType.LINESTRING
+    parts, part_line = parts[is_line], part_line[is_line]
+    coords, part_index = shapely.get_coordinates(parts, return_index=True)
+
+    # 按吸附格去重，得到整数节点ID
+    _, first, node_of_vertex = np.unique(snap_coordinates(coords, snap_tolerance), axis=0,
+                                         return_index=True, return_inverse=True)
+    node_of_vertex = node_of_vertex.ravel()
+    node_x = coords[first, 0]
+    node_y = coords[first, 1]
+
+    # 同一条线内相邻顶点构成边，去掉吸附后退化的自环
+    same_part = part_index[1:] == part_index[:-1]
+    edge_u = node_of_vertex[:-1][same_part]
+    edge_v = node_of_vertex[1:][same_part]
+    edge_line = part_line[part_index[:-1][same_part]]
+    keep = edge_u != edge_v
+    return node_x, node_y, edge_u[keep], edge_v[keep], edge_line[keep]
+
+
+def _symmetric_adjacency(edge_u, edge_v, lengths, n_nodes, edge_fclass):
+    """
+    构建对称CSR邻接矩阵，同一节点对存在多条边时保留最短的一条
+
+    Args:
+        edge_u, edge_v (np.ndarray): 边端点节点ID
+        lengths (np.ndarray): 边长
+        n_nodes (int): 节点数
+        edge_fclass (np.ndarray): 边的道路等级编号
+
+    Returns:
+        tuple: (邻接矩阵 scipy.sparse.csr_matrix, 按CSR存储顺序排列的道路等级编号)
+    """
+    rows = np.concatenate([edge_u, edge_v]).astype(np.int64)
+    cols = np.concatenate([edge_v, edge_u]).astype(np.int64)
+    weights = np.concatenate([lengths, lengths])
+    fclass = np.concatenate([edge_fclass, edge_fclass])
+
+    # 按 (起点, 终点, 长度) 排序后取每个节点对的第一条，即最短边
+    order = np.lexsort((weights, cols, rows))
+    rows, cols, weights, fclass = rows[order], cols[order], weights[order], fclass[order]
+    first = np.concatenate([[True], (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])])
+    rows, cols, weights, fclass = rows[first], cols[first], weights[first], fclass[first]
+
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n_nodes))])
+    return sparse.csr_matrix((weights, cols, indptr), shape=(n_nodes, n_nodes)), fclass
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+道路交叉口识别工具
+功能：基于路网图（road_graph.RoadGraph，端点吸附、节点去重和节点度均由路网图给出）识别交叉口。
+连接3个及以上不同相邻节点的节点即交叉口；没有共享节点的几何相交（如道路在非顶点处交叉、
+支路端点落在主路线段中间）只在空间索引给出的候选边对中向量化求交点。
+交叉口再用格点索引直接定位到网格，得到网格交叉口数量和密度
+"""
+
+import os
+import sys
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from road_graph import snap_coordinates
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '西安市500米渔网'))
+from hex_grid import grid_index_from_gdf
+
+
+def _cross(ax, ay, bx, by):
+    """二维叉积"""
+    return ax * by - ay * bx
+
+
+def _candidate_crossings(node_x, node_y, edge_u, edge_v, degrees, snap_tolerance, batch_size):
+    """
+    在空间索引候选边对中查找不共享节点的相交点
+
+    空间索引只按外包矩形给出候选对，是否相交及交点位置用向量化的参数方程计算。
+    只保留交点至少位于一条边内部（距两端都大于吸附精度）的情况：两条边内部相交为十字交叉，
+    一条边的端点落在另一条边内部为丁字交叉。共享节点的边对以及平行（含共线重叠）的边对不计
+
+    Returns:
+        tuple: (交点X, 交点Y, 交点连接的道路分支数)
+    """
+    x0, y0 = node_x[edge_u], node_y[edge_u]
+    x1, y1 = node_x[edge_v], node_y[edge_v]
+    segments = shapely.linestrings(np.stack([np.column_stack([x0, y0]), np.column_stack([x1, y1])], axis=1))
+    tree = shapely.STRtree(segments)
+    lengths = np.hypot(x1 - x0, y1 - y0)
+
+    out_x, out_y, out_arms = [], [], []
+    for batch_start in range(0, len(segments), batch_size):
+        batch = np.arange(batch_start, min(batch_start + batch_size, len(segments)))
+        query_pos, other = tree.query(segments[batch])
+        first = batch[query_pos]
+        keep = ((first < other)
+                & (edge_u[first] != edge_u[other]) & (edge_u[first] != edge_v[other])
+                & (edge_v[first] != edge_u[other]) & (edge_v[first] != edge_v[other]))
+        i, j = first[keep], other[keep]
+
+        rx, ry = x1[i] - x0[i], y1[i] - y0[i]
+        sx, sy = x1[j] - x0[j], y1[j] - y0[j]
+        qx, qy = x0[j] - x0[i], y0[j] - y0[i]
+        denom = _cross(rx, ry, sx, sy)
+        not_parallel = np.abs(denom) > 1e-12 * lengths[i] * lengths[j]
+        i, j, rx, ry, sx, sy, qx, qy, denom = (a[not_parallel] for a in (i, j, rx, ry, sx, sy, qx, qy, denom))
+        t = _cross(qx, qy, sx, sy) / denom
+        u = _cross(qx, qy, rx, ry) / denom
+
+        # 交点需落在两条边上
+        hit = (t >= 0.0) & (t <= 1.0) & (u >= 0.0) & (u <= 1.0)
+        i, j, rx, ry, t, u = (a[hit] for a in (i, j, rx, ry, t, u))
+        eps_i = snap_tolerance / lengths[i]
+        eps_j = snap_tolerance / lengths[j]
+
+        # 交点在边内部时连接两个分支，落在边端点时连接该端点节点的全部分支
+        inner_i = (t > eps_i) & (t < 1.0 - eps_i)
+        inner_j = (u > eps_j) & (u < 1.0 - eps_j)
+        end_i = np.where(t < 0.5, edge_u[i], edge_v[i])
+        end_j = np.where(u < 0.5, edge_u[j], edge_v[j])
+        crossing = inner_i | inner_j
+        out_x.append((x0[i] + t * rx)[crossing])
+        out_y.append((y0[i] + t * ry)[crossing])
+        out_arms.append((np.where(inner_i, 2, degrees[end_i]) + np.where(inner_j, 2, degrees[end_j]))[crossing])
+
+    if not out_x:
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int64)
+    return np.concatenate(out_x), np.concatenate(out_y), np.concatenate(out_arms)
+
+
+def find_intersections(graph, include_crossings=True, batch_size=200000, crs=None):
+    """
+    识别路网交叉口
+
+    Args:
+        graph (RoadGraph): 路网图（见 RoadGraph.load_or_build，投影坐标系）
+        include_crossings (bool): 是否同时识别不共享节点的几何相交（立交桥等也会被计入）
+        batch_size (int): 每批查询空间索引的边数，用于控制候选对数组的内存占用
+        crs: 输出坐标系
+
+    Returns:
+        gpd.GeoDataFrame: 交叉口点，含 x、y、degree（连接的道路分支数）、source（'node' 拓扑节点、
+            'crossing' 几何相交）列，按吸附坐标去重
+    """
+    node_x = np.asarray(graph.node_x)
+    node_y = np.asarray(graph.node_y)
+    degrees = np.asarray(graph.degrees())
+    is_junction = degrees >= 3
+
+    xs = [node_x[is_junction]]
+    ys = [node_y[is_junction]]
+    arms = [degrees[is_junction]]
+    sources = [np.full(is_junction.sum(), 'node', dtype=object)]
+    if include_crossings and graph.adjacency.nnz:
+        # 对称邻接矩阵中每条无向边取 u < v 的一条
+        keys = graph.edge_keys()
+        edge_u, edge_v = keys // graph.n_nodes, keys % graph.n_nodes
+        upper = edge_u < edge_v
+        cx, cy, carms = _candidate_crossings(node_x, node_y, edge_u[upper], edge_v[upper], degrees,
+                                             graph.snap_tolerance, batch_size)
+        xs.append(cx)
+        ys.append(cy)
+        arms.append(carms)
+        sources.append(np.full(len(cx), 'crossing', dtype=object))
+
+    result = pd.DataFrame({
+        'x': np.concatenate(xs),
+        'y': np.concatenate(ys),
+        'degree': np.concatenate(arms).astype(np.int64),
+        'source': np.concatenate(sources),
+    })
+
+    # 同一位置被多个边对检测到时只保留一个（拓扑节点优先）
+    snapped = snap_coordinates(result[['x', 'y']].to_numpy(), graph.snap_tolerance)
+    _, first = np.unique(snapped, axis=0, return_index=True)
+    result = result.iloc[np.sort(first)].reset_index(drop=True)
+    return gpd.GeoDataFrame(result, geometry=gpd.points_from_xy(result['x'], result['y']), crs=crs)
+
+
+def count_by_grid(x, y, grid_gdf, id_col='grid_id'):
+    """
+    统计每个网格内的交叉口数量和密度
+
+    Args:
+        x, y (array-like): 交叉口坐标（与网格同一投影坐标系）
+        grid_gdf (gpd.GeoDataFrame): 网格数据
+        id_col (str): 网格ID列名
+
+    Returns:
+        pd.DataFrame: grid_id、intersection_count、intersection_density（个/km²），包含全部网格
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n_grids = len(grid_gdf)
+    try:
+        pos = grid_index_from_gdf(grid_gdf, id_col=id_col).locate(x, y)
+    except ValueError as e:
+        print(f"警告: 网格不是规则网格，使用空间连接统计交叉口: {e}")
+        points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(x, y), crs=grid_gdf.crs)
+        joined = gpd.sjoin(points, grid_gdf[['geometry']].reset_index(drop=True), predicate='within')
+        joined = joined[~joined.index.duplicated()]
+        pos = np.full(len(x), -1, dtype=np.int64)
+        pos[joined.index.to_numpy()] = joined['index_right'].to_numpy()
+
+    counts = np.bincount(pos[pos >= 0], minlength=n_grids)
+    area_km2 = grid_gdf.geometry.area.to_numpy() / 1e6
+    return pd.DataFrame({
+        'grid_id': grid_gdf[id_col].to_numpy(),
+        'intersection_count': counts,
+        'intersection_density': counts / area_km2,
+    })
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+路网路径轨迹还原工具
+功能：将订单起终点吸附到路网节点，按最短路径还原骑行轨迹，并把路径上每段道路的长度分配到网格。
+同一起点节点的所有终点在一次多目标最短路搜索中求解，结果按 (起点节点, 终点节点) 缓存，
+不同订单、不同时段复用同一路径时无需重复搜索
+"""
+
+import logging
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.spatial import cKDTree
+
+from grid_traversal import traverse_segments
+
+logger = logging.getLogger(__name__)
+
+
+class RoadNetworkRouter:
+    """基于路网最短路径的订单轨迹还原与网格里程分配"""
+
+    def __init__(self, road_graph, lattice, max_snap_distance=200.0, origin_batch_size=32,
+                 max_detour_ratio=2.0, detour_slack=1000.0):
+        """
+        初始化路径还原器
+
+        Args:
+            road_graph (RoadGraph): 路网图
+            lattice (RegularGridLattice): 规则网格，用于把道路线段分配到网格
+            max_snap_distance (float): 起终点到最近路网节点的最大吸附距离（米），超出时按直线处理
+            origin_batch_size (int): 每次多源最短路搜索同时处理的起点节点数
+            max_detour_ratio (float): 路径长度上限相对节点间直线距离的倍数
+            detour_slack (float): 路径长度上限的附加余量（米）；超过上限的节点对视为不可达，按直线处理
+        """
+        self.graph = road_graph
+        self.lattice = lattice
+        self.max_snap_distance = max_snap_distance
+        self.origin_batch_size = origin_batch_size
+        self.max_detour_ratio = max_detour_ratio
+        self.detour_slack = detour_slack
+        self.node_tree = cKDTree(np.column_stack([road_graph.node_x, road_graph.node_y]))
+        self.edge_keys = road_graph.edge_keys()
+        self.edge_grid = self._edge_grid_matrix()
+
+        # 路径缓存：按 起点节点 * 节点数 + 终点节点 排序的键，及对应的 路径 × 网格 长度矩阵
+        n_grids = len(lattice.grid_ids)
+        self.cache_keys = np.empty(0, dtype=np.int64)
+        self.cache_matrix = sparse.csr_matrix((0, n_grids))
+        self.cache_reachable = np.empty(0, dtype=bool)
+
+    def _edge_grid_matrix(self):
+        """
+        预先计算每条有向边在各网格内的长度
+
+        Returns:
+            scipy.sparse.csr_matrix: 边 × 网格 长度矩阵，行顺序与邻接矩阵的存储顺序一致
+        """
+        adjacency = self.graph.adjacency
+        u = np.repeat(np.arange(self.graph.n_nodes), np.diff(adjacency.indptr))
+        v = adjacency.indices
+        edge_index, grid_pos, lengths = traverse_segments(
+            self.lattice, self.graph.node_x[u], self.graph.node_y[u],
+            self.graph.node_x[v], self.graph.node_y[v]
+        )
+        return sparse.csr_matrix((lengths, (edge_index, grid_pos)),
+                                 shape=(adjacency.nnz, len(self.lattice.grid_ids)))
+
+    def snap(self, x, y):
+        """
+        将坐标吸附到最近的路网节点
+
+        Args:
+            x, y (np.ndarray): 投影坐标
+
+        Returns:
+            np.ndarray: 节点ID，超出最大吸附距离或坐标无效时为 -1
+        """
+        nodes = np.full(len(x), -1, dtype=np.int64)
+        valid = np.isfinite(x) & np.isfinite(y)
+        distance, index = self.node_tree.query(np.column_stack([x[valid], y[valid]]),
+                                               distance_upper_bound=self.max_snap_distance)
+        nodes[valid] = np.where(np.isfinite(distance), index, -1)
+        return nodes
+
+    def route_pairs(self, origins, destinations):
+        """
+        计算节点对之间最短路径在各网格内的长度，优先使用缓存
+
+        Args:
+            origins (np.ndarray): 起点节点ID
+            destinations (np.ndarray): 终点节点ID
+
+        Returns:
+            tuple: (路径 × 网格 长度矩阵, 是否可达布尔数组)，行与输入节点对一一对应
+        """
+        keys = origins.astype(np.int64) * self.graph.n_nodes + destinations
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+
+        cached = np.isin(unique_keys, self.cache_keys)
+        missing = unique_keys[~cached]
+        if len(missing):
+            logger.info(f"路径缓存命中{int(cached.sum())}个节点对，新搜索{len(missing)}个节点对")
+            self._search_and_cache(missing // self.graph.n_nodes, missing % self.graph.n_nodes)
+
+        rows = np.searchsorted(self.cache_keys, unique_keys)[inverse]
+        return self.cache_matrix[rows], self.cache_reachable[rows]
+
+    def _search_and_cache(self, origins, destinations):
+        """
+        按起点节点分组，批量执行多源多目标最短路搜索，并将结果写入缓存
+
+        Args:
+            origins (np.ndarray): 起点节点ID（已按起点排序）
+            destinations (np.ndarray): 终点节点ID
+        """
+        n_pairs = len(origins)
+        pair_edges = []
+        pair_ids = []
+        reachable = np.zeros(n_pairs, dtype=bool)
+
+        # 每个节点对的路径长度上限；起点按所需搜索半径排序分批，使每批的搜索半径尽量小
+        straight = np.hypot(self.graph.node_x[origins] - self.graph.node_x[destinations],
+                            self.graph.node_y[origins] - self.graph.node_y[destinations])
+        max_length = self.max_detour_ratio * straight + self.detour_slack
+        unique_origins, origin_group = np.unique(origins, return_inverse=True)
+        origin_radius = np.zeros(len(unique_origins))
+        np.maximum.at(origin_radius, origin_group, max_length)
+        origin_rank = np.empty(len(unique_origins), dtype=np.int64)
+        origin_rank[np.argsort(origin_radius, kind='stable')] = np.arange(len(unique_origins))
+        pair_rank = origin_rank[origin_group]
+        sorted_origins = unique_origins[np.argsort(origin_radius, kind='stable')]
+
+        for batch_start in range(0, len(sorted_origins), self.origin_batch_size):
+            batch_origins = sorted_origins[batch_start:batch_start + self.origin_batch_size]
+            in_batch = np.flatnonzero((pair_rank >= batch_start)
+                                      & (pair_rank < batch_start + len(batch_origins)))
+            row = pair_rank[in_batch] - batch_start
+            targets = destinations[in_batch]
+
+            dist, pred = csgraph.dijkstra(self.graph.adjacency, directed=True, indices=batch_origins,
+                                          return_predecessors=True, limit=max_length[in_batch].max())
+
+            ok = dist[row, targets] <= max_length[in_batch]
+            reachable[in_batch] = ok
+            edges, owners = self._walk_predecessors(pred, row[ok], targets[ok])
+            pair_edges.append(edges)
+            pair_ids.append(in_batch[ok][owners])
+
+        pair_edges = np.concatenate(pair_edges) if pair_edges else np.empty(0, dtype=np.int64)
+        pair_ids = np.concatenate(pair_ids) if pair_ids else np.empty(0, dtype=np.int64)
+        path_edges = sparse.csr_matrix((np.ones(len(pair_edges)), (pair_ids, pair_edges)),
+                                       shape=(n_pairs, self.graph.adjacency.nnz))
+        path_grid = (path_edges @ self.edge_grid).tocsr()
+
+        keys = origins.astype(np.int64) * self.graph.n_nodes + destinations
+        all_keys = np.concatenate([self.cache_keys, keys])
+        order = np.argsort(all_keys, kind='stable')
+        self.cache_keys = all_keys[order]
+        self.cache_matrix = sparse.vstack([self.cache_matrix, path_grid]).tocsr()[order]
+        self.cache_reachable = np.concatenate([self.cache_reachable, reachable])[order]
+
+    def _walk_predecessors(self, pred, rows, targets):
+        """
+        对一批路径同时沿前驱数组回溯，得到每条路径经过的边
+
+        Args:
+            pred (np.ndarray): dijkstra返回的前驱矩阵
+            rows (np.ndarray): 每条路径的起点在前驱矩阵中的行号
+            targets (np.ndarray): 每条路径的终点节点ID
+
+        Returns:
+            tuple: (边位置数组, 所属路径编号数组)
+        """
+        edges = []
+        owners = []
+        active = np.arange(len(targets))
+        current = targets.astype(np.int64)
+        while len(active):
+            previous = pred[rows[active], current]
+            step = previous >= 0
+            active, current, previous = active[step], current[step], previous[step]
+            edge_keys = previous.astype(np.int64) * self.graph.n_nodes + current
+            edges.append(np.searchsorted(self.edge_keys, edge_keys))
+            owners.append(active)
+            current = previous.astype(np.int64)
+        if not edges:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(edges), np.concatenate(owners)
+
+    def attribute_orders(self, start_x, start_y, end_x, end_y):
+        """
+        还原订单的路网轨迹并分配到网格
+
+        轨迹由 起点→起点吸附节点 的连接线、路网最短路径、终点吸附节点→终点 的连接线组成；
+        无法吸附、起终点吸附到同一节点或路网不连通的订单退回为OD直线
+
+        Args:
+            start_x, start_y, end_x, end_y (array-like): 起终点投影坐标
+
+        Returns:
+            tuple: (订单编号数组, 网格位置数组, 网格内长度数组)，与 traverse_segments 格式一致
+        """
+        x0 = np.asarray(start_x, dtype=np.float64)
+        y0 = np.asarray(start_y, dtype=np.float64)
+        x1 = np.asarray(end_x, dtype=np.float64)
+        y1 = np.asarray(end_y, dtype=np.float64)
+        n_orders = len(x0)
+        n_grids = len(self.lattice.grid_ids)
+
+        origin_nodes = self.snap(x0, y0)
+        dest_nodes = self.snap(x1, y1)
+        routable = (origin_nodes >= 0) & (dest_nodes >= 0) & (origin_nodes != dest_nodes)
+
+        routed = np.flatnonzero(routable)
+        path_grid, reachable = self.route_pairs(origin_nodes[routed], dest_nodes[routed])
+        routed_ok = routed[reachable]
+        path_grid = path_grid[reachable]
+
+        # 路网路径部分：订单 × 网格
+        order_select = sparse.csr_matrix((np.ones(len(routed_ok)), (routed_ok, np.arange(len(routed_ok)))),
+                                         shape=(n_orders, len(routed_ok)))
+        order_grid = order_select @ path_grid
+
+        # 连接线部分：起点→起点节点、终点节点→终点
+        nx = self.graph.node_x
+        ny = self.graph.node_y
+        seg_a, pos_a, len_a = traverse_segments(self.lattice, x0[routed_ok], y0[routed_ok],
+                                                nx[origin_nodes[routed_ok]], ny[origin_nodes[routed_ok]])
+        seg_b, pos_b, len_b = traverse_segments(self.lattice, nx[dest_nodes[routed_ok]], ny[dest_nodes[routed_ok]],
+                                                x1[routed_ok], y1[routed_ok])
+
+        # 其余订单退回为OD直线
+        straight = np.setdiff1d(np.arange(n_orders), routed_ok)
+        seg_c, pos_c, len_c = traverse_segments(self.lattice, x0[straight], y0[straight],
+                                                x1[straight], y1[straight])
+
+        connectors = sparse.csr_matrix(
+            (np.concatenate([len_a, len_b]),
+             (np.concatenate([routed_ok[seg_a], routed_ok[seg_b]]), np.concatenate([pos_a, pos_b]))),
+            shape=(n_orders, n_grids)
+        )
+        # 同一订单在同一网格的多段长度合并，保证每个 (订单, 网格) 只计一个轨迹段
+        combined = (order_grid + connectors).tocoo()
+        counted = combined.data > 1e-6
+        logger.info(f"路网还原{len(routed_ok)}条订单，退回直线{len(straight)}条订单")
+        return (np.concatenate([combined.row[counted].astype(np.int64), straight[seg_c]]),
+                np.concatenate([combined.col[counted].astype(np.int64), pos_c]),
+                np.concatenate([combined.data[counted], len_c]))
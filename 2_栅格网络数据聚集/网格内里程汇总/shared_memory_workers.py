@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+共享内存批处理工作进程
+功能：将渔网几何（WKB）和订单坐标数组一次性放入共享内存，
+工作进程只接收订单下标范围，在私有的稠密网格数组中累加结果，
+避免每个任务重复序列化整个分析器和GeoDataFrame
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+import shapely
+
+# 工作进程内的全局状态，由 init_worker 在进程启动时填充
+_worker_state = {}
+
+
+class SharedArrayPool:
+    """一组放在共享内存中的NumPy数组"""
+
+    def __init__(self, arrays):
+        """
+        将数组复制到新建的共享内存块中
+
+        Args:
+            arrays (dict): 名称 -> np.ndarray
+        """
+        self._blocks = []
+        self.spec = {}
+        try:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                self._blocks.append(block)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+                self.spec[name] = (block.name, array.shape, array.dtype.str)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        """关闭并释放所有共享内存块"""
+        for block in self._blocks:
+            block.close()
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def attach_arrays(spec):
+    """
+    在工作进程中按描述信息挂载共享内存数组
+
+    Args:
+        spec (dict): SharedArrayPool.spec
+
+    Returns:
+        tuple: (名称 -> np.ndarray, 共享内存块列表)，块列表需保持引用直到不再使用数组
+    """
+    arrays = {}
+    blocks = []
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return arrays, blocks
+
+
+def pack_geometries(geometries):
+    """
+    将几何对象编码为连续的WKB字节数组和偏移量数组，便于放入共享内存
+
+    Args:
+        geometries (array-like): shapely几何对象
+
+    Returns:
+        tuple: (uint8字节数组, int64偏移量数组)
+    """
+    wkb = shapely.to_wkb(np.asarray(geometries, dtype=object))
+    sizes = np.fromiter((len(item) for item in wkb), dtype=np.int64, count=len(wkb))
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    buffer = np.frombuffer(b''.join(wkb), dtype=np.uint8)
+    return buffer, offsets
+
+
+def unpack_geometries(buffer, offsets):
+    """
+    从WKB字节数组和偏移量数组还原几何对象
+
+    Args:
+        buffer (np.ndarray): uint8字节数组
+        offsets (np.ndarray): int64偏移量数组
+
+    Returns:
+        np.ndarray: shapely几何对象数组
+    """
+    raw = buffer.tobytes()
+    wkb = [raw[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+    return shapely.from_wkb(wkb)
+
+
+def init_worker(spec):
+    """
+    工作进程初始化：挂载共享内存并重建渔网几何与空间索引（每个进程只执行一次）
+
+    Args:
+        spec (dict): SharedArrayPool.spec，需包含 grid_wkb、grid_offsets、orders
+    """
+    arrays, blocks = attach_arrays(spec)
+    grid_geoms = unpack_geometries(arrays['grid_wkb'], arrays['grid_offsets'])
+    shapely.prepare(grid_geoms)
+    _worker_state['blocks'] = blocks
+    _worker_state['orders'] = arrays['orders']
+    _worker_state['grid_geoms'] = grid_geoms
+    _worker_state['tree'] = shapely.STRtree(grid_geoms)
+
+
+def process_range(start, end):
+    """
+    处理下标范围 [start, end) 内的订单，在私有稠密数组中累加每个网格的轨迹段数量和里程
+
+    订单坐标数组的列依次为 start_x、start_y、end_x、end_y；
+    统计口径与 GridTrajectoryAnalyzer.process_single_order 一致
+
+    Args:
+        start (int): 起始下标
+        end (int): 结束下标（不含）
+
+    Returns:
+        tuple: (网格轨迹段数量数组, 网格总里程数组, 出错订单数)
+    """
+    orders = _worker_state['orders']
+    grid_geoms = _worker_state['grid_geoms']
+    tree = _worker_state['tree']
+
+    counts = np.zeros(len(grid_geoms), dtype=np.int64)
+    totals = np.zeros(len(grid_geoms), dtype=np.float64)
+    error_count = 0
+
+    for sx, sy, ex, ey in orders[start:end]:
+        try:
+            if not np.isfinite([sx, sy, ex, ey]).all():
+                raise ValueError("订单坐标缺失")
+
+            start_point = shapely.points(sx, sy)
+            if np.hypot(ex - sx, ey - sy) < 1e-6:
+                # 零长度直线：计入包含或接触该点的网格，里程为零
+                candidates = tree.query(start_point, predicate='intersects')
+                counts[candidates] += 1
+                continue
+
+            line = shapely.linestrings([(sx, sy), (ex, ey)])
+            candidates = tree.query(line, predicate='intersects')
+            if len(candidates) == 0:
+                continue
+
+            lengths = shapely.length(shapely.intersection(line, grid_geoms[candidates]))
+            has_length = lengths > 1e-6
+            # 起点或终点刚好在网格边界上时，仍计入一个轨迹段
+            end_point = shapely.points(ex, ey)
+            touches_end = (shapely.contains(grid_geoms[candidates], start_point)
+                           | shapely.contains(grid_geoms[candidates], end_point))
+            counted = has_length | touches_end
+
+            counts[candidates[counted]] += 1
+            totals[candidates[has_length]] += lengths[has_length]
+        except Exception:
+            error_count += 1
+
+    return counts, totals, error_count
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量空间索引叠加工具
+功能：针对不规则网格（边界裁剪网格、自定义分区等），一次性用空间索引批量查询
+所有OD直线与所有网格多边形的 (订单, 网格) 候选对，再用向量化几何运算批量计算交线长度，
+避免逐订单、逐候选网格的Python循环
+"""
+
+import numpy as np
+import shapely
+
+
+def segment_pairs_bulk(grid_geoms, sindex, start_x, start_y, end_x, end_y,
+                       batch_size=200000, min_length=1e-6):
+    """
+    批量计算所有直线段与网格多边形的交线长度
+
+    统计口径与 GridTrajectoryAnalyzer.process_single_order 一致：
+    交线长度大于 min_length 的网格计入；起点或终点落在网格内但交线长度为零的网格计入、长度为0；
+    起终点重合的订单计入包含或接触该点的网格、长度为0
+
+    Args:
+        grid_geoms (np.ndarray): 网格多边形数组
+        sindex: 网格空间索引（shapely.STRtree 或 GeoDataFrame.sindex），需支持批量 query
+        start_x, start_y, end_x, end_y (array-like): 起终点投影坐标
+        batch_size (int): 每批处理的订单数，用于控制候选对数组的内存占用
+        min_length (float): 小于该值的交线长度视为浮点误差
+
+    Returns:
+        tuple: (线段编号数组, 网格位置数组, 网格内长度数组)
+    """
+    grid_geoms = np.asarray(grid_geoms, dtype=object)
+    x0 = np.asarray(start_x, dtype=np.float64)
+    y0 = np.asarray(start_y, dtype=np.float64)
+    x1 = np.asarray(end_x, dtype=np.float64)
+    y1 = np.asarray(end_y, dtype=np.float64)
+
+    out_seg, out_pos, out_len = [], [], []
+    for batch_start in range(0, len(x0), batch_size):
+        batch = slice(batch_start, batch_start + batch_size)
+        seg, pos, length = _segment_pairs_batch(grid_geoms, sindex, x0[batch], y0[batch],
+                                                x1[batch], y1[batch], min_length)
+        out_seg.append(seg + batch_start)
+        out_pos.append(pos)
+        out_len.append(length)
+
+    if not out_seg:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    return np.concatenate(out_seg), np.concatenate(out_pos), np.concatenate(out_len)
+
+
+def _segment_pairs_batch(grid_geoms, sindex, x0, y0, x1, y1, min_length):
+    """
+    处理一批订单，见 segment_pairs_bulk
+
+    Returns:
+        tuple: (批内线段编号数组, 网格位置数组, 网格内长度数组)
+    """
+    valid = np.isfinite(x0) & np.isfinite(y0) & np.isfinite(x1) & np.isfinite(y1)
+    is_point = valid & (np.hypot(x1 - x0, y1 - y0) < min_length)
+    is_line = valid & ~is_point
+
+    # 起终点重合的订单：查询包含或接触该点的网格
+    point_index = np.flatnonzero(is_point)
+    points = shapely.points(x0[point_index], y0[point_index])
+    point_pairs = sindex.query(points, predicate='intersects')
+    point_seg = point_index[point_pairs[0]]
+    point_pos = point_pairs[1]
+
+    # 一次性查询所有直线与网格的相交候选对
+    line_index = np.flatnonzero(is_line)
+    coords = np.stack([
+        np.column_stack([x0[line_index], y0[line_index]]),
+        np.column_stack([x1[line_index], y1[line_index]]),
+    ], axis=1)
+    lines = shapely.linestrings(coords)
+    line_pairs = sindex.query(lines, predicate='intersects')
+    pair_line = line_pairs[0]
+    pair_pos = line_pairs[1]
+
+    pair_geoms = grid_geoms[pair_pos]
+    lengths = shapely.length(shapely.intersection(lines[pair_line], pair_geoms))
+    has_length = lengths > min_length
+
+    # 起点或终点刚好在网格边界上时，仍计入一个轨迹段
+    start_points = shapely.points(x0[line_index], y0[line_index])
+    end_points = shapely.points(x1[line_index], y1[line_index])
+    contains_end = (shapely.contains(pair_geoms, start_points[pair_line])
+                    | shapely.contains(pair_geoms, end_points[pair_line]))
+    counted = has_length | contains_end
+
+    line_seg = line_index[pair_line[counted]]
+    line_pos = pair_pos[counted]
+    line_len = np.where(has_length, lengths, 0.0)[counted]
+
+    return (np.concatenate([line_seg, point_seg]).astype(np.int64),
+            np.concatenate([line_pos, point_pos]).astype(np.int64),
+            np.concatenate([line_len, np.zeros(len(point_seg))]))
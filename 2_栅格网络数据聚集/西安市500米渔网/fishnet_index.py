@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+渔网格点索引
+功能：西安市渔网创建.py 生成的渔网是以 np.arange(minx, maxx, 500) × np.arange(miny, maxy, 500)
+为格点的规则网格，保存原点、网格边长以及 (行, 列) -> 网格位置 的稠密查找表后，
+任意数量的点都可以用整除直接定位所在网格，无需构建和查询空间索引（sjoin/contains）
+"""
+
+import numpy as np
+
+
+class FishnetIndex:
+    """规则渔网的格点索引：原点、网格边长以及 (行, 列) -> 网格位置 查找表"""
+
+    def __init__(self, origin_x, origin_y, cell_size, cell_to_pos, grid_ids):
+        """
+        初始化渔网索引
+
+        Args:
+            origin_x (float): 网格左下角原点X坐标
+            origin_y (float): 网格左下角原点Y坐标
+            cell_size (float): 网格边长（米）
+            cell_to_pos (np.ndarray): 形状为 (行数, 列数) 的查找表，值为网格在 grid_ids 中的位置，
+                -1 表示该格不存在（被主城区范围筛选掉）
+            grid_ids (np.ndarray): 网格ID数组
+        """
+        self.origin_x = float(origin_x)
+        self.origin_y = float(origin_y)
+        self.cell_size = float(cell_size)
+        self.cell_to_pos = cell_to_pos
+        self.grid_ids = np.asarray(grid_ids)
+        self.n_rows, self.n_cols = cell_to_pos.shape
+
+    @classmethod
+    def from_grid_gdf(cls, grid_gdf, id_col='grid_id', tolerance=1e-3):
+        """
+        从渔网GeoDataFrame推断格点参数
+
+        Args:
+            grid_gdf (gpd.GeoDataFrame): 渔网数据
+            id_col (str): 网格ID列名
+            tolerance (float): 判断网格是否规则时允许的坐标误差（米）
+
+        Returns:
+            FishnetIndex: 渔网索引
+
+        Raises:
+            ValueError: 渔网不是轴对齐的等边长正方形网格时抛出
+        """
+        if len(grid_gdf) == 0:
+            raise ValueError("渔网数据为空，无法构建规则网格")
+
+        bounds = grid_gdf.geometry.bounds
+        minx = bounds['minx'].to_numpy()
+        miny = bounds['miny'].to_numpy()
+        widths = bounds['maxx'].to_numpy() - minx
+        heights = bounds['maxy'].to_numpy() - miny
+
+        cell_size = float(np.median(widths))
+        if cell_size <= 0:
+            raise ValueError("无法推断网格边长")
+
+        # 检查每个网格都是边长一致的正方形，且面积与外包矩形一致（即轴对齐）
+        if (np.abs(widths - cell_size).max() > tolerance
+                or np.abs(heights - cell_size).max() > tolerance):
+            raise ValueError("渔网网格边长不一致，不是规则网格")
+        areas = grid_gdf.geometry.area.to_numpy()
+        if np.abs(areas - cell_size * cell_size).max() > tolerance * cell_size:
+            raise ValueError("渔网网格不是轴对齐的正方形，不是规则网格")
+
+        origin_x = minx.min()
+        origin_y = miny.min()
+        col_f = (minx - origin_x) / cell_size
+        row_f = (miny - origin_y) / cell_size
+        cols = np.rint(col_f).astype(np.int64)
+        rows = np.rint(row_f).astype(np.int64)
+        if (np.abs(col_f - cols).max() * cell_size > tolerance
+                or np.abs(row_f - rows).max() * cell_size > tolerance):
+            raise ValueError("渔网网格未对齐到统一格点，不是规则网格")
+
+        cell_to_pos = np.full((rows.max() + 1, cols.max() + 1), -1, dtype=np.int64)
+        if (np.bincount(rows * cell_to_pos.shape[1] + cols) > 1).any():
+            raise ValueError("渔网中存在重叠网格，不是规则网格")
+        cell_to_pos[rows, cols] = np.arange(len(grid_gdf))
+
+        return cls(origin_x, origin_y, cell_size, cell_to_pos, grid_gdf[id_col].to_numpy())
+
+    def lookup(self, rows, cols):
+        """
+        将 (行, 列) 映射为网格位置，超出范围或已被裁剪的格返回 -1
+
+        Args:
+            rows (np.ndarray): 行号数组
+            cols (np.ndarray): 列号数组
+
+        Returns:
+            np.ndarray: 网格位置数组
+        """
+        inside = (rows >= 0) & (rows < self.n_rows) & (cols >= 0) & (cols < self.n_cols)
+        pos = np.full(rows.shape, -1, dtype=np.int64)
+        pos[inside] = self.cell_to_pos[rows[inside], cols[inside]]
+        return pos
+
+    def locate(self, x, y):
+        """
+        用整除计算点所在网格的位置
+
+        Args:
+            x, y (array-like): 投影坐标（与渔网同一坐标系）
+
+        Returns:
+            np.ndarray: 网格位置数组，不在任何网格内或坐标无效时为 -1
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        valid = np.isfinite(x) & np.isfinite(y)
+        cols = np.full(x.shape, -1, dtype=np.int64)
+        rows = np.full(y.shape, -1, dtype=np.int64)
+        cols[valid] = np.floor((x[valid] - self.origin_x) / self.cell_size)
+        rows[valid] = np.floor((y[valid] - self.origin_y) / self.cell_size)
+        return self.lookup(rows, cols)
+
+    def grid_id(self, x, y):
+        """
+        计算点所在网格的ID
+
+        Args:
+            x, y (array-like): 投影坐标（与渔网同一坐标系）
+
+        Returns:
+            np.ndarray: 网格ID数组，不在任何网格内或坐标无效时为 -1
+        """
+        pos = self.locate(x, y)
+        ids = np.full(pos.shape, -1, dtype=self.grid_ids.dtype)
+        ids[pos >= 0] = self.grid_ids[pos[pos >= 0]]
+        return ids
+
+    def save(self, path):
+        """
+        保存为npz文件
+
+        Args:
+            path (str): 输出路径
+        """
+        np.savez_compressed(path, origin=np.array([self.origin_x, self.origin_y]),
+                            cell_size=self.cell_size, cell_to_pos=self.cell_to_pos,
+                            grid_ids=self.grid_ids)
+
+    @classmethod
+    def load(cls, path):
+        """
+        从npz文件加载渔网索引
+
+        Args:
+            path (str): 文件路径
+
+        Returns:
+            FishnetIndex: 渔网索引
+        """
+        with np.load(path, allow_pickle=False) as data:
+            origin_x, origin_y = data['origin']
+            return cls(origin_x, origin_y, float(data['cell_size']), data['cell_to_pos'], data['grid_ids'])
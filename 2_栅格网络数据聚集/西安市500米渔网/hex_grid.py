@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+六边形网格索引
+功能：在与方形渔网相同的主城区边界上生成等面积的尖顶六边形网格，用轴向坐标 (q, r) 描述。
+点所在的六边形由坐标换算加立方坐标取整直接得到，直线穿越的六边形由 grid_traversal.py 沿三组边方向
+向量化计算，POI、交通站点、OD映射和轨迹里程汇总都能以与方形渔网相同的方式运行，无需多边形空间连接
+"""
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from fishnet_index import FishnetIndex
+
+SQRT3 = np.sqrt(3.0)
+
+
+def hex_size_for_area(cell_area):
+    """返回面积为 cell_area 的正六边形的外接圆半径"""
+    return float(np.sqrt(2.0 * cell_area / (3.0 * SQRT3)))
+
+
+class HexGridIndex:
+    """尖顶六边形网格索引：原点、外接圆半径以及 (r, q) -> 网格位置 查找表"""
+
+    def __init__(self, origin_x, origin_y, size, q_min, r_min, cell_to_pos, grid_ids):
+        """
+        初始化六边形网格索引
+
+        Args:
+            origin_x (float): 轴向坐标 (0, 0) 六边形的中心X坐标
+            origin_y (float): 轴向坐标 (0, 0) 六边形的中心Y坐标
+            size (float): 六边形外接圆半径（米）
+            q_min (int): 查找表第一列对应的q
+            r_min (int): 查找表第一行对应的r
+            cell_to_pos (np.ndarray): 形状为 (r数, q数) 的查找表，值为网格在 grid_ids 中的位置，-1 表示不存在
+            grid_ids (np.ndarray): 网格ID数组
+        """
+        self.origin_x = float(origin_x)
+        self.origin_y = float(origin_y)
+        self.size = float(size)
+        self.q_min = int(q_min)
+        self.r_min = int(r_min)
+        self.cell_to_pos = cell_to_pos
+        self.grid_ids = np.asarray(grid_ids)
+        self.n_rows, self.n_cols = cell_to_pos.shape
+
+    @property
+    def cell_area(self):
+        """单个六边形面积（平方米）"""
+        return 1.5 * SQRT3 * self.size ** 2
+
+    @property
+    def line_spacing(self):
+        """六边形各边所在的三组平行线的间距（米）"""
+        return SQRT3 * self.size / 2.0
+
+    def centers(self, q, r):
+        """
+        计算轴向坐标对应的六边形中心
+
+        Args:
+            q, r (array-like): 轴向坐标
+
+        Returns:
+            tuple: (中心X数组, 中心Y数组)
+        """
+        q = np.asarray(q, dtype=np.float64)
+        r = np.asarray(r, dtype=np.float64)
+        return (self.origin_x + self.size * SQRT3 * (q + r / 2.0),
+                self.origin_y + self.size * 1.5 * r)
+
+    def polygons(self, q, r):
+        """
+        生成轴向坐标对应的六边形几何
+
+        Args:
+            q, r (array-like): 轴向坐标
+
+        Returns:
+            np.ndarray: shapely多边形数组
+        """
+        cx, cy = self.centers(q, r)
+        angles = np.radians(30.0 + 60.0 * np.arange(6))
+        xs = cx[:, None] + self.size * np.cos(angles)[None, :]
+        ys = cy[:, None] + self.size * np.sin(angles)[None, :]
+        return shapely.polygons(np.stack([xs, ys], axis=-1))
+
+    def axial(self, x, y):
+        """
+        用立方坐标取整计算点所在六边形的轴向坐标
+
+        Args:
+            x, y (array-like): 投影坐标（需为有限值）
+
+        Returns:
+            tuple: (q数组, r数组)
+        """
+        dx = (np.asarray(x, dtype=np.float64) - self.origin_x) / self.size
+        dy = (np.asarray(y, dtype=np.float64) - self.origin_y) / self.size
+        qf = SQRT3 / 3.0 * dx - dy / 3.0
+        rf = 2.0 / 3.0 * dy
+        sf = -qf - rf
+        q, r, s = np.rint(qf), np.rint(rf), np.rint(sf)
+        dq, dr, ds = np.abs(q - qf), np.abs(r - rf), np.abs(s - sf)
+        fix_q = (dq > dr) & (dq > ds)
+        fix_r = ~fix_q & (dr > ds)
+        q = np.where(fix_q, -r - s, q)
+        r = np.where(fix_r, -q - s, r)
+        return q.astype(np.int64), r.astype(np.int64)
+
+    def lookup(self, q, r):
+        """
+        将轴向坐标映射为网格位置，超出范围或已被裁剪的六边形返回 -1
+
+        Args:
+            q, r (np.ndarray): 轴向坐标
+
+        Returns:
+            np.ndarray: 网格位置数组
+        """
+        cols = np.asarray(q) - self.q_min
+        rows = np.asarray(r) - self.r_min
+        inside = (rows >= 0) & (rows < self.n_rows) & (cols >= 0) & (cols < self.n_cols)
+        pos = np.full(rows.shape, -1, dtype=np.int64)
+        pos[inside] = self.cell_to_pos[rows[inside], cols[inside]]
+        return pos
+
+    def locate(self, x, y):
+        """
+        计算点所在六边形的位置
+
+        Args:
+            x, y (array-like): 投影坐标（与网格同一坐标系）
+
+        Returns:
+            np.ndarray: 网格位置数组，不在任何六边形内或坐标无效时为 -1
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        valid = np.isfinite(x) & np.isfinite(y)
+        pos = np.full(x.shape, -1, dtype=np.int64)
+        q, r = self.axial(x[valid], y[valid])
+        pos[valid] = self.lookup(q, r)
+        return pos
+
+    def grid_id(self, x, y):
+        """
+        计算点所在六边形的ID
+
+        Args:
+            x, y (array-like): 投影坐标（与网格同一坐标系）
+
+        Returns:
+            np.ndarray: 网格ID数组，不在任何六边形内或坐标无效时为 -1
+        """
+        pos = self.locate(x, y)
+        ids = np.full(pos.shape, -1, dtype=self.grid_ids.dtype)
+        ids[pos >= 0] = self.grid_ids[pos[pos >= 0]]
+        return ids
+
+    @classmethod
+    def build(cls, boundary, cell_area=500 * 500, origin_x=None, origin_y=None, crs=None):
+        """
+        在研究区边界上生成完全位于边界内的六边形网格
+
+        Args:
+            boundary: 研究区边界（shapely多边形）
+            cell_area (float): 六边形面积（平方米），默认与500米方形网格等面积
+            origin_x, origin_y (float, optional): 轴向坐标 (0, 0) 六边形的中心，默认为边界外包矩形左下角
+            crs: 坐标系
+
+        Returns:
+            tuple: (六边形网格GeoDataFrame（grid_id、q、r、geometry），HexGridIndex)
+        """
+        minx, miny, maxx, maxy = shapely.bounds(boundary)
+        origin_x = minx if origin_x is None else origin_x
+        origin_y = miny if origin_y is None else origin_y
+        size = hex_size_for_area(cell_area)
+        shapely.prepare(boundary)
+
+        # 覆盖外包矩形的轴向坐标范围
+        r_lo = int(np.floor((miny - origin_y) / (1.5 * size))) - 1
+        r_hi = int(np.ceil((maxy - origin_y) / (1.5 * size))) + 1
+        q_lo = int(np.floor((minx - origin_x) / (SQRT3 * size) - r_hi / 2.0)) - 1
+        q_hi = int(np.ceil((maxx - origin_x) / (SQRT3 * size) - r_lo / 2.0)) + 1
+        r_all, q_all = np.meshgrid(np.arange(r_lo, r_hi + 1), np.arange(q_lo, q_hi + 1), indexing='ij')
+        q_all, r_all = q_all.ravel(), r_all.ravel()
+
+        probe = cls(origin_x, origin_y, size, 0, 0, np.full((0, 0), -1, dtype=np.int64), [])
+        cx, cy = probe.centers(q_all, r_all)
+        near = (cx > minx - size) & (cx < maxx + size) & (cy > miny - size) & (cy < maxy + size)
+        q_all, r_all = q_all[near], r_all[near]
+        hexes = probe.polygons(q_all, r_all)
+        keep = shapely.contains(boundary, hexes)
+        q_keep, r_keep = q_all[keep], r_all[keep]
+
+        grid_ids = np.arange(1, keep.sum() + 1, dtype=np.int64)
+        q_min, r_min = q_keep.min(), r_keep.min()
+        cell_to_pos = np.full((r_keep.max() - r_min + 1, q_keep.max() - q_min + 1), -1, dtype=np.int64)
+        cell_to_pos[r_keep - r_min, q_keep - q_min] = np.arange(len(grid_ids))
+
+        index = cls(origin_x, origin_y, size, q_min, r_min, cell_to_pos, grid_ids)
+        hex_gdf = gpd.GeoDataFrame({'grid_id': grid_ids, 'q': q_keep, 'r': r_keep},
+                                   geometry=hexes[keep], crs=crs)
+        return hex_gdf, index
+
+    @classmethod
+    def from_grid_gdf(cls, grid_gdf, id_col='grid_id', tolerance=1e-3):
+        """
+        从六边形网格GeoDataFrame推断网格参数
+
+        Args:
+            grid_gdf (gpd.GeoDataFrame): 六边形网格数据
+            id_col (str): 网格ID列名
+            tolerance (float): 允许的坐标误差（米）
+
+        Returns:
+            HexGridIndex: 六边形网格索引
+
+        Raises:
+            ValueError: 不是等大的尖顶正六边形网格时抛出
+        """
+        if len(grid_gdf) == 0:
+            raise ValueError("网格数据为空，无法构建六边形网格")
+        geoms = grid_gdf.geometry.values
+        if not (shapely.get_num_coordinates(geoms) == 7).all():
+            raise ValueError("网格不是六边形")
+
+        areas = shapely.area(geoms)
+        size = hex_size_for_area(float(np.median(areas)))
+        if np.abs(areas - 1.5 * SQRT3 * size ** 2).max() > tolerance * size:
+            raise ValueError("六边形面积不一致，不是规则六边形网格")
+
+        centroids = shapely.centroid(geoms)
+        cx, cy = shapely.get_x(centroids), shapely.get_y(centroids)
+        # 尖顶六边形在中心正上方有一个顶点
+        top = shapely.points(cx, cy + size)
+        if shapely.distance(shapely.get_exterior_ring(geoms), top).max() > tolerance:
+            raise ValueError("网格不是尖顶正六边形")
+
+        probe = cls(cx[0], cy[0], size, 0, 0, np.full((0, 0), -1, dtype=np.int64), [])
+        q, r = probe.axial(cx, cy)
+        ex, ey = probe.centers(q, r)
+        if np.hypot(ex - cx, ey - cy).max() > tolerance:
+            raise ValueError("六边形中心未对齐到统一格点，不是规则六边形网格")
+
+        q_min, r_min = q.min(), r.min()
+        cell_to_pos = np.full((r.max() - r_min + 1, q.max() - q_min + 1), -1, dtype=np.int64)
+        if (np.bincount((r - r_min) * cell_to_pos.shape[1] + (q - q_min)) > 1).any():
+            raise ValueError("网格中存在重叠六边形")
+        cell_to_pos[r - r_min, q - q_min] = np.arange(len(grid_gdf))
+        return cls(cx[0], cy[0], size, q_min, r_min, cell_to_pos, grid_gdf[id_col].to_numpy())
+
+    def save(self, path):
+        """
+        保存为npz文件
+
+        Args:
+            path (str): 输出路径
+        """
+        np.savez_compressed(path, origin=np.array([self.origin_x, self.origin_y]), size=self.size,
+                            axial_min=np.array([self.q_min, self.r_min]),
+                            cell_to_pos=self.cell_to_pos, grid_ids=self.grid_ids)
+
+    @classmethod
+    def load(cls, path):
+        """
+        从npz文件加载六边形网格索引
+
+        Args:
+            path (str): 文件路径
+
+        Returns:
+            HexGridIndex: 六边形网格索引
+        """
+        with np.load(path, allow_pickle=False) as data:
+            origin_x, origin_y = data['origin']
+            q_min, r_min = data['axial_min']
+            return cls(origin_x, origin_y, float(data['size']), q_min, r_min,
+                       data['cell_to_pos'], data['grid_ids'])
+
+
+def grid_index_from_gdf(grid_gdf, id_col='grid_id'):
+    """
+    按网格形状构建格点索引：方形渔网返回 FishnetIndex，六边形网格返回 HexGridIndex
+
+    Args:
+        grid_gdf (gpd.GeoDataFrame): 网格数据
+        id_col (str): 网格ID列名
+
+    Returns:
+        FishnetIndex or HexGridIndex: 网格索引，二者都提供 grid_ids、locate、grid_id
+
+    Raises:
+        ValueError: 既不是规则方形渔网也不是规则六边形网格时抛出
+    """
+    try:
+        return FishnetIndex.from_grid_gdf(grid_gdf, id_col=id_col)
+    except ValueError as square_error:
+        try:
+            return HexGridIndex.from_grid_gdf(grid_gdf, id_col=id_col)
+        except ValueError as hex_error:
+            raise ValueError(f"{square_error}；{hex_error}") from hex_error
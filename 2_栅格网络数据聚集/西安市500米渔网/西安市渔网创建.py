@@ -1,10 +1,14 @@
 import geopandas as gpd
 import matplotlib.pyplot as plt
-from shapely.geometry import Polygon
-import numpy as np
+import os
+import sys
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from hex_grid import HexGridIndex
+from multiscale_fishnet import MultiScaleFishnet, parent_column
+
 # 文件路径
 shp_path = "D:/Desktop/小论文/论文初稿/ArcGIS/西安市/西安市.shp"
 
@@ -75,61 +79,58 @@ print(f"最小Y: {bounds[1]}")
 print(f"最大X: {bounds[2]}")
 print(f"最大Y: {bounds[3]}")
 
-# 步骤4: 生成1km×1km渔网并裁剪
-print("\n步骤4: 生成1km×1km渔网并裁剪")
+# 步骤4: 生成对齐的250米/500米/1公里多尺度渔网并裁剪
+print("\n步骤4: 生成对齐的多尺度渔网并裁剪")
 
-# 设置渔网大小（500米）
+# 设置渔网大小（500米为主尺度，250米和1公里用于尺度敏感性分析）
 grid_size = 500
+fishnet_levels = (250, 500, 1000)
 
-# 计算网格数量
-minx, miny, maxx, maxy = bounds
-x_coords = np.arange(minx, maxx, grid_size)
-y_coords = np.arange(miny, maxy, grid_size)
-
-print(f"生成渔网网格数: {len(x_coords)} × {len(y_coords)} = {len(x_coords) * len(y_coords)}")
-
-# 创建渔网网格
-polygons = []
-for x in x_coords:
-    for y in y_coords:
-        # 创建正方形网格
-        polygon = Polygon([(x, y), (x + grid_size, y), (x + grid_size, y + grid_size), (x, y + grid_size)])
-        polygons.append(polygon)
-
-# 创建渔网GeoDataFrame
-fishnet = gpd.GeoDataFrame(geometry=polygons, crs=districts_meter.crs)
-print(f"渔网生成完成，共 {len(fishnet)} 个网格")
+# 由坐标数组一次性生成网格，合并后的主城区边界prepare后一次向量化筛选完全包含的网格
+multiscale = MultiScaleFishnet.from_districts(districts_meter, fishnet_levels)
+for size in multiscale.levels:
+    print(f"{size}米渔网: 格点网格数 {multiscale.n_lattice_cells[size]}，完整网格数 {len(multiscale.grids[size])}")
 
 # 保存原始渔网
+fishnet = multiscale.lattice_gdf(grid_size)
 fishnet.to_file("原始渔网.shp", driver='ESRI Shapefile')
-print("已保存原始渔网到'原始渔网.shp'")
-
-# 合并所有行政区边界为一个单一的几何对象
-merged_districts = districts_meter.unary_union
-print("已合并六大行政区边界")
-
-# 筛选完全包含在行政区内的网格
-print("正在筛选完全包含在行政区内的网格...")
-# 使用contains方法确保网格完全在行政区内
-complete_grids = fishnet[fishnet.geometry.apply(lambda geom: merged_districts.contains(geom))]
+print(f"已保存原始渔网到'原始渔网.shp'，共 {len(fishnet)} 个网格")
 
+# 主尺度的完整网格，编号顺序与原逐格生成方式一致（按X外层、Y内层）
+complete_grids = multiscale.grids[grid_size]
 print(f"筛选后保留的完整网格数量: {len(complete_grids)}")
 
 # 保存筛选后的完整网格
-complete_grids.to_file("完整渔网网格.shp", driver='ESRI Shapefile')
+complete_grids[['geometry']].to_file("完整渔网网格.shp", driver='ESRI Shapefile')
 print("已保存完整渔网网格到'完整渔网网格.shp'")
 
-# 步骤5: 为渔网网格编号并进行可视化
-print("\n步骤5: 为渔网网格编号并进行可视化")
-
-# 为网格添加编号
-complete_grids['grid_id'] = range(1, len(complete_grids) + 1)
-print("已为网格添加编号")
+# 步骤5: 保存带编号网格、多尺度渔网和格点索引
+print("\n步骤5: 保存带编号网格、多尺度渔网和格点索引")
 
 # 保存带编号的网格
-complete_grids.to_file("带编号完整渔网网格.shp", driver='ESRI Shapefile')
+complete_grids[['grid_id', 'geometry']].to_file("带编号完整渔网网格.shp", driver='ESRI Shapefile')
 print("已保存带编号的完整渔网网格到'带编号完整渔网网格.shp'")
 
+# 保存渔网格点索引，供POI、交通站点、OD映射等脚本按坐标整除定位网格
+fishnet_index = multiscale.indexes[grid_size]
+fishnet_index.save("带编号完整渔网网格_index.npz")
+print(f"已保存渔网格点索引到'带编号完整渔网网格_index.npz'（{fishnet_index.n_rows}行×{fishnet_index.n_cols}列）")
+
+# 各尺度渔网附带行列号和上级网格ID（pid_500、pid_1000），跨尺度汇总按上级网格ID进行
+for size in multiscale.levels:
+    level_path = f"多尺度渔网_{size}米.shp"
+    multiscale.grids[size].to_file(level_path, driver='ESRI Shapefile')
+    multiscale.indexes[size].save(f"多尺度渔网_{size}米_index.npz")
+    parents = [parent_column(coarse) for coarse in multiscale.levels if coarse > size]
+    print(f"已保存{size}米渔网到'{level_path}'，上级网格ID列: {parents if parents else '无'}")
+
+# 与500米方形网格等面积的六边形网格（同一主城区边界，用于网格形状敏感性分析）
+hex_grids, hex_index = HexGridIndex.build(multiscale.boundary, cell_area=grid_size * grid_size,
+                                          origin_x=bounds[0], origin_y=bounds[1], crs=districts_meter.crs)
+hex_grids.to_file("六边形渔网网格.shp", driver='ESRI Shapefile')
+hex_index.save("六边形渔网网格_index.npz")
+print(f"已保存六边形渔网到'六边形渔网网格.shp'，共 {len(hex_grids)} 个网格（外接圆半径{hex_index.size:.1f}米）")
+
 # 创建可视化
 fig, ax = plt.subplots(1, 1, figsize=(10, 8))
 
@@ -1,11 +1,30 @@
 import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import geopandas as gpd
+from matplotlib.collections import LineCollection
 from shapely.geometry import LineString, Point
 from datetime import datetime
 
+# 检查是否有pyarrow，如果没有则以npz格式保存轨迹
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    print("警告: pyarrow未安装，轨迹将以npz格式保存")
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '网格内里程汇总'))
+from columnar_dataset import load_order_window
+
+# 按小时分区的订单目录（6_补充代码/clean_sharing_bike_data.py 生成），存在时直接按时间窗口读取
+ORDER_STORE_DIR = "D:\\Desktop\\项目论文\\全天时段订单趋势分析\\共享单车数据_8月8日_按小时分区"
+# 早晚高峰时间窗口 [开始, 结束)，与每小时订单量分析中的高峰时段（7-9点、17-19点）一致
+EARLY_PEAK_WINDOW = ('2025-08-08 07:00', '2025-08-08 10:00')
+LATE_PEAK_WINDOW = ('2025-08-08 17:00', '2025-08-08 20:00')
+
 def calculate_haversine_distance(lat1, lon1, lat2, lon2):
     """
     使用Haversine公式计算两点之间的直线距离（单位：公里）
@@ -24,43 +43,118 @@ def calculate_haversine_distance(lat1, lon1, lat2, lon2):
     
     return c * r
 
+class TrajectoryStore:
+    """
+    列式轨迹存储：所有轨迹的顶点经纬度连续存放在两个数组中，
+    第 i 条轨迹的顶点为 lons[offsets[i]:offsets[i+1]]
+    """
+
+    def __init__(self, ids, lons, lats, offsets):
+        """
+        参数:
+        ids: ndarray, 每条轨迹的序号
+        lons, lats: ndarray, 所有轨迹顶点的经度、纬度
+        offsets: ndarray, 长度为轨迹数+1的顶点偏移量
+        """
+        self.ids = np.asarray(ids)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @classmethod
+    def from_od(cls, od_data):
+        """
+        由OD数据生成起点到终点的直线轨迹，每条轨迹两个顶点
+        """
+        n = len(od_data)
+        lons = np.empty(2 * n)
+        lats = np.empty(2 * n)
+        lons[0::2] = od_data['起点经度'].to_numpy()
+        lons[1::2] = od_data['终点经度'].to_numpy()
+        lats[0::2] = od_data['起点纬度'].to_numpy()
+        lats[1::2] = od_data['终点纬度'].to_numpy()
+        return cls(od_data['序号'].to_numpy(), lons, lats, np.arange(0, 2 * n + 1, 2))
+
+    def segment_starts(self):
+        """
+        返回所有轨迹内部相邻顶点线段的起点顶点下标（不跨越轨迹边界）
+        """
+        is_last = np.zeros(len(self.lons), dtype=bool)
+        is_last[self.offsets[1:] - 1] = True
+        return np.flatnonzero(~is_last[:-1])
+
+    def lengths(self):
+        """
+        一次性计算所有轨迹的Haversine里程（单位：公里）
+        """
+        starts = self.segment_starts()
+        distances = calculate_haversine_distance(self.lats[starts], self.lons[starts],
+                                                 self.lats[starts + 1], self.lons[starts + 1])
+        owner = np.searchsorted(self.offsets, starts, side='right') - 1
+        return np.bincount(owner, weights=distances, minlength=len(self))
+
+    def segments(self):
+        """
+        返回形状为 (线段数, 2, 2) 的线段坐标数组，供LineCollection一次性绘制
+        """
+        starts = self.segment_starts()
+        return np.stack([np.column_stack([self.lons[starts], self.lats[starts]]),
+                         np.column_stack([self.lons[starts + 1], self.lats[starts + 1]])], axis=1)
+
+    def save(self, output_file):
+        """
+        保存轨迹：有pyarrow时保存为Parquet（每行一条轨迹，经纬度为列表列），否则保存为npz
+        """
+        if pa is None:
+            output_file = os.path.splitext(output_file)[0] + '.npz'
+            np.savez_compressed(output_file, ids=self.ids, lons=self.lons,
+                                lats=self.lats, offsets=self.offsets)
+            return output_file
+
+        offsets = pa.array(self.offsets)
+        table = pa.table({
+            '序号': self.ids,
+            '轨迹经度': pa.LargeListArray.from_arrays(offsets, pa.array(self.lons)),
+            '轨迹纬度': pa.LargeListArray.from_arrays(offsets, pa.array(self.lats)),
+            '轨迹里程': self.lengths(),
+        })
+        pq.write_table(table, output_file)
+        return output_file
+
+    @classmethod
+    def load(cls, input_file):
+        """
+        从save保存的Parquet或npz文件加载轨迹
+        """
+        if input_file.endswith('.npz'):
+            with np.load(input_file, allow_pickle=False) as data:
+                return cls(data['ids'], data['lons'], data['lats'], data['offsets'])
+
+        table = pq.read_table(input_file)
+        lons = table.column('轨迹经度').combine_chunks()
+        lats = table.column('轨迹纬度').combine_chunks()
+        return cls(table.column('序号').to_numpy(), lons.flatten().to_numpy(),
+                   lats.flatten().to_numpy(), lons.offsets.to_numpy())
+
 def generate_straight_line_trajectories(od_data, output_dir):
  
     print(f"开始生成直线轨迹，共{len(od_data)}条数据...")
     
-    trajectories = []
-    stats_data = []
-    
-    for idx, row in od_data.iterrows():
-        # 获取起终点坐标
-        start_lon, start_lat = row['起点经度'], row['起点纬度']
-        end_lon, end_lat = row['终点经度'], row['终点纬度']
-        
-        #轨迹点之间的连线
-        trajectory = [(start_lon, start_lat), (end_lon, end_lat)]
-        trajectories.append(trajectory)
-        
-        # 计算直线距离作为轨迹里程
-        virtual_distance = calculate_haversine_distance(
-            start_lat, start_lon, end_lat, end_lon
-        )
-        
-        # 收集统计信息
-        stats_data.append({
-            '序号': row['序号'],
-            '起点经度': start_lon,
-            '起点纬度': start_lat,
-            '终点经度': end_lon,
-            '终点纬度': end_lat,
-            '轨迹里程': virtual_distance
-        })
-        
-        # 每处理1000条数据显示一次进度
-        if (idx + 1) % 1000 == 0:
-            print(f"  已处理 {idx + 1}/{len(od_data)} 条数据")
+    # 起终点坐标直接组成列式轨迹，里程对整个数组一次计算
+    trajectories = TrajectoryStore.from_od(od_data)
     
     # 创建统计信息DataFrame
-    stats = pd.DataFrame(stats_data)
+    stats = pd.DataFrame({
+        '序号': od_data['序号'].to_numpy(),
+        '起点经度': od_data['起点经度'].to_numpy(),
+        '起点纬度': od_data['起点纬度'].to_numpy(),
+        '终点经度': od_data['终点经度'].to_numpy(),
+        '终点纬度': od_data['终点纬度'].to_numpy(),
+        '轨迹里程': trajectories.lengths()
+    })
     
     print(f"轨迹生成完成！")
     return trajectories, stats
@@ -70,7 +164,7 @@ def visualize_trajectories_on_fishnet(trajectories, od_data, output_file, base_i
     在渔网上可视化轨迹
     
     参数:
-    trajectories: list, 轨迹列表
+    trajectories: TrajectoryStore, 列式轨迹
     od_data: DataFrame, 包含OD数据
     output_file: str, 输出文件路径
     base_image: str, 基础图像路径（可选）
@@ -95,11 +189,10 @@ def visualize_trajectories_on_fishnet(trajectories, od_data, output_file, base_i
     
     print(f"  显示所有 {len(trajectories)} 条轨迹")
     
-    # 绘制所有轨迹
-    for traj in trajectories:
-        if len(traj) >= 2:
-            lons, lats = zip(*traj)
-            ax.plot(lons, lats, 'b-', alpha=0.05, linewidth=0.3)  # 降低透明度和线宽以处理大量轨迹
+    # 所有轨迹作为一个LineCollection一次绘制，降低透明度和线宽以处理大量轨迹
+    lines = LineCollection(trajectories.segments(), colors='b', alpha=0.05, linewidths=0.3)
+    ax.add_collection(lines)
+    ax.autoscale_view()
     
     # 绘制所有起终点
     ax.scatter(od_data['起点经度'], od_data['起点纬度'], 
@@ -111,7 +204,7 @@ def visualize_trajectories_on_fishnet(trajectories, od_data, output_file, base_i
     ax.set_xlabel('经度')
     ax.set_ylabel('纬度')
     ax.set_title('OD对直线轨迹可视化')
-    ax.legend()
+    ax.legend(loc='upper right')  # 固定图例位置，避免在大量轨迹上搜索最佳位置
     ax.grid(True, alpha=0.3)
     
     # 保存图形
@@ -144,15 +237,25 @@ def main():
         # 晚高峰数据路径
         late_peak_file = "D:\\Desktop\\项目论文\\全天时段订单趋势分析\\订单数据\\共享单车数据_晚高峰_17点-19点.csv"
         
-        # 读取早高峰数据
-        print(f"  加载早高峰数据: {early_peak_file}")
-        early_peak_data = pd.read_csv(early_peak_file)
-        print(f"  早高峰数据加载完成，共{len(early_peak_data)}条记录")
-        
-        # 读取晚高峰数据
-        print(f"  加载晚高峰数据: {late_peak_file}")
-        late_peak_data = pd.read_csv(late_peak_file)
-        print(f"  晚高峰数据加载完成，共{len(late_peak_data)}条记录")
+        if os.path.isdir(ORDER_STORE_DIR):
+            # 只读取高峰时间窗口涉及的小时分区
+            print(f"  按时间窗口读取早高峰数据: {EARLY_PEAK_WINDOW[0]} - {EARLY_PEAK_WINDOW[1]}")
+            early_peak_data = load_order_window(ORDER_STORE_DIR, *EARLY_PEAK_WINDOW)
+            print(f"  早高峰数据加载完成，共{len(early_peak_data)}条记录")
+            
+            print(f"  按时间窗口读取晚高峰数据: {LATE_PEAK_WINDOW[0]} - {LATE_PEAK_WINDOW[1]}")
+            late_peak_data = load_order_window(ORDER_STORE_DIR, *LATE_PEAK_WINDOW)
+            print(f"  晚高峰数据加载完成，共{len(late_peak_data)}条记录")
+        else:
+            # 读取早高峰数据
+            print(f"  加载早高峰数据: {early_peak_file}")
+            early_peak_data = pd.read_csv(early_peak_file)
+            print(f"  早高峰数据加载完成，共{len(early_peak_data)}条记录")
+            
+            # 读取晚高峰数据
+            print(f"  加载晚高峰数据: {late_peak_file}")
+            late_peak_data = pd.read_csv(late_peak_file)
+            print(f"  晚高峰数据加载完成，共{len(late_peak_data)}条记录")
         
         # 2. 生成早高峰轨迹和统计信息
         print("\n2. 生成早高峰直线轨迹...")
@@ -163,6 +266,10 @@ def main():
         early_stats.to_csv(early_stats_file, index=False, encoding='utf-8-sig')
         print(f"  早高峰统计信息已保存到: {early_stats_file}")
         
+        # 保存早高峰轨迹
+        early_trajectory_file = early_trajectories.save(os.path.join(output_dir, "早高峰直线轨迹.parquet"))
+        print(f"  早高峰轨迹已保存到: {early_trajectory_file}")
+        
         # 3. 生成晚高峰轨迹和统计信息
         print("\n3. 生成晚高峰直线轨迹...")
         late_trajectories, late_stats = generate_straight_line_trajectories(late_peak_data, output_dir)
@@ -172,6 +279,10 @@ def main():
         late_stats.to_csv(late_stats_file, index=False, encoding='utf-8-sig')
         print(f"  晚高峰统计信息已保存到: {late_stats_file}")
         
+        # 保存晚高峰轨迹
+        late_trajectory_file = late_trajectories.save(os.path.join(output_dir, "晚高峰直线轨迹.parquet"))
+        print(f"  晚高峰轨迹已保存到: {late_trajectory_file}")
+        
         # 4. 可视化早高峰轨迹
         print("\n4. 可视化早高峰轨迹...")
         early_visual_file = os.path.join(output_dir, "早高峰直线轨迹可视化.png")
@@ -2,18 +2,137 @@ import pandas as pd
 import geopandas as gpd
 import numpy as np
 import matplotlib.pyplot as plt
-from shapely.geometry import Point, LineString
+import shapely
 import pyproj
-from matplotlib.colors import LinearSegmentedColormap
+from matplotlib.colors import LinearSegmentedColormap, LogNorm, Normalize
+from matplotlib.patches import Patch
+from matplotlib.collections import LineCollection
 import os
-from tqdm import tqdm
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '西安市500米渔网'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '网格内里程汇总'))
+from hex_grid import grid_index_from_gdf
+from projection_cache import ProjectionCache
+from columnar_dataset import ORDER_SCHEMA, load_table, save_table
+from grid_time_cube import MINUTES_PER_DAY
+from od_flow_matrix import ODFlowMatrix
 
 # 设置中文字体
 plt.rcParams['font.sans-serif'] = ['SimHei', 'DejaVu Sans']
 plt.rcParams['axes.unicode_minus'] = False
 
+class RasterMask:
+    """
+    主城区内外栅格掩膜：每个栅格预先标记为完全在内、完全在外或跨越边界，
+    点查询时只需整除定位栅格，仅落在边界栅格内的点才回退到精确判断
+    """
+    OUTSIDE, INSIDE, BOUNDARY = 0, 1, 2
+    
+    def __init__(self, boundary, cell_size=100):
+        """
+        boundary: 已prepare的主城区合并多边形（米制坐标）
+        cell_size: 栅格边长（米）
+        """
+        self.boundary = boundary
+        self.cell_size = cell_size
+        minx, miny, maxx, maxy = boundary.bounds
+        self.origin_x = minx
+        self.origin_y = miny
+        self.n_cols = int(np.ceil((maxx - minx) / cell_size)) or 1
+        self.n_rows = int(np.ceil((maxy - miny) / cell_size)) or 1
+        
+        # 一次性构造所有栅格并分类
+        cols, rows = np.meshgrid(np.arange(self.n_cols), np.arange(self.n_rows))
+        x0 = minx + cols.ravel() * cell_size
+        y0 = miny + rows.ravel() * cell_size
+        cells = shapely.box(x0, y0, x0 + cell_size, y0 + cell_size)
+        state = np.full(len(cells), self.OUTSIDE, dtype=np.uint8)
+        state[shapely.intersects(boundary, cells)] = self.BOUNDARY
+        state[shapely.contains_properly(boundary, cells)] = self.INSIDE
+        self.state = state.reshape(self.n_rows, self.n_cols)
+    
+    def contains_xy(self, x, y):
+        """判断一批坐标是否在主城区内，返回布尔数组"""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        col = np.floor((x - self.origin_x) / self.cell_size)
+        row = np.floor((y - self.origin_y) / self.cell_size)
+        in_extent = (col >= 0) & (col < self.n_cols) & (row >= 0) & (row < self.n_rows)
+        
+        state = np.full(len(x), self.OUTSIDE, dtype=np.uint8)
+        state[in_extent] = self.state[row[in_extent].astype(np.int64), col[in_extent].astype(np.int64)]
+        inside = state == self.INSIDE
+        near_boundary = np.flatnonzero(state == self.BOUNDARY)
+        inside[near_boundary] = shapely.contains_xy(self.boundary, x[near_boundary], y[near_boundary])
+        return inside
+
+def density_raster(x, y, extent, cell_size):
+    """
+    将全部点按固定分辨率分箱为二维计数栅格（与等宽分箱的 np.histogram2d 结果相同，
+    用整除定位栅格后一次 bincount 完成）
+    
+    Args:
+        x, y (array-like): 点坐标
+        extent (tuple): 栅格范围 (minx, miny, maxx, maxy)
+        cell_size (float): 栅格边长（米）
+    
+    Returns:
+        np.ndarray: 形状为 (行数, 列数) 的计数栅格，第0行为最南侧
+    """
+    minx, miny, maxx, maxy = extent
+    n_cols = max(1, int(np.ceil((maxx - minx) / cell_size)))
+    n_rows = max(1, int(np.ceil((maxy - miny) / cell_size)))
+    cols = np.floor((np.asarray(x, dtype=np.float64) - minx) / cell_size)
+    rows = np.floor((np.asarray(y, dtype=np.float64) - miny) / cell_size)
+    # 范围外和坐标无效（NaN）的点不计入
+    valid = (cols >= 0) & (cols < n_cols) & (rows >= 0) & (rows < n_rows)
+    flat = rows[valid].astype(np.int64) * n_cols + cols[valid].astype(np.int64)
+    return np.bincount(flat, minlength=n_rows * n_cols).reshape(n_rows, n_cols)
+
+def shade_density(counts, how='eq_hist'):
+    """
+    计算计数栅格的着色值，无点的栅格透明
+    
+    Args:
+        counts (np.ndarray): 计数栅格
+        how (str): 'log' 对数色阶；'eq_hist' 直方图均衡（按非零栅格计数的累计分位着色）
+    
+    Returns:
+        tuple: (掩膜数组, matplotlib颜色归一化对象)
+    """
+    empty = counts == 0
+    if how == 'log':
+        return np.ma.masked_array(counts, mask=empty), LogNorm(vmin=1, vmax=max(counts.max(), 2))
+    if how == 'eq_hist':
+        values = np.sort(counts[~empty])
+        quantiles = np.searchsorted(values, counts, side='right') / max(len(values), 1)
+        return np.ma.masked_array(quantiles, mask=empty), Normalize(vmin=0, vmax=1)
+    raise ValueError(f"未知的着色方式: {how}")
+
 class BikeODProcessor:
-    def __init__(self):
+    def __init__(self, clip_mode='exact', raster_cell_size=100, density_cell_size=50, density_shading='eq_hist',
+                 flow_bin_minutes=60, top_flow_count=200):
+        """
+        clip_mode: 主城区裁剪方式，'exact' 对合并后的主城区边界做一次向量化精确判断；
+                   'raster' 先查栅格掩膜，仅边界附近的点做精确判断
+        raster_cell_size: 栅格掩膜的栅格边长（米）
+        density_cell_size: OD点分布图、点密度图的密度栅格边长（米）
+        density_shading: 密度栅格着色方式，'eq_hist' 直方图均衡或 'log' 对数色阶
+        flow_bin_minutes: OD流量矩阵的时间段长度（分钟）
+        top_flow_count: 期望线图绘制的最强流向数量
+        """
+        if clip_mode not in ('exact', 'raster'):
+            raise ValueError(f"未知的裁剪方式: {clip_mode}")
+        if density_shading not in ('eq_hist', 'log'):
+            raise ValueError(f"未知的着色方式: {density_shading}")
+        self.clip_mode = clip_mode
+        self.raster_cell_size = raster_cell_size
+        self.density_cell_size = density_cell_size
+        self.density_shading = density_shading
+        self.flow_bin_minutes = flow_bin_minutes
+        self.top_flow_count = top_flow_count
+        
         # 文件路径设置
         self.early_peak_path = "D:\\Desktop\\项目论文\\早高峰碳排放\\早高峰共享单车数据_裁剪后.csv"
         self.late_peak_path = "D:\\Desktop\\项目论文\\早高峰碳排放\\晚高峰共享单车数据_裁剪后.csv"
@@ -27,14 +146,21 @@ class BikeODProcessor:
         # 坐标系定义
         self.wgs84 = pyproj.CRS('EPSG:4326')  # WGS84经纬度坐标系
         self.cgc2000_meter = pyproj.CRS('EPSG:4547')  # CGC2000米制坐标系
+        self.projection_cache = ProjectionCache()  # 源数据旁的投影坐标缓存，重复运行直接读取
         
         # 数据存储
         self.early_peak_data = None
         self.late_peak_data = None
         self.main_city = None
+        self.main_city_mask = None  # 合并后的主城区边界或栅格掩膜，首次裁剪时创建
         self.fishnet = None
+        self.fishnet_index = None  # 渔网格点索引，首次映射时创建
+        self.fishnet_index_error = None  # 渔网不规则时记录原因，避免重复推断
         self.cropped_early_od = None
         self.cropped_late_od = None
+        self.early_flow = None  # 网格 → 网格 OD流量矩阵，映射到渔网后构建
+        self.late_flow = None
+        self.grid_districts = None  # 每个网格中心点所属的主城区名称，首次汇总时计算
     
     def load_data(self):
         """加载所有需要的数据"""
@@ -42,11 +168,11 @@ class BikeODProcessor:
         
         # 加载早晚高峰数据
         print(f"加载早高峰数据: {self.early_peak_path}")
-        self.early_peak_data = pd.read_csv(self.early_peak_path)
+        self.early_peak_data = load_table(self.early_peak_path, ORDER_SCHEMA)
         print(f"早高峰数据加载完成，共{len(self.early_peak_data)}条记录")
         
         print(f"加载晚高峰数据: {self.late_peak_path}")
-        self.late_peak_data = pd.read_csv(self.late_peak_path)
+        self.late_peak_data = load_table(self.late_peak_path, ORDER_SCHEMA)
         print(f"晚高峰数据加载完成，共{len(self.late_peak_data)}条记录")
         
         # 加载西安市主城区矢量图
@@ -59,56 +185,67 @@ class BikeODProcessor:
         self.fishnet = gpd.read_file(self.fishnet_path)
         print(f"渔网数据加载完成，共{len(self.fishnet)}个网格，坐标系: {self.fishnet.crs}")
     
-    def coordinate_transform(self, data):
-        """将WGS84经纬度坐标转换为CGC2000米制坐标"""
+    def coordinate_transform(self, data, source_path=None):
+        """
+        将WGS84经纬度坐标转换为CGC2000米制坐标
+        source_path: 数据来源文件，提供时投影结果缓存在该文件旁，重复运行直接读取缓存
+        """
         print("进行坐标系转换...")
         
-        # 创建转换器
-        transformer = pyproj.Transformer.from_crs(self.wgs84, self.cgc2000_meter, always_xy=True)
-        
         # 转换起点坐标
         print("转换起点坐标...")
-        start_x, start_y = transformer.transform(data['起点经度'].values, data['起点纬度'].values)
+        start_x, start_y = self.projection_cache.transform(
+            data['起点经度'].values, data['起点纬度'].values, source_path,
+            self.wgs84, self.cgc2000_meter, tag='起点')
         data['起点X'] = start_x
         data['起点Y'] = start_y
         
         # 转换终点坐标
         print("转换终点坐标...")
-        end_x, end_y = transformer.transform(data['终点经度'].values, data['终点纬度'].values)
+        end_x, end_y = self.projection_cache.transform(
+            data['终点经度'].values, data['终点纬度'].values, source_path,
+            self.wgs84, self.cgc2000_meter, tag='终点')
         data['终点X'] = end_x
         data['终点Y'] = end_y
         
         return data
     
+    def _get_main_city_mask(self):
+        """合并六个主城区为一个多边形并prepare，按裁剪方式创建判断对象（只创建一次）"""
+        if self.main_city_mask is None:
+            boundary = shapely.union_all(self.main_city.geometry.values)
+            shapely.prepare(boundary)
+            if self.clip_mode == 'raster':
+                print(f"创建主城区栅格掩膜（栅格边长{self.raster_cell_size}米）...")
+                self.main_city_mask = RasterMask(boundary, self.raster_cell_size)
+            else:
+                self.main_city_mask = boundary
+        return self.main_city_mask
+    
+    def _in_main_city(self, x, y):
+        """判断一批坐标是否在主城区内"""
+        mask = self._get_main_city_mask()
+        if isinstance(mask, RasterMask):
+            return mask.contains_xy(x, y)
+        return shapely.contains_xy(mask, np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+    
     def crop_to_main_city(self, data, peak_type):
         """裁剪只保留在西安市主城区内的OD对"""
         print(f"裁剪{peak_type}数据到西安市主城区范围内...")
         
-        # 创建起点和终点的点几何对象
-        start_points = [Point(x, y) for x, y in zip(data['起点X'], data['起点Y'])]
-        end_points = [Point(x, y) for x, y in zip(data['终点X'], data['终点Y'])]
-        
-        # 创建GeoDataFrame
         points_gdf = gpd.GeoDataFrame(
             data, 
-            geometry=start_points, 
+            geometry=gpd.points_from_xy(data['起点X'], data['起点Y']), 
             crs=self.cgc2000_meter
         )
-        points_gdf['终点_几何'] = end_points
+        points_gdf['终点_几何'] = gpd.points_from_xy(data['终点X'], data['终点Y'])
         
-        # 判断起点是否在主城区内
+        # 起终点坐标一次性与合并后的主城区边界比较
         print("判断起点是否在主城区内...")
-        start_in_city = []
-        for point in tqdm(points_gdf.geometry):
-            start_in_city.append(any(self.main_city.contains(point)))
-        points_gdf['起点在主城区'] = start_in_city
+        points_gdf['起点在主城区'] = self._in_main_city(data['起点X'].to_numpy(), data['起点Y'].to_numpy())
         
-        # 判断终点是否在主城区内
         print("判断终点是否在主城区内...")
-        end_in_city = []
-        for point in tqdm(points_gdf['终点_几何']):
-            end_in_city.append(any(self.main_city.contains(point)))
-        points_gdf['终点在主城区'] = end_in_city
+        points_gdf['终点在主城区'] = self._in_main_city(data['终点X'].to_numpy(), data['终点Y'].to_numpy())
         
         # 只保留起点和终点都在主城区内的OD对
         cropped_data = points_gdf[(points_gdf['起点在主城区']) & (points_gdf['终点在主城区'])].copy()
@@ -135,28 +272,19 @@ class BikeODProcessor:
         if 'grid_id' not in self.fishnet.columns:
             self.fishnet['grid_id'] = range(len(self.fishnet))
         
-        # 创建起点和终点的GeoDataFrame用于空间连接
-        start_gdf = gpd.GeoDataFrame(
-            cropped_data[['起点X', '起点Y']],
-            geometry=[Point(x, y) for x, y in zip(cropped_data['起点X'], cropped_data['起点Y'])],
-            crs=self.cgc2000_meter
-        )
+        # 渔网为规则网格（方形或六边形）时用格点索引直接定位，否则回退到空间连接
+        if self.fishnet_index is None and self.fishnet_index_error is None:
+            try:
+                self.fishnet_index = grid_index_from_gdf(self.fishnet, id_col='grid_id')
+            except ValueError as e:
+                self.fishnet_index_error = str(e)
+                print(f"警告: 渔网不是规则网格，使用空间连接映射: {e}")
         
-        end_gdf = gpd.GeoDataFrame(
-            cropped_data[['终点X', '终点Y']],
-            geometry=[Point(x, y) for x, y in zip(cropped_data['终点X'], cropped_data['终点Y'])],
-            crs=self.cgc2000_meter
-        )
-        
-        # 空间连接找到起点所在的网格
         print("查找起点所在网格...")
-        start_with_grid = gpd.sjoin(start_gdf, self.fishnet[['geometry', 'grid_id']], how='left', predicate='within')
-        cropped_data['起点网格ID'] = start_with_grid['grid_id'].values
+        cropped_data['起点网格ID'] = self._locate_grid(cropped_data['起点X'], cropped_data['起点Y'])
         
-        # 空间连接找到终点所在的网格
         print("查找终点所在网格...")
-        end_with_grid = gpd.sjoin(end_gdf, self.fishnet[['geometry', 'grid_id']], how='left', predicate='within')
-        cropped_data['终点网格ID'] = end_with_grid['grid_id'].values
+        cropped_data['终点网格ID'] = self._locate_grid(cropped_data['终点X'], cropped_data['终点Y'])
         
         # 统计网格映射情况
         start_without_grid = cropped_data['起点网格ID'].isna().sum()
@@ -172,48 +300,62 @@ class BikeODProcessor:
         
         return mapped_data
     
+    def _locate_grid(self, x, y):
+        """查找一批坐标所在的网格ID，不在任何网格内时为NaN"""
+        if self.fishnet_index is not None:
+            grid_ids = self.fishnet_index.grid_id(x.to_numpy(), y.to_numpy())
+            return np.where(grid_ids >= 0, grid_ids, np.nan)
+        
+        points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(x, y), crs=self.cgc2000_meter)
+        joined = gpd.sjoin(points, self.fishnet[['geometry', 'grid_id']], how='left', predicate='within')
+        # 点恰好落在相邻网格公共边上时只保留第一个匹配
+        return joined[~joined.index.duplicated()]['grid_id'].values
+    
+    def _draw_density(self, ax, x, y, cmap, alpha=1.0):
+        """将全部点分箱为密度栅格，作为一张图像绘制在渔网和主城区边界之下"""
+        extent = self.main_city.total_bounds
+        cell_size = self.density_cell_size
+        counts = density_raster(x, y, extent, cell_size)
+        image, norm = shade_density(counts, self.density_shading)
+        n_rows, n_cols = counts.shape
+        return ax.imshow(
+            image, origin='lower', cmap=cmap, norm=norm, alpha=alpha, interpolation='nearest', zorder=1,
+            extent=(extent[0], extent[0] + n_cols * cell_size, extent[1], extent[1] + n_rows * cell_size)
+        )
+    
+    def _draw_outlines(self, ax):
+        """在密度栅格之上绘制渔网和西安市主城区边界"""
+        self.fishnet.plot(ax=ax, facecolor='none', edgecolor='lightgray', linewidth=0.5, zorder=2)
+        self.main_city.plot(ax=ax, facecolor='none', edgecolor='black', linewidth=1.5, zorder=3)
+    
+    def _density_label(self):
+        """密度色带的标签"""
+        return '点数（对数色阶）' if self.density_shading == 'log' else '点密度累计分位（直方图均衡）'
+    
     def visualize_od_distribution(self, data, peak_type):
-        """可视化OD对分布"""
+        """可视化OD对分布：全部起终点分箱为密度栅格，无需采样"""
         print(f"生成{peak_type}OD对分布图...")
         
-        # 增加采样数量，显示更多数据点
-        sample_size = min(20000, len(data))  # 增加到20000个采样点
-        sampled_data = data.sample(sample_size, random_state=42)
-        
         # 创建图形
         fig, ax = plt.subplots(1, 1, figsize=(15, 12))
         
-        # 绘制渔网（可选，用于背景）
-        self.fishnet.plot(ax=ax, facecolor='none', edgecolor='lightgray', linewidth=0.5)
-        
-        # 绘制西安市主城区边界
-        self.main_city.plot(ax=ax, facecolor='none', edgecolor='black', linewidth=1.5)
-        
-        # 绘制起点（红色）
-        ax.scatter(
-            sampled_data['起点X'], 
-            sampled_data['起点Y'], 
-            c='red', 
-            s=5,  # 减小点大小以避免重叠
-            alpha=0.3,  # 降低透明度以显示密集区域
-            label=f'起点（采样{len(sampled_data)}个）'
-        )
+        # 起点（红色）、终点（蓝色）密度栅格，由透明渐变到实色后叠加
+        start_cmap = LinearSegmentedColormap.from_list('起点', [(1, 0, 0, 0), (1, 0, 0, 1)])
+        end_cmap = LinearSegmentedColormap.from_list('终点', [(0, 0, 1, 0), (0, 0, 1, 1)])
+        self._draw_density(ax, data['起点X'], data['起点Y'], start_cmap, alpha=0.7)
+        self._draw_density(ax, data['终点X'], data['终点Y'], end_cmap, alpha=0.7)
         
-        # 绘制终点（蓝色）
-        ax.scatter(
-            sampled_data['终点X'], 
-            sampled_data['终点Y'], 
-            c='blue', 
-            s=5,  # 减小点大小以避免重叠
-            alpha=0.3,  # 降低透明度以显示密集区域
-            label=f'终点（采样{len(sampled_data)}个）'
-        )
+        # 渔网和西安市主城区边界
+        self._draw_outlines(ax)
         
         # 设置图表属性
         ax.set_title(f'{peak_type}共享单车OD对分布图（主城区裁剪后）', fontsize=16)
         ax.set_xlabel('X坐标（米）', fontsize=12)
         ax.set_ylabel('Y坐标（米）', fontsize=12)
-        ax.legend(fontsize=12)
+        ax.legend(handles=[
+            Patch(color='red', alpha=0.7, label=f'起点（全部{len(data)}个）'),
+            Patch(color='blue', alpha=0.7, label=f'终点（全部{len(data)}个）'),
+        ], fontsize=12, loc='upper right')
         ax.grid(True, alpha=0.3)
         
         # 保存图表
@@ -223,45 +365,27 @@ class BikeODProcessor:
         plt.close()
     
     def visualize_point_density(self, data, peak_type):
-        """使用核密度估计(KDE)可视化点密度，展示所有点的分布趋势"""
+        """可视化点密度：全部点按固定分辨率分箱为密度栅格，展示所有点的分布趋势"""
         print(f"生成{peak_type}点密度图...")
         
         # 创建图形
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(20, 10))
         
-        # 绘制渔网和主城区边界作为背景
-        self.fishnet.plot(ax=ax1, facecolor='none', edgecolor='lightgray', linewidth=0.5)
-        self.fishnet.plot(ax=ax2, facecolor='none', edgecolor='lightgray', linewidth=0.5)
-        self.main_city.plot(ax=ax1, facecolor='none', edgecolor='black', linewidth=1.5)
-        self.main_city.plot(ax=ax2, facecolor='none', edgecolor='black', linewidth=1.5)
-        
         # 起点密度图
-        h1 = ax1.hexbin(
-            data['起点X'], 
-            data['起点Y'], 
-            gridsize=100, 
-            cmap='Reds', 
-            alpha=0.8, 
-            mincnt=1
-        )
+        h1 = self._draw_density(ax1, data['起点X'], data['起点Y'], 'Reds')
+        self._draw_outlines(ax1)
         ax1.set_title(f'{peak_type}起点密度图（所有{len(data)}个数据点）', fontsize=14)
         ax1.set_xlabel('X坐标（米）', fontsize=10)
         ax1.set_ylabel('Y坐标（米）', fontsize=10)
-        plt.colorbar(h1, ax=ax1, label='点密度')
+        plt.colorbar(h1, ax=ax1, label=self._density_label())
         
         # 终点密度图
-        h2 = ax2.hexbin(
-            data['终点X'], 
-            data['终点Y'], 
-            gridsize=100, 
-            cmap='Blues', 
-            alpha=0.8, 
-            mincnt=1
-        )
+        h2 = self._draw_density(ax2, data['终点X'], data['终点Y'], 'Blues')
+        self._draw_outlines(ax2)
         ax2.set_title(f'{peak_type}终点密度图（所有{len(data)}个数据点）', fontsize=14)
         ax2.set_xlabel('X坐标（米）', fontsize=10)
         ax2.set_ylabel('Y坐标（米）', fontsize=10)
-        plt.colorbar(h2, ax=ax2, label='点密度')
+        plt.colorbar(h2, ax=ax2, label=self._density_label())
         
         plt.tight_layout()
         
@@ -271,23 +395,15 @@ class BikeODProcessor:
         print(f"点密度图已保存至: {output_path}")
         plt.close()
     
-    def visualize_grid_heatmap(self, data, peak_type):
-        """可视化网格热度图"""
+    def visualize_grid_heatmap(self, flow, peak_type):
+        """可视化网格热度图，起终点数量直接取自OD流量矩阵的行列和"""
         print(f"生成{peak_type}网格热度图...")
         
-        # 统计每个网格的起点数量
-        start_grid_counts = data['起点网格ID'].value_counts().reset_index()
-        start_grid_counts.columns = ['grid_id', 'start_count']
-        
-        # 统计每个网格的终点数量
-        end_grid_counts = data['终点网格ID'].value_counts().reset_index()
-        end_grid_counts.columns = ['grid_id', 'end_count']
-        
-        # 合并到渔网数据
+        # 统计每个网格的起点、终点数量
+        start_count, end_count = flow.marginals()
         grid_heatmap = self.fishnet.copy()
-        grid_heatmap = grid_heatmap.merge(start_grid_counts, on='grid_id', how='left')
-        grid_heatmap = grid_heatmap.merge(end_grid_counts, on='grid_id', how='left')
-        grid_heatmap = grid_heatmap.fillna({'start_count': 0, 'end_count': 0})
+        grid_heatmap['start_count'] = start_count
+        grid_heatmap['end_count'] = end_count
         
         # 将渔网数据转换为WGS84经纬度坐标系（EPSG:4326）
         grid_heatmap_wgs84 = grid_heatmap.to_crs(epsg=4326)
@@ -317,6 +433,85 @@ class BikeODProcessor:
         print(f"网格热度图已保存至: {output_path}")
         plt.close()
     
+    def build_flow_matrix(self, data, peak_type):
+        """一次遍历构建网格 → 网格 OD流量矩阵（订单数和总里程，按时间段划分）"""
+        print(f"构建{peak_type}OD流量矩阵...")
+        
+        bin_minutes = self.flow_bin_minutes
+        if '订单开始时间' not in data.columns:
+            print("警告: 数据中没有订单开始时间列，流量矩阵不按时间段划分")
+            bin_minutes = MINUTES_PER_DAY
+        flow = ODFlowMatrix.from_orders(data, self.fishnet['grid_id'].to_numpy(), bin_minutes)
+        
+        counts, _ = flow.window()
+        print(f"  非零流向数: {counts.nnz}")
+        print(f"  计入流量矩阵的订单数: {counts.sum()}")
+        return flow
+    
+    def _get_grid_districts(self):
+        """计算每个网格中心点所属的主城区名称（只计算一次），不在任何主城区内时为None"""
+        if self.grid_districts is None:
+            centroids = self.fishnet.geometry.centroid
+            x, y = centroids.x.to_numpy(), centroids.y.to_numpy()
+            districts = np.full(len(self.fishnet), None, dtype=object)
+            for name, geom in zip(self.main_city['name'], self.main_city.geometry):
+                districts[shapely.contains_xy(geom, x, y) & pd.isna(districts)] = name
+            self.grid_districts = districts
+        return self.grid_districts
+    
+    def summarize_district_flows(self, flow):
+        """按主城区汇总区内和区间流量"""
+        return flow.group_flows(self._get_grid_districts(), missing_label='主城区外')
+    
+    def visualize_od_flows(self, flow, peak_type):
+        """绘制最强流向的期望线图：线宽和颜色表示订单数，起终点为网格中心点"""
+        print(f"生成{peak_type}OD流向期望线图...")
+        
+        top = flow.top_flows(self.top_flow_count, include_intra=False)
+        centroids = self.fishnet.geometry.centroid
+        cx, cy = centroids.x.to_numpy(), centroids.y.to_numpy()
+        # 弱流向先画，强流向叠加在上层
+        top = top.iloc[::-1]
+        o, d = top['起点位置'].to_numpy(), top['终点位置'].to_numpy()
+        segments = np.stack([np.column_stack([cx[o], cy[o]]), np.column_stack([cx[d], cy[d]])], axis=1)
+        values = top['订单数'].to_numpy()
+        
+        fig, ax = plt.subplots(1, 1, figsize=(15, 12))
+        self._draw_outlines(ax)
+        if len(values):
+            lines = LineCollection(
+                segments, array=values, cmap='plasma', zorder=4,
+                linewidths=0.5 + 5.5 * values / values.max(), alpha=0.8, capstyle='round'
+            )
+            ax.add_collection(lines)
+            plt.colorbar(lines, ax=ax, label='订单数')
+        
+        ax.set_title(f'{peak_type}共享单车前{len(values)}条网格间OD流向', fontsize=16)
+        ax.set_xlabel('X坐标（米）', fontsize=12)
+        ax.set_ylabel('Y坐标（米）', fontsize=12)
+        ax.grid(True, alpha=0.3)
+        
+        output_path = os.path.join(self.output_dir, f'{peak_type}OD流向期望线图.png')
+        plt.savefig(output_path, dpi=300, bbox_inches='tight')
+        print(f"期望线图已保存至: {output_path}")
+        plt.close()
+    
+    def save_flow_results(self):
+        """保存OD流量矩阵、前k大流向和主城区流量汇总"""
+        print("保存OD流量分析结果...")
+        
+        for flow, peak_type in [(self.early_flow, "早高峰"), (self.late_flow, "晚高峰")]:
+            matrix_path = os.path.join(self.output_dir, f"{peak_type}OD流量矩阵.npz")
+            flow.save(matrix_path)
+            
+            top_path = os.path.join(self.output_dir, f"{peak_type}前{self.top_flow_count}条OD流向.csv")
+            flow.top_flows(self.top_flow_count).drop(columns=['起点位置', '终点位置']).to_csv(
+                top_path, index=False, encoding='utf-8-sig')
+            
+            district_path = os.path.join(self.output_dir, f"{peak_type}主城区OD流量汇总.csv")
+            self.summarize_district_flows(flow).to_csv(district_path, index=False, encoding='utf-8-sig')
+            print(f"{peak_type}OD流量矩阵已保存至: {matrix_path}")
+    
     def generate_report(self):
         """生成分析报告"""
         print("生成分析报告...")
@@ -366,7 +561,23 @@ class BikeODProcessor:
             f.write("5. 可视化结果\n")
             f.write("-" * 30 + "\n")
             f.write(f"生成的可视化文件保存在: {self.output_dir}\n")
-            f.write("包括: 早晚高峰OD对分布图(裁剪后)和网格热度图\n")
+            f.write("包括: 早晚高峰OD对分布图(裁剪后)、网格热度图和OD流向期望线图\n\n")
+            
+            f.write("6. OD流向分析\n")
+            f.write("-" * 30 + "\n")
+            for flow, peak_type in [(self.early_flow, "早高峰"), (self.late_flow, "晚高峰")]:
+                counts, _ = flow.window()
+                district_flows = self.summarize_district_flows(flow)
+                intra = district_flows.loc[district_flows['是否区内'], '订单数'].sum()
+                total = max(district_flows['订单数'].sum(), 1)
+                f.write(f"{peak_type}非零网格流向数: {counts.nnz}\n")
+                f.write(f"{peak_type}同网格内出行占比: {counts.diagonal().sum() / total * 100:.2f}%\n")
+                f.write(f"{peak_type}主城区区内出行占比: {intra / total * 100:.2f}%\n")
+                f.write(f"{peak_type}前10条网格间流向:\n")
+                for _, row in flow.top_flows(10, include_intra=False).iterrows():
+                    f.write(f"  {int(row['起点网格ID'])} -> {int(row['终点网格ID'])}: "
+                            f"{row['订单数']}单, 平均里程{row['平均里程']:.0f}米\n")
+                f.write("\n")
         
         print(f"分析报告已保存至: {report_path}")
     
@@ -376,14 +587,20 @@ class BikeODProcessor:
         
         # 保存早高峰裁剪后数据
         early_output_path = os.path.join(self.output_dir, "早高峰共享单车数据_裁剪后.csv")
-        self.cropped_early_od.to_csv(early_output_path, index=False, encoding='utf-8')
+        self._save_od_table(self.cropped_early_od, early_output_path)
         print(f"早高峰裁剪后数据已保存至: {early_output_path}")
         
         # 保存晚高峰裁剪后数据
         late_output_path = os.path.join(self.output_dir, "晚高峰共享单车数据_裁剪后.csv")
-        self.cropped_late_od.to_csv(late_output_path, index=False, encoding='utf-8')
+        self._save_od_table(self.cropped_late_od, late_output_path)
         print(f"晚高峰裁剪后数据已保存至: {late_output_path}")
     
+    def _save_od_table(self, data, csv_path):
+        """导出CSV，并保存同名Parquet供后续读取（几何列可由起终点坐标重建，不写入Parquet）"""
+        data.to_csv(csv_path, index=False, encoding='utf-8')
+        attributes = pd.DataFrame(data.drop(columns=['geometry', '终点_几何'], errors='ignore'))
+        save_table(attributes, csv_path, ORDER_SCHEMA)
+    
     def process(self):
         """主处理流程"""
         print("开始处理共享单车OD数据...")
@@ -393,10 +610,10 @@ class BikeODProcessor:
         
         # 2. 坐标转换
         print("\n处理早高峰数据:")
-        self.early_peak_data = self.coordinate_transform(self.early_peak_data)
+        self.early_peak_data = self.coordinate_transform(self.early_peak_data, self.early_peak_path)
         
         print("\n处理晚高峰数据:")
-        self.late_peak_data = self.coordinate_transform(self.late_peak_data)
+        self.late_peak_data = self.coordinate_transform(self.late_peak_data, self.late_peak_path)
         
         # 3. 裁剪到主城区
         self.cropped_early_od = self.crop_to_main_city(self.early_peak_data, "早高峰")
@@ -406,9 +623,13 @@ class BikeODProcessor:
         self.cropped_early_od = self.map_to_fishnet(self.cropped_early_od, "早高峰")
         self.cropped_late_od = self.map_to_fishnet(self.cropped_late_od, "晚高峰")
         
-        # 5. 可视化 - 增加更多可视化方式
+        # 5. 构建网格 → 网格 OD流量矩阵
+        self.early_flow = self.build_flow_matrix(self.cropped_early_od, "早高峰")
+        self.late_flow = self.build_flow_matrix(self.cropped_late_od, "晚高峰")
+        
+        # 6. 可视化 - 增加更多可视化方式
         print("\n生成可视化结果:")
-        # 增加采样数量的散点图
+        # 起终点密度栅格（全部OD对分箱，无需采样）
         self.visualize_od_distribution(self.cropped_early_od, "早高峰")
         self.visualize_od_distribution(self.cropped_late_od, "晚高峰")
         
@@ -417,18 +638,23 @@ class BikeODProcessor:
         self.visualize_point_density(self.cropped_late_od, "晚高峰")
         
         # 网格热度图
-        self.visualize_grid_heatmap(self.cropped_early_od, "早高峰")
-        self.visualize_grid_heatmap(self.cropped_late_od, "晚高峰")
+        self.visualize_grid_heatmap(self.early_flow, "早高峰")
+        self.visualize_grid_heatmap(self.late_flow, "晚高峰")
+        
+        # OD流向期望线图
+        self.visualize_od_flows(self.early_flow, "早高峰")
+        self.visualize_od_flows(self.late_flow, "晚高峰")
         
-        # 6. 保存数据和报告
+        # 7. 保存数据和报告
         self.save_cropped_data()
+        self.save_flow_results()
         self.generate_report()
         
         print("\n所有处理完成！")
         print(f"\n映射统计：")
         print(f"- 早高峰成功映射{len(self.cropped_early_od)}个OD对到渔网")
         print(f"- 晚高峰成功映射{len(self.cropped_late_od)}个OD对到渔网")
-        print(f"- 所有订单都已处理并映射，可视化时进行了采样以提高可读性")
+        print("- 所有订单都已处理并映射，可视化使用全部数据")
 
 if __name__ == "__main__":
     processor = BikeODProcessor()
@@ -1,5 +1,8 @@
-import pandas as pd
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '2_栅格网络数据聚集', '网格内里程汇总'))
+from columnar_dataset import MODEL_INPUT_SCHEMA, load_table, save_table
 
 # 设置文件路径
 input_dir = 'd:/Desktop/项目论文/建模'
@@ -16,7 +19,7 @@ def process_data(file_name):
     input_path = os.path.join(input_dir, file_name)
     
     # 读取数据
-    df = pd.read_csv(input_path, encoding='utf-8')
+    df = load_table(input_path, MODEL_INPUT_SCHEMA)
     print(f"读取文件 {file_name}，原始列数：{len(df.columns)}")
     print(f"原始列名：{list(df.columns)}")
     
@@ -29,7 +32,7 @@ def process_data(file_name):
     # 保存处理后的数据
     output_file_name = f"优化后_{file_name}"
     output_path = os.path.join(output_dir, output_file_name)
-    df_cleaned.to_csv(output_path, index=False, encoding='utf-8')
+    df_cleaned = save_table(df_cleaned, output_path, MODEL_INPUT_SCHEMA, export_csv=True, csv_encoding='utf-8')
     print(f"保存优化后的数据到：{output_path}")
     
     return df_cleaned
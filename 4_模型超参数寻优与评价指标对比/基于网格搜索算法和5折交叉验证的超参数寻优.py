@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
 from sklearn.model_selection import train_test_split, GridSearchCV
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.linear_model import LinearRegression
@@ -9,6 +10,9 @@ from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '2_栅格网络数据聚集', '网格内里程汇总'))
+from columnar_dataset import MODEL_INPUT_SCHEMA, load_table
+
 # 设置中文字体
 import matplotlib.pyplot as plt
 plt.rcParams['font.sans-serif'] = ['SimHei']
@@ -25,8 +29,8 @@ def load_data():
     morning_data_path = 'D:/Desktop/项目论文/建模/特征工程/优化后_早高峰_标准化_utf8.csv'
     evening_data_path = 'D:/Desktop/项目论文/建模/特征工程/优化后_晚高峰_标准化_utf8.csv'
     
-    morning_df = pd.read_csv(morning_data_path)
-    evening_df = pd.read_csv(evening_data_path)
+    morning_df = load_table(morning_data_path, MODEL_INPUT_SCHEMA)
+    evening_df = load_table(evening_data_path, MODEL_INPUT_SCHEMA)
     
     # 处理晚高峰数据中的多余空列（与早高峰数据保持一致的列）
     evening_df = evening_df[morning_df.columns]
@@ -1,5 +1,9 @@
 import pandas as pd
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '2_栅格网络数据聚集', '网格内里程汇总'))
+from columnar_dataset import ORDER_SCHEMA, read_csv_typed, save_table, write_hour_partitions
 
 # 原始数据文件路径
 input_file = r'D:\Desktop\项目文件\低碳项目\西安市网约车、出租车、共享单车一周运营里程数据\Chuzucheqingxi\共享单车数据_精确\共享单车数据_清洗后_8月8日_精确.csv'
@@ -7,11 +11,13 @@ input_file = r'D:\Desktop\项目文件\低碳项目\西安市网约车、出租
 # 输出数据文件路径
 output_dir = r'D:\Desktop\项目论文\全天时段订单趋势分析'
 output_file = os.path.join(output_dir, '共享单车数据_8月8日_清洗完成.csv')
+# 按 (日期, 小时) 分区的订单目录，任意时间窗口只读取涉及的分区
+order_store_dir = os.path.join(output_dir, '共享单车数据_8月8日_按小时分区')
 
 print(f"开始读取原始数据文件: {input_file}")
 
-# 读取CSV文件
-df = pd.read_csv(input_file, encoding='utf-8')
+# 按订单数据模式读取CSV文件，时间列在读取时直接解析
+df = read_csv_typed(input_file, ORDER_SCHEMA, encoding='utf-8')
 
 print(f"原始数据总行数: {len(df)}")
 print(f"数据列名: {df.columns.tolist()}")
@@ -20,10 +26,6 @@ print(f"数据列名: {df.columns.tolist()}")
 if '订单开始时间' not in df.columns or '订单结束时间' not in df.columns:
     raise ValueError("数据中缺少必要的时间列：'订单开始时间'或'订单结束时间'")
 
-# 转换时间列为datetime格式
-df['订单开始时间'] = pd.to_datetime(df['订单开始时间'])
-df['订单结束时间'] = pd.to_datetime(df['订单结束时间'])
-
 print("时间列转换完成")
 
 # 1. 删除起止时间都不是8月8日的订单
@@ -54,7 +56,11 @@ print(f"删除订单时间大于50分钟的订单后，剩余行数: {len(df)}")
 # 确保输出目录存在
 os.makedirs(output_dir, exist_ok=True)
 
-# 保存处理后的DataFrame
-df.to_csv(output_file, index=False, encoding='utf-8')
+# 保存处理后的DataFrame（同名Parquet供后续分析读取，同时导出CSV）
+df = save_table(df, output_file, ORDER_SCHEMA, export_csv=True, csv_encoding='utf-8')
 print(f"处理完成，数据已保存到: {output_file}")
 print(f"清洗后数据总行数: {len(df)}")
+
+# 按订单开始时间的日期和小时分区保存
+partitioned_count = write_hour_partitions(df, order_store_dir)
+print(f"按小时分区的订单数据已保存到: {order_store_dir}，共{partitioned_count}条")
@@ -2,8 +2,12 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import sys
 from matplotlib.font_manager import FontProperties
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '2_栅格网络数据聚集', '网格内里程汇总'))
+from columnar_dataset import ORDER_SCHEMA, hourly_counts, load_table
+
 # 设置字体
 from matplotlib.font_manager import FontProperties
 # 创建字体对象
@@ -15,30 +19,36 @@ plt.rcParams['axes.unicode_minus'] = False  # 用来正常显示负号
 
 # 数据文件路径
 input_file = r'D:\Desktop\项目论文\全天时段订单趋势分析\共享单车数据_8月8日_清洗完成.csv'
+# 按小时分区的订单目录（clean_sharing_bike_data.py 生成）
+order_store_dir = r'D:\Desktop\项目论文\全天时段订单趋势分析\共享单车数据_8月8日_按小时分区'
 
 # 输出目录
 output_dir = r'D:\Desktop\项目论文\灰白图'
 
-print(f"开始读取清洗后的数据文件: {input_file}")
-
-# 读取CSV文件
-df = pd.read_csv(input_file, encoding='utf-8')
-
-print(f"清洗后数据总行数: {len(df)}")
-print(f"数据列名: {df.columns.tolist()}")
-
-# 转换时间列为datetime格式
-df['订单开始时间'] = pd.to_datetime(df['订单开始时间'])
-df['订单结束时间'] = pd.to_datetime(df['订单结束时间'])
-
-print("时间列转换完成")
-
-# 按照小时统计订单总量
-# 提取订单开始时间的小时部分
-df['开始小时'] = df['订单开始时间'].dt.hour
-
-# 按小时分组统计订单数量
-hourly_orders = df.groupby('开始小时').size().reset_index(name='订单数量')
+if os.path.isdir(order_store_dir):
+    # 每个分区的订单数直接取自Parquet元数据，无需读取订单
+    print(f"开始读取按小时分区的订单数据: {order_store_dir}")
+    partition_counts = hourly_counts(order_store_dir)
+    print(f"清洗后数据总行数: {partition_counts.sum()}")
+    
+    # 按小时（不区分日期）汇总订单数量
+    hourly_orders = (partition_counts.groupby(partition_counts.index.hour).sum()
+                     .rename_axis('开始小时').reset_index(name='订单数量'))
+else:
+    print(f"开始读取清洗后的数据文件: {input_file}")
+    
+    # 只读取订单开始时间列（存在同名Parquet时直接读取，时间列无需重新解析）
+    df = load_table(input_file, ORDER_SCHEMA, columns=['订单开始时间'])
+    
+    print(f"清洗后数据总行数: {len(df)}")
+    print(f"数据列名: {df.columns.tolist()}")
+    
+    # 按照小时统计订单总量
+    # 提取订单开始时间的小时部分
+    df['开始小时'] = df['订单开始时间'].dt.hour
+    
+    # 按小时分组统计订单数量
+    hourly_orders = df.groupby('开始小时').size().reset_index(name='订单数量')
 
 # 确保所有小时都有数据（0-23小时）
 all_hours = pd.DataFrame({'开始小时': range(24)})
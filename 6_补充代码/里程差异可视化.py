@@ -1,14 +1,17 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
-import geopandas as gpd
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '2_栅格网络数据聚集', '网格内里程汇总'))
+from grid_result_export import load_period_layer
 
 # 设置中文字体
 plt.rcParams['font.sans-serif'] = ['SimHei']
 plt.rcParams['axes.unicode_minus'] = False
 
 # 确保输出目录存在
-import os
 output_dir = "d:\Desktop\项目论文"
 os.makedirs(output_dir, exist_ok=True)
 
@@ -48,11 +51,11 @@ except Exception as e:
 
 # 2. 生成网格里程热力图
 try:
-    # 读取网格Shapefile数据
-    grid_shapefile_path = r"d:\Desktop\项目论文\网格轨迹段汇总\晚高峰_grid_trajectory_stats.shp"
+    # 读取渔网几何图层并连接晚高峰属性表
+    grid_gpkg_path = r"d:\Desktop\项目论文\网格轨迹段汇总\grid_trajectory_stats.gpkg"
     
-    if os.path.exists(grid_shapefile_path):
-        grid_gdf = gpd.read_file(grid_shapefile_path)
+    if os.path.exists(grid_gpkg_path):
+        grid_gdf = load_period_layer(grid_gpkg_path, '晚高峰')
         
         # 绘制里程热力图
         fig, ax = plt.subplots(figsize=(15, 10))
@@ -67,8 +70,8 @@ try:
         
         print(f"✅ 网格里程热力图已保存至: {heatmap_path}")
     else:
-        print("❌ 找不到网格Shapefile文件，跳过热力图生成")
-        print(f"   预期文件路径: {grid_shapefile_path}")
+        print("❌ 找不到网格GeoPackage文件，跳过热力图生成")
+        print(f"   预期文件路径: {grid_gpkg_path}")
         
 except Exception as e:
     print(f"❌ 生成热力图时出错: {e}")